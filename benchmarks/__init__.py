@@ -0,0 +1,18 @@
+# benchmarks/__init__.py
+"""
+Benchmarks for the check_source hot path (not tests: nothing here runs
+under the test runner).
+
+  python manage.py benchmark                    # compare with benchmarks/baseline.json
+  python manage.py benchmark --update-baseline  # after an intended change
+  python manage.py benchmark --sizes 10k 100k --stages parse analyze
+
+The corpus is in corpus.py. A full run (10k..5m, all stages) takes about
+20 minutes; --sizes / --stages narrow it. Timings are machine-dependent,
+so baseline.json is not committed (.gitignore): record it with
+--update-baseline on the machine that enforces it, and keep it there.
+
+The check_source stage writes to the configured database: a throwaway
+user and sources, deleted with their CheckRuns afterwards. Captures and
+metrics are switched off while it runs.
+"""
@@ -0,0 +1,153 @@
+# benchmarks/corpus.py
+"""
+Benchmark corpus for the detection pipeline (manage.py benchmark).
+
+Synthetic pages are generated, not stored: the same CORPUS_VERSION always
+produces the same bytes (seeded RNG), so a 5 MB page costs nothing in git
+and a baseline stays comparable as long as the version is unchanged. Bump
+CORPUS_VERSION whenever a generator changes; the stored baseline records
+each page's sha256 and the benchmark refuses to compare different bytes.
+
+Kinds (shapes check_source actually sees):
+  gmail    Gmail-like inbox table: tr.zA rows, unread ones tr.zA.zE
+  badges   badge-heavy SPA: nav badges, aria-labels, big inline JSON state
+  list     plain server-rendered list of messages (ul/li/a)
+
+Recorded pages are real snapshots saved as benchmarks/recorded/<name>.html
+(strip personal data first); each is benchmarked as-is under "recorded-<name>".
+"""
+import hashlib
+import json
+import os
+import random
+from typing import Dict, List
+
+CORPUS_VERSION = 1
+
+KINDS = ("gmail", "badges", "list")
+
+# label -> target size in bytes (pages stop at the first item past the target)
+SIZES = {"10k": 10 * 1024, "100k": 100 * 1024, "1m": 1024 * 1024, "5m": 5 * 1024 * 1024}
+
+RECORDED_DIR = os.path.join(os.path.dirname(__file__), "recorded")
+
+_WORDS = (
+    "invoice order delivery update project review message meeting request "
+    "client design payment approved revision draft feedback question offer "
+    "schedule report account security reminder weekly summary ticket reply"
+).split()
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize()
+
+
+def _fill(head: str, tail: str, target: int, item) -> str:
+    parts, size, i = [head], len(head) + len(tail), 0
+    while size < target:
+        chunk = item(i)
+        parts.append(chunk)
+        size += len(chunk)
+        i += 1
+    parts.append(tail)
+    return "".join(parts)
+
+
+def gmail_page(target: int, rng: random.Random) -> str:
+    unread = rng.randint(3, 40)
+    head = (
+        f"<!DOCTYPE html><html><head><title>({unread}) Inbox - someone@gmail.com - Gmail</title>"
+        "<style>.zA{cursor:pointer}.zE{font-weight:bold}</style></head><body>"
+        '<div role="navigation"><a href="#inbox" aria-label="Inbox ' + str(unread) + ' unread">Inbox</a>'
+        f'<span class="bsU">{unread}</span></div>'
+        '<div role="main"><table class="F cf zt"><tbody>'
+    )
+    tail = "</tbody></table></div><script>var GM_STATE={};</script></body></html>"
+
+    def row(i):
+        cls = "zA zE" if i < unread else "zA yO"
+        return (
+            f'<tr class="{cls}" id=":{i:x}" role="row">'
+            f'<td class="oZ-x3"><div role="checkbox" aria-checked="false"></div></td>'
+            f'<td class="yX xY"><span class="yP" email="sender{i}@example.com">Sender {i}</span></td>'
+            f'<td class="xY a4W"><span class="bog">{_sentence(rng, 6)}</span>'
+            f'<span class="y2"> - {_sentence(rng, 18)}</span></td>'
+            f'<td class="xW xY"><span title="Mon, Oct {1 + i % 28}">Oct {1 + i % 28}</span></td></tr>'
+        )
+    return _fill(head, tail, target, row)
+
+
+def badges_page(target: int, rng: random.Random) -> str:
+    n = rng.randint(1, 99)
+    state = {"user": {"id": 1, "name": "someone"}, "unread": n,
+             "feed": [{"id": i, "text": _sentence(rng, 12)} for i in range(40)]}
+    head = (
+        "<!DOCTYPE html><html><head><title>Dashboard</title>"
+        f"<script>window.__STATE__={json.dumps(state)}</script></head><body><div id=\"app\">"
+        '<nav class="topbar">'
+        f'<a href="/notifications" aria-label="Notifications, {n} unread"><i class="icon-bell"></i>'
+        f'<span class="badge badge-count">{n}</span></a>'
+        f'<a href="/messages" class="nav-link">Messages <span class="counter" data-count="{n % 7}">{n % 7}</span></a>'
+        "</nav><main>"
+    )
+    tail = "</main></div><script>hydrate(window.__STATE__)</script></body></html>"
+
+    def card(i):
+        return (
+            f'<div class="card" data-id="{i}"><div class="card-header">'
+            f'<span class="pill">{i % 10}</span><span class="author">User {i}</span></div>'
+            f'<div class="card-body"><p>{_sentence(rng, 20)}</p>'
+            f'<button aria-label="Like {i % 50}" class="btn">{i % 50}</button></div>'
+            + (f'<script type="application/json">{{"card":{i},"seen":{str(i % 3 == 0).lower()}}}</script>' if i % 5 == 0 else "")
+            + "</div>"
+        )
+    return _fill(head, tail, target, card)
+
+
+def list_page(target: int, rng: random.Random) -> str:
+    head = (
+        "<!DOCTYPE html><html><head><title>Inbox</title></head><body>"
+        "<h1>Inbox</h1><p>Your messages</p><ul class=\"inbox\">"
+    )
+    tail = "</ul><footer>Messages are kept for 90 days.</footer></body></html>"
+
+    def item(i):
+        return (
+            f'<li class="message"><a href="/inbox/{i}">{_sentence(rng, 5)}</a> '
+            f"<span>{_sentence(rng, 14)}</span></li>"
+        )
+    return _fill(head, tail, target, item)
+
+
+_GENERATORS = {"gmail": gmail_page, "badges": badges_page, "list": list_page}
+
+
+def page_url(kind: str) -> str:
+    # analyze() has a Gmail-only fallback keyed on the URL
+    return "https://mail.google.com/mail/u/0/" if kind == "gmail" else f"https://example.com/{kind}"
+
+
+def synthetic(kind: str, size: str) -> str:
+    rng = random.Random(f"{CORPUS_VERSION}:{kind}:{size}")
+    return _GENERATORS[kind](SIZES[size], rng)
+
+
+def pages(kinds=KINDS, sizes=tuple(SIZES), recorded: bool = True) -> List[Dict]:
+    """[{"name", "kind", "size", "url", "html", "bytes", "sha256"}], synthetic first."""
+    out = []
+    for kind in kinds:
+        for size in sizes:
+            out.append({"name": f"{kind}-{size}", "kind": kind, "size": size,
+                        "url": page_url(kind), "html": synthetic(kind, size)})
+    if recorded and os.path.isdir(RECORDED_DIR):
+        for fname in sorted(os.listdir(RECORDED_DIR)):
+            if fname.endswith(".html"):
+                with open(os.path.join(RECORDED_DIR, fname), encoding="utf-8", errors="replace") as f:
+                    html = f.read()
+                out.append({"name": f"recorded-{fname[:-5]}", "kind": "recorded", "size": "",
+                            "url": "https://example.com/recorded", "html": html})
+    for p in out:
+        raw = p["html"].encode("utf-8")
+        p["bytes"] = len(raw)
+        p["sha256"] = hashlib.sha256(raw).hexdigest()
+    return out
@@ -0,0 +1,215 @@
+# benchmarks/fakesite.py
+"""
+Local stand-in for the sites users monitor, for end-to-end checker runs
+without touching the internet (manage.py checker_load starts one).
+
+  python -m benchmarks.fakesite --port 8790
+
+Django-free and stateless apart from counters and rate-limit buckets: every
+behaviour is chosen per URL, so each NotificationSource gets its own site:
+
+  GET /inbox/<n>?t0=<epoch>&every=<s>   unread count 1 + (now - t0) // every, shown
+                                        as "(N) Inbox" in the title and a nav badge
+      &latency_ms=<ms>&jitter_ms=<ms>   delay before answering
+      &size=<bytes>                     pad the page with message rows (default 20000)
+      &validators=1                     ETag + Last-Modified, 304 on a match
+      &rate=<req/s>                     token bucket per page; over it -> 429 + Retry-After
+      &redirect=<k>                     k 302 hops before the page
+      &cookie=<name>                    needs cookie <name>=ok-<n>, else 302 -> /login
+      &js=1                             count only rendered by a script (Playwright mode)
+  GET /login                            a login form (no count)
+  GET /_stats                           {"requests", "status": {code: count}, "started_at"}
+  POST /_reset                          zero the counters
+
+The count only depends on t0/every and the clock, so a harness knows when
+each value appeared: change_time(count) = t0 + (count - 1) * every.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+DEFAULT_SIZE = 20000
+MAX_COUNT = 999  # detectors read at most three digits
+
+
+def unread_count(t0: float, every: float, now: float = None) -> int:
+    now = time.time() if now is None else now
+    return min(MAX_COUNT, 1 + max(0, int((now - t0) // every)))
+
+
+def change_time(t0: float, every: float, count: int) -> float:
+    """When the page started showing `count`."""
+    return t0 + (count - 1) * every
+
+
+def inbox_html(n: int, count: int, size: int = DEFAULT_SIZE, js: bool = False) -> str:
+    if js:
+        head = (
+            "<!DOCTYPE html><html><head><title>Inbox</title></head><body>"
+            '<nav><a href="/inbox">Inbox</a> <span id="badge" class="badge"></span></nav>'
+            f"<script>setTimeout(function(){{document.title='({count}) Inbox';"
+            f"document.getElementById('badge').textContent='{count}';}}, 50);</script>"
+        )
+    else:
+        head = (
+            f"<!DOCTYPE html><html><head><title>({count}) Inbox</title></head><body>"
+            f'<nav><a href="/inbox" aria-label="Inbox, {count} unread">Inbox</a> '
+            f'<span class="badge">{count}</span></nav>'
+        )
+    parts, total, i = [head, '<ul class="messages">'], len(head), 0
+    while total < size:
+        row = (f'<li class="message"><a href="/inbox/{n}/m/{i}">Message {i} from sender {i % 17}</a> '
+               f"<span>Re: order update and delivery details for project {i}</span></li>")
+        parts.append(row)
+        total += len(row)
+        i += 1
+    parts.append("</ul></body></html>")
+    return "".join(parts)
+
+
+class Site:
+    """Counters + per-page token buckets shared by all handler threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.status = Counter()
+        self.buckets = {}
+
+    def count(self, code: int):
+        with self.lock:
+            self.status[code] += 1
+
+    def allow(self, key: str, rate: float) -> bool:
+        """Token bucket of `rate` tokens/s and burst 1."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (1.0, now))
+            tokens = min(1.0, tokens + (now - last) * rate)
+            ok = tokens >= 1.0
+            self.buckets[key] = (tokens - 1.0 if ok else tokens, now)
+            return ok
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"requests": sum(self.status.values()),
+                    "status": {str(k): v for k, v in sorted(self.status.items())},
+                    "started_at": self.started_at}
+
+    def reset(self):
+        with self.lock:
+            self.status.clear()
+            self.buckets.clear()
+
+
+def make_handler(site: Site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, body=b"", content_type="text/html; charset=utf-8", headers=None):
+            self.send_response(code)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            if code != 304:
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if code != 304 and self.command != "HEAD":
+                self.wfile.write(body)
+            site.count(code)
+
+        def do_POST(self):
+            if self.path == "/_reset":
+                site.reset()
+                return self._send(200, b'{"ok": true}', "application/json")
+            self._send(405)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/_stats":
+                return self._send(200, json.dumps(site.stats()).encode(), "application/json")
+            if url.path == "/login":
+                return self._send(200, b"<html><head><title>Sign in</title></head><body>"
+                                       b"<form method=post><input name=user><input name=pw type=password>"
+                                       b"</form></body></html>")
+            parts = url.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "inbox" or not parts[1].isdigit():
+                return self._send(404, b"not found")
+            n = int(parts[1])
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                t0 = float(q.get("t0", site.started_at))
+                every = max(0.1, float(q.get("every", 30)))
+                latency = float(q.get("latency_ms", 0)) + random.uniform(0, float(q.get("jitter_ms", 0)))
+                size = int(q.get("size", DEFAULT_SIZE))
+                rate = float(q.get("rate", 0))
+                hops = int(q.get("redirect", 0))
+            except ValueError:
+                return self._send(400, b"bad parameter")
+
+            if latency > 0:
+                time.sleep(latency / 1000)
+
+            if rate > 0 and not site.allow(url.path, rate):
+                return self._send(429, b"slow down", headers={"Retry-After": str(max(1, math.ceil(1 / rate)))})
+
+            if hops > 0:
+                q["redirect"] = str(hops - 1)
+                return self._send(302, headers={"Location": f"{url.path}?{urlencode(q)}"})
+
+            cookie_name = q.get("cookie")
+            if cookie_name:
+                jar = dict(c.strip().split("=", 1) for c in self.headers.get("Cookie", "").split(";") if "=" in c)
+                if jar.get(cookie_name) != f"ok-{n}":
+                    return self._send(302, headers={"Location": "/login?" + urlencode({"next": self.path})})
+
+            count = unread_count(t0, every)
+            headers = {"Cache-Control": "private, no-cache"}
+            if q.get("validators") == "1":
+                changed = change_time(t0, every, count)
+                etag = f'"{n}-{count}"'
+                headers["ETag"] = etag
+                headers["Last-Modified"] = formatdate(changed, usegmt=True)
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, headers=headers)
+                since = self.headers.get("If-Modified-Since")
+                if since and not self.headers.get("If-None-Match"):
+                    try:
+                        if parsedate_to_datetime(since).timestamp() >= int(changed):
+                            return self._send(304, headers=headers)
+                    except (TypeError, ValueError):
+                        pass
+            body = inbox_html(n, count, size=size, js=q.get("js") == "1").encode("utf-8")
+            self._send(200, body, headers=headers)
+
+        do_HEAD = do_GET
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local fake inbox site for checker load tests.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8790)
+    args = ap.parse_args()
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(Site()))
+    httpd.daemon_threads = True
+    print(f"fake site on http://{args.host}:{httpd.server_port}/", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 # desktop_client/app.py
-import os, time, json, threading, requests, tkinter as tk
+import os, re, time, json, queue, random, hashlib, threading, requests, tkinter as tk
+import importlib.util
+from email.utils import parsedate_to_datetime
 from urllib.parse import urljoin
 from django.views.decorators.csrf import csrf_exempt
 
@@ -7,39 +9,275 @@ BASE_URL = os.getenv("WN_BASE_URL", "http://127.0.0.1:8000/")
 API_KEY  = os.getenv("WN_API_KEY", "")
 APP_NAME = os.getenv("WN_APP_NAME", "WebNotify")
 POLL_SEC = int(os.getenv("WN_POLL_SEC", "10"))
-
-ACTIVE_URL = urljoin(BASE_URL, "api/active_notification/")
-MARK_URL   = urljoin(BASE_URL, "api/mark_notifications_read/")
+CACHE_DIR = os.getenv("WN_CACHE_DIR") or os.path.join(os.path.dirname(__file__), "_ringtones")
+KEEP_RINGTONES = int(os.getenv("WN_KEEP_RINGTONES", "5"))
+MAX_BACKOFF_SEC = int(os.getenv("WN_MAX_BACKOFF_SEC", "300"))
+RESYNC_SEC = int(os.getenv("WN_RESYNC_SEC", "300"))  # safety sync while the push stream is live
+
+# edge mode: render this user's rendered sources here instead of on the server
+EDGE = os.getenv("WN_EDGE", "").lower() in ("1", "true", "yes")
+DETECTION_PATH = os.getenv("WN_DETECTION_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "webnotify", "detection.py")
+# the per-user profile link_source.py logs in with
+PROFILE_DIR = os.getenv("WN_PROFILE_DIR") or os.path.join(
+    os.path.dirname(__file__), ".profiles", hashlib.sha256(API_KEY.encode("utf-8")).hexdigest()[:16])
+
+SYNC_URL   = urljoin(BASE_URL, "api/sync/")
 SOUND_URL  = urljoin(BASE_URL, "api/sound/")
-
-SETTINGS_KEY_URL = urljoin(BASE_URL, "api/settings_key/")
+STREAM_URL = urljoin(BASE_URL, "api/notifications/stream/")
+EDGE_ASSIGN_URL  = urljoin(BASE_URL, "api/edge/assignments/")
+EDGE_RESULTS_URL = urljoin(BASE_URL, "api/edge/results/")
 
 import pygame
+pygame.mixer.pre_init(44100, -16, 2, 512)  # small buffer: low start latency
 pygame.mixer.init()
 
 def log(msg):
     print(f"[client] {msg}", flush=True)
 
-def fetch_json(url):
-    headers = {"Authorization": f"ApiKey {API_KEY}"} if API_KEY else {}
-    r = requests.get(url, headers=headers, timeout=20)
+class AudioEngine:
+    """
+    Ringtone playback from a decoded, in-memory pygame Sound.
+
+    preload() decodes the file once, off the UI thread, whenever the
+    ringtone changes. ring() then starts it immediately on a mixer channel.
+    The mixer loops it until the popup is dismissed (stop()), as the client
+    always has. Volume comes from UserSettings.volume (0-100).
+    stop() silences the channel; nothing polls while it rings.
+    """
+
+    KEEP = 2  # decoded sounds kept (current + previous/local)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sounds = {}      # path -> pygame.mixer.Sound, most recent last
+        self.volume = 0.8
+        self.channel = None
+
+    def configure(self, settings):
+        with self.lock:
+            self.volume = min(max(int(settings.get("volume", 80)), 0), 100) / 100.0
+            if self.channel is not None:
+                self.channel.set_volume(self.volume)
+
+    def preload(self, path):
+        with self.lock:
+            sound = self.sounds.pop(path, None)
+        if sound is None:
+            try:
+                sound = pygame.mixer.Sound(path)
+            except Exception as e:
+                log(f"audio decode failed for {path}: {e}")
+                return None
+        with self.lock:
+            self.sounds[path] = sound
+            while len(self.sounds) > self.KEEP:
+                self.sounds.pop(next(iter(self.sounds)))
+        return sound
+
+    def ring(self, path):
+        """Start ringing (non-blocking); returns False if nothing could be played."""
+        sound = self.sounds.get(path) or self.preload(path)
+        if sound is None:
+            return False
+        with self.lock:
+            self._stop()
+            self.channel = sound.play(loops=-1)
+            if self.channel is None:
+                return False
+            self.channel.set_volume(self.volume)
+        log(f"ringing until dismissed, volume {int(self.volume * 100)}%")
+        return True
+
+    def stop(self):
+        with self.lock:
+            self._stop()
+
+    def _stop(self):
+        if self.channel is not None:
+            try:
+                self.channel.stop()
+            except Exception:
+                pass
+            self.channel = None
+
+audio = AudioEngine()
+
+def new_session():
+    """Keep-alive session: one TCP/TLS connection reused across polls."""
+    s = requests.Session()
+    if API_KEY:
+        s.headers["Authorization"] = f"ApiKey {API_KEY}"
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+# main loop only; the ringtone prefetch thread has its own (Session isn't thread-safe)
+SESSION = new_session()
+
+def sync(cursor=None, ack=None):
+    """
+    One round trip per poll: new notifications since `cursor`, settings when
+    they changed, and the acks of what we showed last time (piggybacked).
+    """
+    payload = {"cursor": cursor}
+    if ack:
+        payload["ack"] = ack
+    r = SESSION.post(SYNC_URL, json=payload, timeout=20)
     r.raise_for_status()
     return r.json()
 
-def post_json(url):
-    headers = {"Authorization": f"ApiKey {API_KEY}"} if API_KEY else {}
-    r = requests.post(url, headers=headers, timeout=20)
-    r.raise_for_status()
-    return r.json() if r.content else {}
+def jittered(seconds, spread=0.1):
+    """seconds +/- spread, so clients started together drift apart."""
+    return max(0.0, seconds * random.uniform(1 - spread, 1 + spread))
 
-def download_sound(path):
-    headers = {"Authorization": f"ApiKey {API_KEY}"} if API_KEY else {}
-    r = requests.get(SOUND_URL, headers=headers, timeout=20)
-    r.raise_for_status()
-    with open(path, "wb") as f:
-        f.write(r.content)
-    return path
+def retry_after(exc):
+    """Seconds from a 429/503 Retry-After header (delta or HTTP date), else None."""
+    resp = getattr(exc, "response", None)
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class Backoff:
+    """Exponential backoff with full jitter (random in [base, min(cap, base * 2^n)])."""
+
+    def __init__(self, base, cap):
+        self.base, self.cap, self.failures = base, cap, 0
+
+    def reset(self):
+        self.failures = 0
+
+    def next(self):
+        self.failures += 1
+        ceiling = min(self.cap, self.base * 2 ** min(self.failures, 16))
+        return random.uniform(self.base, max(self.base, ceiling))
+
+class RingtoneCache:
+    """
+    Content-addressed ringtone cache: CACHE_DIR/<sha256>.<ext>.
+
+    The server's ringtone ETag is the file's sha256, so the settings from
+    /api/sync/ (default_ringtone_etag) name the file we need. prefetch()
+    fetches it in the background when the settings change, and path() is
+    what an alert plays from, with no network. When the server has no
+    default ringtone (no etag), refresh() revalidates the last one with
+    If-None-Match. current.json remembers it across restarts, so offline
+    alerts still ring.
+    """
+
+    _SHA_RE = re.compile(r'^(?:W/)?"?([0-9a-f]{64})"?$')
 
+    def __init__(self, directory, on_ready=None):
+        self.dir = directory
+        self.on_ready = on_ready  # called (prefetch thread) with the path once it is cached
+        self.lock = threading.Lock()
+        self.wanted = None   # etag the settings ask for (None: server's fallback)
+        self.current = {}    # {"etag", "sha", "ext"} of the last good fetch
+        self.http = None     # own keep-alive session, created on first fetch
+        os.makedirs(self.dir, exist_ok=True)
+        try:
+            with open(os.path.join(self.dir, "current.json")) as f:
+                self.current = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _file(self, sha, ext=""):
+        return os.path.join(self.dir, sha + ext)
+
+    def _find(self, sha):
+        for name in os.listdir(self.dir):
+            if name.split(".", 1)[0] == sha:
+                return os.path.join(self.dir, name)
+        return None
+
+    def path(self):
+        """Local file for the wanted ringtone, or None if it is not cached (yet)."""
+        m = self._SHA_RE.match(self.wanted or "")
+        if m:
+            return self._find(m.group(1))
+        if self.current.get("sha"):
+            return self._find(self.current["sha"])
+        return None
+
+    def prefetch(self, etag):
+        self.wanted = etag
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            path = self.refresh()
+        except Exception as e:
+            log(f"ringtone prefetch failed: {e}")
+            path = self.path()
+        if path and self.on_ready:
+            self.on_ready(path)
+
+    def refresh(self):
+        """Make path() current: conditional GET of /api/sound/ into the cache."""
+        with self.lock:
+            if self._SHA_RE.match(self.wanted or "") and self.path():
+                return self.path()
+            if self.http is None:
+                self.http = new_session()
+            headers = {}
+            if self.current.get("etag") and self.path():
+                headers["If-None-Match"] = self.current["etag"]
+            with self.http.get(SOUND_URL, headers=headers, timeout=20, stream=True) as r:
+                if r.status_code in (204, 404):  # 204 from older servers
+                    log("no ringtone set on the server")
+                    return None
+                r.raise_for_status()
+                if r.status_code == 304:
+                    return self.path()
+                ext = os.path.splitext(r.url)[1] or _EXTENSIONS.get(
+                    r.headers.get("Content-Type", "").split(";")[0], ".bin")
+                sha = self._download(r, ext)
+            etag = r.headers.get("ETag") or f'"{sha}"'
+            m = self._SHA_RE.match(etag)
+            if m and m.group(1) != sha:
+                os.remove(self._file(sha, ext))
+                raise RuntimeError("ringtone download corrupted (hash mismatch)")
+            self.current = {"etag": etag, "sha": sha, "ext": ext}
+            with open(os.path.join(self.dir, "current.json"), "w") as f:
+                json.dump(self.current, f)
+            self._prune()
+            log(f"cached ringtone {sha[:12]}")
+            return self._file(sha, ext)
+
+    def _download(self, r, ext):
+        digest = hashlib.sha256()
+        tmp = os.path.join(self.dir, f".part-{threading.get_ident()}")
+        with open(tmp, "wb") as f:
+            for chunk in r.iter_content(64 * 1024):
+                digest.update(chunk)
+                f.write(chunk)
+        sha = digest.hexdigest()
+        os.replace(tmp, self._file(sha, ext))
+        return sha
+
+    def _prune(self):
+        files = [os.path.join(self.dir, n) for n in os.listdir(self.dir)
+                 if not n.startswith(".") and n != "current.json"]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for old in files[KEEP_RINGTONES:]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+_EXTENSIONS = {"audio/mpeg": ".mp3", "audio/wav": ".wav", "audio/x-wav": ".wav", "audio/ogg": ".ogg"}
+
+ringtones = RingtoneCache(CACHE_DIR, on_ready=lambda path: audio.preload(local_ringtone() or path))
 
 
 def show_native_popup(title_text, message_text, stop_event):
@@ -58,8 +296,8 @@ def show_native_popup(title_text, message_text, stop_event):
         except Exception:
             pass
 
-    # Size like a Windows dialog and center it
-    W, H = 440, 240
+    # Size like a Windows dialog (taller for a multi-line batch) and center it
+    W, H = 440, 240 + 20 * min(max(message_text.count("\n") - 2, 0), 10)
     sw = root.winfo_screenwidth()
     sh = root.winfo_screenheight()
     x = int((sw - W) / 2)
@@ -104,10 +342,7 @@ def show_native_popup(title_text, message_text, stop_event):
 
     def do_close():
         stop_event.set()
-        try:
-            pygame.mixer.music.stop()
-        except Exception:
-            pass
+        audio.stop()
         root.destroy()
 
     close_btn = tk.Button(btn_row, text="Close (Esc)",
@@ -155,10 +390,7 @@ def show_fullscreen(title_text, message_text, stop_event):
 
     def do_close():
         stop_event.set()
-        try:
-            pygame.mixer.music.stop()
-        except Exception:
-            pass
+        audio.stop()
         root.destroy()
 
     close_btn = tk.Button(
@@ -171,139 +403,356 @@ def show_fullscreen(title_text, message_text, stop_event):
     root.protocol("WM_DELETE_WINDOW", do_close)
     root.mainloop()
 
-def play_sound_loop(sound_path, stop_event, times=None):
-    try:
-        loop_forever = (times is None)
-        played = 0
-        while loop_forever or played < max(0, int(times)):
-            if stop_event.is_set():
-                break
-            log(f"playing sound ({'∞' if loop_forever else f'{played+1}/{times}'})")
-            pygame.mixer.music.load(sound_path)
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy():
-                if stop_event.is_set():
-                    pygame.mixer.music.stop()
-                    break
-                pygame.time.wait(100)
-            played += 1
-        pygame.mixer.music.stop()
-    except Exception as e:
-        log(f"audio error: {e}")
-
-
-def run_once():
-    data = fetch_json(ACTIVE_URL)  # expects {"has": bool, ...}
-    if not data.get("has"):
-        log("no new notification")
-        return False
-
-    # Build texts
-    title_text   = f"You have a message from {data.get('source_name') or APP_NAME}"
-    message_text = data.get("title") or data.get("message") or "New activity detected"
-    ring_count   = int(data.get("ring_count", 1))  # kept for future use if needed
-
-    # 1) MARK AS READ **BEFORE** SHOWING to prevent re-pops on the next poll
-    try:
-        post_json(MARK_URL)
-        log("marked notification(s) read to avoid re-trigger")
-    except Exception as e:
-        log(f"mark-read pre-show failed (will still show): {e}")
-
-    # 2) pick ringtone: prefer local test.wav, else test.mp3, else server ringtone
+def local_ringtone():
+    """test.wav / test.mp3 next to this file override the server ringtone."""
     dir_here = os.path.dirname(__file__)
-    wav_path = os.path.join(dir_here, "test.wav")
-    mp3_path = os.path.join(dir_here, "test.mp3")
-    sound_path = None
-
-    if os.path.exists(wav_path):
-        sound_path = wav_path
-        log(f"using local ringtone: {sound_path}")
-    elif os.path.exists(mp3_path):
-        sound_path = mp3_path
-        log(f"using local ringtone: {sound_path}")
-    else:
-        temp = os.path.join(dir_here, "_ringtone.bin")
+    for name in ("test.wav", "test.mp3"):
+        path = os.path.join(dir_here, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+MAX_POPUP_LINES = 8
+
+def popup_texts(batch):
+    """Title + body for one popup covering every notification in `batch` (newest first)."""
+    if len(batch) == 1:
+        data = batch[0]
+        return (f"You have a message from {data.get('source_name') or APP_NAME}",
+                data.get("title") or data.get("message") or "New activity detected")
+    sources = {n.get("source_name") or APP_NAME for n in batch}
+    title_text = (f"{len(batch)} new messages from {sources.pop()}" if len(sources) == 1
+                  else f"{len(batch)} new messages from {len(sources)} sources")
+    lines = []
+    for n in batch[:MAX_POPUP_LINES]:
+        text = n.get("title") or n.get("message") or "New activity detected"
+        lines.append(f"\u2022 {n.get('source_name') or APP_NAME}: {text}")
+    if len(batch) > MAX_POPUP_LINES:
+        lines.append(f"\u2026 and {len(batch) - MAX_POPUP_LINES} more")
+    return title_text, "\n".join(lines)
+
+
+def run_once(batch):
+    """One popup + one ringtone for a batch of notification rows (blocks until closed)."""
+    batch = sorted(batch, key=lambda n: n["id"], reverse=True)
+    title_text, message_text = popup_texts(batch)
+
+    # 1) pick ringtone: local test.wav / test.mp3, else the cached server ringtone
+    sound_path = local_ringtone() or ringtones.path()
+    if sound_path is None:
+        # nothing prefetched yet (first alert after install): fetch now
         try:
-            download_sound(temp)
-            sound_path = temp
-            log("downloaded ringtone from server")
+            sound_path = ringtones.refresh()
         except Exception as e:
             log(f"download sound failed: {e}")
-            sound_path = None
-
-    # 3) create a stop flag shared between popup and audio thread
-    stop_event = threading.Event()
 
-    # 4) Start audio loop: INFINITE until the popup is closed
-    if sound_path:
-        threading.Thread(
-            target=play_sound_loop,
-            args=(sound_path, stop_event, None),  # None => infinite loop until stop_event is set
-            daemon=True
-        ).start()
-    else:
+    # 2) start ringing (decoded already by the prefetch; the mixer loops it)
+    if not (sound_path and audio.ring(sound_path)):
         log("no sound file available; skipping audio")
 
-    # 5) block the loop with a fullscreen window until *you* close it
+    # 3) block this (UI) thread with the popup until *you* close it
+    stop_event = threading.Event()
     show_native_popup(title_text, message_text, stop_event)
 
-    # 6) safety: ensure audio is stopped after window closes
-    stop_event.set()
-    try:
-        pygame.mixer.music.stop()
-    except Exception:
-        pass
+    # 4) safety: ensure audio is stopped after window closes
+    audio.stop()
 
     return True
 
 
-def main():
-    log(f"BASE_URL={BASE_URL}")
-    log(f"APP_NAME={APP_NAME}")
-    if not API_KEY or API_KEY.strip().startswith("<PASTE"):
-        log("ERROR: Set WN_API_KEY to a REAL user API key.")
-        return
+class StreamListener(threading.Thread):
+    """
+    Keeps the server's push stream (SSE) open and sets `wake` on every
+    event. The data itself is still read through /api/sync/, so the cursor
+    and acks stay in one place. `live` is False while the stream is
+    unavailable (WSGI server, push down, proxy in the way); the Syncer
+    then falls back to interval polling.
+    """
 
-    paused_logged = None  # track last pause state to avoid spam
-    while True:
-        try:
-            st = fetch_settings()
-            allow = bool(st.get("play_in_background", True))
-            if not allow:
+    UNAVAILABLE = (404, 405, 501, 503)
+
+    def __init__(self, wake):
+        super().__init__(name="wn-stream", daemon=True)
+        self.wake = wake
+        self.live = False
+        self.http = new_session()
+
+    def run(self):
+        backoff = Backoff(2, MAX_BACKOFF_SEC)
+        while True:
+            retry = None
+            try:
+                # read timeout well above the server's 15s heartbeat
+                with self.http.get(STREAM_URL, stream=True, timeout=(10, 60),
+                                   headers={"Accept": "text/event-stream"}) as r:
+                    if r.status_code in self.UNAVAILABLE:
+                        retry = RESYNC_SEC  # not offered here; look again later
+                        raise RuntimeError(f"push stream unavailable ({r.status_code})")
+                    r.raise_for_status()
+                    self.live = True
+                    backoff.reset()
+                    self.wake.set()  # catch up on anything missed while disconnected
+                    for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                        if line and line.startswith("event:"):
+                            self.wake.set()
+            except Exception as e:
+                if self.live or retry:
+                    log(f"push stream: {e}")
+            if self.live:
+                # the server recycles streams every few minutes: reconnect right away
+                self.live = False
+                self.wake.set()
+                time.sleep(jittered(1.0, 0.5))
+            else:
+                time.sleep(jittered(retry) if retry else backoff.next())
+
+
+class Syncer(threading.Thread):
+    """
+    Owns the /api/sync/ cursor. It queues new notifications for the UI
+    thread, sends back acks and follows settings / pause. It syncs whenever
+    `wake` is set (a stream event, an ack to send). Otherwise it syncs
+    every poll interval, or every RESYNC_SEC while the stream is live.
+    """
+
+    def __init__(self, alerts, stream):
+        super().__init__(name="wn-sync", daemon=True)
+        self.alerts = alerts
+        self.stream = stream
+        self.wake = stream.wake
+        self._lock = threading.Lock()
+        self._acks = set()
+
+    def ack(self, ids):
+        """
+        Called from the UI thread with exactly the ids it showed. They go out
+        with the next sync, which starts right away. Anything that arrived
+        meanwhile stays unacknowledged and is shown next.
+        """
+        with self._lock:
+            self._acks.update(ids)
+        self.wake.set()
+
+    def _take_ack(self):
+        with self._lock:
+            ids, self._acks = sorted(self._acks), set()
+        return {"ids": ids, "played": True} if ids else None
+
+    def _give_back(self, ack):
+        if ack:
+            self.ack(ack["ids"])
+
+    def run(self):
+        cursor = None         # opaque, from the last sync
+        settings = {}         # last settings the server sent (only sent when changed)
+        paused_cursor = None  # where to pick up again once un-paused
+        paused_logged = None  # track last pause state to avoid spam
+        backoff = Backoff(POLL_SEC, MAX_BACKOFF_SEC)
+        while True:
+            self.wake.clear()
+            ack = self._take_ack()
+            try:
+                js = sync(cursor, ack)
+            except requests.RequestException as e:
+                self._give_back(ack)
+                delay = backoff.next()
+                hint = retry_after(e)
+                if hint is not None:
+                    delay = max(delay, hint)
+                log(f"poll error: {e} (retrying in {delay:.0f}s)")
+                time.sleep(delay)
+                continue
+            except Exception as e:
+                self._give_back(ack)
+                log(f"poll error: {e}")
+                time.sleep(backoff.next())
+                continue
+            backoff.reset()
+
+            if js.get("settings") is not None:
+                settings = js["settings"]
+                audio.configure(settings)
+                ringtones.prefetch(settings.get("default_ringtone_etag"))
+            delay = js.get("poll_after", POLL_SEC)
+            if not bool(settings.get("play_in_background", True)):
                 if paused_logged is not True:
                     log("paused by server setting (play_in_background = false)")
                     paused_logged = True
-                time.sleep(max(POLL_SEC, 10))
-                continue
+                    paused_cursor = cursor or ""
+                cursor = js.get("cursor")
+                delay = max(POLL_SEC, 10)
             else:
                 if paused_logged is not False:
                     log("resumed (play_in_background = true)")
-                    paused_logged = False
+                    was_paused, paused_logged = paused_logged, False
+                    if was_paused:
+                        # re-read what arrived while paused
+                        cursor, paused_cursor = paused_cursor or None, None
+                        continue
+                cursor = js.get("cursor")
+                notifications = js.get("notifications") or []
+                if notifications:
+                    self.alerts.put(notifications)
 
-            changed = run_once()
-        except Exception as e:
-            log(f"poll error: {e}")
-        time.sleep(POLL_SEC)
+            if delay:
+                self.wake.wait(jittered(RESYNC_SEC if self.stream.live else delay))
 
 
+def load_detection():
+    """The server's webnotify/detection.py, loaded by file path (no Django here)."""
+    spec = importlib.util.spec_from_file_location("wn_detection", DETECTION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
-#
 
-def fetch_settings():
+class EdgeChecker(threading.Thread):
     """
-    Reads settings via ?key=APIKEY:
-      /api/settings_key/?key=...
-    Returns dict or {}.
+    Edge mode (WN_EDGE=1). Renders this user's rendered sources on the
+    local logged-in profile (PROFILE_DIR, the one link_source.py uses),
+    running the server's own detection code. Only compact results go back:
+    count, text hash and new item keys, one request per round. While
+    results keep coming, the server leases the sources to us and skips its
+    own render (webnotify/edge.py).
     """
-    try:
-        r = requests.get(SETTINGS_KEY_URL, params={"key": API_KEY}, timeout=15)
+
+    def __init__(self):
+        super().__init__(name="wn-edge", daemon=True)
+        self.http = new_session()
+        self.detection = None
+        self.sources = {}      # id -> assignment from the server
+        self.due = {}          # id -> monotonic time of the next check
+        self.keys = {}         # id -> item key hashes seen last time
+        self.assign_at = 0.0
+
+    def run(self):
+        try:
+            self.detection = load_detection()
+        except Exception as e:
+            log(f"edge mode off: cannot load {DETECTION_PATH}: {e}")
+            return
+        log(f"edge mode on (profile {PROFILE_DIR})")
+        backoff = Backoff(30, MAX_BACKOFF_SEC)
+        while True:
+            try:
+                if time.monotonic() >= self.assign_at:
+                    self.assign()
+                results = [self.check(self.sources[sid]) for sid in self.due_ids()]
+                if results:
+                    self.report(results)
+                backoff.reset()
+                delay = self.next_delay()
+            except requests.RequestException as e:
+                delay = backoff.next()
+                hint = retry_after(e)
+                if hint is not None:
+                    delay = max(delay, hint)
+                log(f"edge error: {e} (retrying in {delay:.0f}s)")
+            except Exception as e:
+                delay = backoff.next()
+                log(f"edge error: {e}")
+            time.sleep(delay)
+
+    def assign(self):
+        r = self.http.get(EDGE_ASSIGN_URL, timeout=20)
         r.raise_for_status()
         js = r.json()
-        if js.get("ok") and "settings" in js:
-            return js["settings"]
-    except Exception as e:
-        log(f"settings fetch error: {e}")
-    return {}
+        now = time.monotonic()
+        self.sources = {s["id"]: s for s in js.get("sources") or []}
+        for sid, src in self.sources.items():
+            # newcomers start staggered within their first interval
+            self.due.setdefault(sid, now + random.uniform(0, min(src["interval"], 10)))
+        for sid in list(self.due):
+            if sid not in self.sources:
+                self.due.pop(sid, None)
+                self.keys.pop(sid, None)
+        self.assign_at = now + jittered(js.get("refresh_after") or 60)
+
+    def due_ids(self):
+        now = time.monotonic()
+        return [sid for sid, at in sorted(self.due.items(), key=lambda kv: kv[1]) if at <= now]
+
+    def next_delay(self):
+        until = min(self.due.values(), default=self.assign_at)
+        return min(max(1.0, min(until, self.assign_at) - time.monotonic()), 60.0)
+
+    def check(self, src):
+        """Render + analyze one source; returns its compact result."""
+        sid = src["id"]
+        self.due[sid] = time.monotonic() + jittered(src["interval"])
+        opts = dict(src.get("render") or {})
+        short_ms = int(opts.pop("short_render_ms", 400))
+        long_ms = int(opts.pop("render_timeout_ms", 3000))
+        t0 = time.monotonic()
+        try:
+            short_html, long_html = self.detection.render_snapshots(
+                src["url"], cookies={}, user_data_dir=PROFILE_DIR,
+                short_ms=short_ms, long_ms=long_ms, **opts)
+        except Exception as e:
+            log(f"edge render failed for source {sid}: {e}")
+            short_html = long_html = ""
+        render_ms = int((time.monotonic() - t0) * 1000)
+        html = long_html or short_html
+        if not html:
+            return {"source_id": sid, "ok": False, "render_ms": render_ms}
+
+        t0 = time.monotonic()
+        res = self.detection.analyze(html, src["url"], with_keys=True)
+        keys = {hashlib.sha1(k.encode("utf-8")).hexdigest()[:16] for k in res.pop("item_keys")}
+        prev = self.keys.get(sid)
+        self.keys[sid] = keys
+        return {
+            "source_id": sid, "ok": True,
+            "count": res["count"], "detector": res["detector"], "text_hash": res["text_hash"],
+            "keywords": res["keywords"], "preview": res["preview"],
+            "new_keys": sorted(keys - prev)[:50] if prev is not None else [],
+            "render_ms": render_ms, "parse_ms": int((time.monotonic() - t0) * 1000),
+            "bytes": len(html),
+        }
+
+    def report(self, results):
+        r = self.http.post(EDGE_RESULTS_URL, json={"results": results}, timeout=20)
+        r.raise_for_status()
+        for item in r.json().get("results") or []:
+            if item.get("outcome") == "not_assigned":
+                self.assign_at = 0.0  # our list is stale
+            elif item.get("outcome") == "notified":
+                log(f"edge: source {item['source_id']} changed")
+
+
+def main():
+    log(f"BASE_URL={BASE_URL}")
+    log(f"APP_NAME={APP_NAME}")
+    if not API_KEY or API_KEY.strip().startswith("<PASTE"):
+        log("ERROR: Set WN_API_KEY to a REAL user API key.")
+        return
+
+    # spread a fleet that starts together (login, office power-on) over one poll interval
+    time.sleep(random.uniform(0, POLL_SEC))
+
+    alerts = queue.Queue()
+    stream = StreamListener(threading.Event())
+    syncer = Syncer(alerts, stream)
+    stream.start()
+    syncer.start()
+    if EDGE:
+        EdgeChecker().start()
+
+    # UI thread (Tk wants the main thread): everything queued goes into one popup
+    while True:
+        try:
+            batch = alerts.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        while True:
+            try:
+                batch += alerts.get_nowait()
+            except queue.Empty:
+                break
+        run_once(batch)
+        syncer.ack([n["id"] for n in batch])
 
 
+if __name__ == "__main__":
+    main()
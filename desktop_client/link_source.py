@@ -1,4 +1,6 @@
+import gzip
 import hashlib
+import random
 import os, sys, json, time, argparse, requests, tempfile
 from playwright.sync_api import sync_playwright, Error as PWError, TimeoutError as PWTimeout
 from urllib.parse import urljoin, urlparse
@@ -10,6 +12,11 @@ API_KEY  = os.getenv("WN_API_KEY", "")
 
 CREATE_URL  = urljoin(BASE_URL, "api/source/create_key/")
 COOKIES_URL = urljoin(BASE_URL, "api/source/import_cookies_key/")
+BULK_URL    = urljoin(BASE_URL, "api/source/bulk_key/")
+DELTA_URL   = urljoin(BASE_URL, "api/source/cookies_delta_key/")
+
+# --refresh: seconds between passes over the persistent profile
+REFRESH_SEC = float(os.getenv("WN_COOKIE_REFRESH_SEC", "1800"))
 
 def log(*a):
     print("[link]", *a, flush=True)
@@ -21,6 +28,83 @@ os.makedirs(PROFILE_ROOT, exist_ok=True)
 USER_PROFILE_DIR = os.path.join(
     PROFILE_ROOT, hashlib.sha256(API_KEY.encode("utf-8")).hexdigest()[:16]
 )
+# what --refresh last uploaded per root domain, so it only sends the difference
+REFRESH_STATE = USER_PROFILE_DIR + ".uploaded.json"
+
+BROWSER_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--no-first-run", "--no-default-browser-check",
+    "--disable-dev-shm-usage", "--disable-gpu",
+    "--disable-renderer-backgrounding",
+    "--disable-features=IsolateOrigins,site-per-process",
+    "--password-store=basic", "--force-color-profile=srgb",
+]
+
+DESKTOP_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+)
+
+
+def launch_ctx(pw, user_profile, channel, headless=False):
+    ctx = pw.chromium.launch_persistent_context(
+        user_data_dir=user_profile,
+        headless=headless,
+        channel=channel,                 # "chrome", "msedge", or None for bundled
+        args=BROWSER_ARGS,
+        viewport={"width": 1280, "height": 800},
+    )
+    # Mild anti-detection
+    ctx.add_init_script("""() => {
+      Object.defineProperty(navigator,'webdriver',{get:()=>undefined});
+      Object.defineProperty(navigator,'language',{get:()=> 'en-US'});
+      Object.defineProperty(navigator,'languages',{get:()=> ['en-US','en']});
+      const orig = WebGLRenderingContext.prototype.getParameter;
+      WebGLRenderingContext.prototype.getParameter = function(p) {
+        if (p === 37445) return 'Intel Inc.';             // UNMASKED_VENDOR_WEBGL
+        if (p === 37446) return 'Intel(R) UHD Graphics';  // UNMASKED_RENDERER_WEBGL
+        return orig.call(this, p);
+      };
+    }""")
+    return ctx
+
+
+def open_ctx(pw, user_profile, headless=False):
+    """Persistent context on Chrome → Edge → bundled Chromium, whichever launches."""
+    for channel in ("chrome", "msedge", None):
+        try:
+            return launch_ctx(pw, user_profile, channel, headless=headless)
+        except Exception:
+            pass
+    raise RuntimeError("Could not launch Chrome/Edge/Chromium")
+
+
+def root_domain(host: str) -> str:
+    """www.fiverr.com -> fiverr.com (same rule as get_cookies_for_domain)."""
+    parts = (host or "").lstrip(".").split(":", 1)[0].lower().split(".")
+    return ".".join(parts[1:]) if len(parts) > 2 else ".".join(parts)
+
+
+def on_domain(cookie_domain: str, domain: str) -> bool:
+    """True if a cookie for `cookie_domain` belongs to `domain` or one of its subdomains (not notfiverr.com)."""
+    host = (cookie_domain or "").lstrip(".").lower()
+    return host == domain or host.endswith("." + domain)
+
+
+def read_cookies_from_ctx(ctx, domain: str = None) -> dict:
+    """{name: value} from the context; only cookies of `domain` (a root domain) if given."""
+    state = ctx.storage_state()
+    jar = {}
+    for c in (state or {}).get("cookies", []):
+        if domain and not on_domain(c.get("domain"), domain):
+            continue
+        # Keep it simple for server: name -> value map
+        name = c.get("name")
+        val  = c.get("value")
+        if name is not None and val is not None:
+            jar[str(name)] = str(val)
+    return jar
+
 
 def get_cookies_with_playwright(login_url: str, fresh: bool = False, profile_dir: str = None) -> dict:
     """
@@ -53,66 +137,12 @@ def get_cookies_with_playwright(login_url: str, fresh: bool = False, profile_dir
             user_profile = os.path.join(root, user_hash)
             os.makedirs(user_profile, exist_ok=True)
 
-    def launch_ctx(pw, channel):
-        args = [
-            "--disable-blink-features=AutomationControlled",
-            "--no-first-run", "--no-default-browser-check",
-            "--disable-dev-shm-usage", "--disable-gpu",
-            "--disable-renderer-backgrounding",
-            "--disable-features=IsolateOrigins,site-per-process",
-            "--password-store=basic", "--force-color-profile=srgb",
-        ]
-        ctx = pw.chromium.launch_persistent_context(
-            user_data_dir=user_profile,
-            headless=False,
-            channel=channel,                 # "chrome", "msedge", or None for bundled
-            args=args,
-            viewport={"width": 1280, "height": 800},
-        )
-        # Mild anti-detection
-        ctx.add_init_script("""() => {
-          Object.defineProperty(navigator,'webdriver',{get:()=>undefined});
-          Object.defineProperty(navigator,'language',{get:()=> 'en-US'});
-          Object.defineProperty(navigator,'languages',{get:()=> ['en-US','en']});
-          const orig = WebGLRenderingContext.prototype.getParameter;
-          WebGLRenderingContext.prototype.getParameter = function(p) {
-            if (p === 37445) return 'Intel Inc.';             // UNMASKED_VENDOR_WEBGL
-            if (p === 37446) return 'Intel(R) UHD Graphics';  // UNMASKED_RENDERER_WEBGL
-            return orig.call(this, p);
-          };
-        }""")
-        return ctx
-
-    def read_cookies_from_ctx(ctx) -> dict:
-        state = ctx.storage_state()
-        jar = {}
-        for c in (state or {}).get("cookies", []):
-            # Keep it simple for server: name -> value map
-            name = c.get("name")
-            val  = c.get("value")
-            if name is not None and val is not None:
-                jar[str(name)] = str(val)
-        return jar
-
     with sync_playwright() as pw:
-        ctx = None
-        for channel in ("chrome", "msedge", None):
-            try:
-                ctx = launch_ctx(pw, channel)
-                break
-            except Exception:
-                ctx = None
-        if ctx is None:
-            raise RuntimeError("Could not launch Chrome/Edge/Chromium")
+        ctx = open_ctx(pw, user_profile)
 
         page = ctx.new_page()
         try:
-            page.set_extra_http_headers({
-                "User-Agent": (
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                    "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-                )
-            })
+            page.set_extra_http_headers({"User-Agent": DESKTOP_UA})
         except PWError:
             pass
 
@@ -148,12 +178,10 @@ def get_cookies_with_playwright(login_url: str, fresh: bool = False, profile_dir
                 ctx.close()
             except Exception:
                 pass
-            for channel in ("chrome", "msedge", None):
-                try:
-                    ctx = launch_ctx(pw, channel)
-                    break
-                except Exception:
-                    ctx = None
+            try:
+                ctx = open_ctx(pw, user_profile)
+            except RuntimeError:
+                ctx = None
             if ctx:
                 try:
                     jar = read_cookies_from_ctx(ctx)
@@ -227,7 +255,7 @@ def get_cookies_for_domain(domain: str) -> dict:
                 jar = getter()  # all cookies
                 tried.append(f"{getter.__name__}(ALL)")
                 for c in jar:
-                    if getattr(c, "domain", None) and parent in c.domain.lower():
+                    if getattr(c, "domain", None) and on_domain(c.domain, parent):
                         cookies[c.name] = c.value
             except Exception:
                 pass
@@ -236,21 +264,251 @@ def get_cookies_for_domain(domain: str) -> dict:
     return cookies
 
 
+def capture_domains(login_urls: dict, fresh: bool = False) -> dict:
+    """
+    One visible browser for many sites: opens each domain's login page in
+    turn on the same persistent profile, waits for you to log in, and keeps
+    that domain's cookies. {root_domain: login_url} -> {root_domain: cookies}
+    """
+    import shutil
+
+    user_profile = tempfile.mkdtemp(prefix="wn_profile_") if fresh else USER_PROFILE_DIR
+    os.makedirs(user_profile, exist_ok=True)
+    jars = {}
+    with sync_playwright() as pw:
+        ctx = open_ctx(pw, user_profile)
+        try:
+            for i, (domain, url) in enumerate(login_urls.items(), 1):
+                page = ctx.new_page()
+                try:
+                    page.set_extra_http_headers({"User-Agent": DESKTOP_UA})
+                    page.goto(url, wait_until="domcontentloaded", timeout=90_000)
+                except (PWError, PWTimeout):
+                    log(f"{domain}: initial load timed out; you can still log in in that tab.")
+                input(f"[link] ({i}/{len(login_urls)}) Log in to {domain} in the browser "
+                      f"(skip if already logged in), then press ENTER… ")
+                try:
+                    jars[domain] = read_cookies_from_ctx(ctx, domain)
+                except PWError:
+                    jars[domain] = {}
+                log(f"{domain}: captured {len(jars[domain])} cookies")
+                try:
+                    page.close()
+                except PWError:
+                    pass
+        finally:
+            try:
+                ctx.close()
+            except Exception:
+                pass
+    if fresh:
+        shutil.rmtree(user_profile, ignore_errors=True)
+    return jars
+
+
+def load_manifest(path: str) -> list:
+    """
+    JSON list (or {"sources": [...]}) of
+      {"name": "Fiverr", "url": "https://www.fiverr.com/inbox",
+       "rendered": false, "login_url": "https://www.fiverr.com/login"}
+    ("check_url" is accepted for "url"; rendered/login_url are optional).
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("sources") if isinstance(data, dict) else data
+    out = []
+    for i, e in enumerate(entries or []):
+        url = e.get("url") or e.get("check_url")
+        if not e.get("name") or not url:
+            raise SystemExit(f"manifest entry {i}: name and url required")
+        out.append({**e, "url": url})
+    return out
+
+
+def link_manifest(entries: list, login: bool = False, fresh: bool = False) -> list:
+    """
+    Bulk onboarding: one login per domain in a single browser session, then
+    one request to /api/source/bulk_key/ creating every source with its
+    domain's cookies (re-running updates them instead).
+    """
+    by_domain = {}
+    for e in entries:
+        by_domain.setdefault(root_domain(urlparse(e["url"]).hostname), []).append(e)
+    log(f"{len(entries)} sources on {len(by_domain)} domains")
+
+    cookies = {}
+    if not login:
+        for domain, group in by_domain.items():
+            jar = get_cookies_for_domain(urlparse(group[0]["url"]).hostname)
+            if jar:
+                cookies[domain] = jar
+                log(f"{domain}: {len(jar)} cookies from local browser store")
+    pending = {d: g[0].get("login_url") or g[0]["url"] for d, g in by_domain.items() if d not in cookies}
+    if pending:
+        cookies.update(capture_domains(pending, fresh=fresh))
+
+    sources = []
+    for e in entries:
+        item = {"name": e["name"], "check_url": e["url"],
+                "cookies": cookies.get(root_domain(urlparse(e["url"]).hostname)) or {}}
+        if "rendered" in e:
+            item["rendered"] = bool(e["rendered"])
+        sources.append(item)
+    headers = {"Authorization": f"ApiKey {API_KEY}"}
+    r = requests.post(BULK_URL, headers=headers, json={"sources": sources}, timeout=60)
+    if r.status_code != 200:
+        print("[link] bulk link failed:", r.status_code, r.text, file=sys.stderr)
+        r.raise_for_status()
+    linked = r.json()["sources"]
+    for src in linked:
+        log(f"{'created' if src['created'] else 'updated'} source {src['id']}: {src['name']} ({src['check_url']})")
+    return linked
+
+
+def cookies_by_domain(ctx, domains) -> dict:
+    """{root_domain: {name: value}} for each of `domains`, from one storage_state() read."""
+    jars = {d: {} for d in domains}
+    for c in (ctx.storage_state() or {}).get("cookies", []):
+        name, val = c.get("name"), c.get("value")
+        if name is None or val is None:
+            continue
+        for d in jars:
+            if on_domain(c.get("domain"), d):
+                jars[d][str(name)] = str(val)
+    return jars
+
+
+def cookie_delta(old: dict, new: dict) -> dict:
+    """{"set": new/changed cookies, "delete": names gone}; {} when nothing changed."""
+    delta = {}
+    changed = {k: v for k, v in new.items() if old.get(k) != v}
+    gone = sorted(set(old) - set(new))
+    if changed:
+        delta["set"] = changed
+    if gone:
+        delta["delete"] = gone
+    return delta
+
+
+def load_refresh_state() -> dict:
+    try:
+        with open(REFRESH_STATE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}  # first pass: everything found counts as new, nothing as deleted
+
+
+def save_refresh_state(state: dict):
+    tmp = REFRESH_STATE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, REFRESH_STATE)
+
+
+def refresh_once(session, visit: bool = False) -> int:
+    """
+    One pass of --refresh: read the persistent profile's cookies for the
+    user's source domains (headless, no login), diff them against what was
+    last uploaded, and send only the difference, gzipped, to
+    /api/source/cookies_delta_key/. Returns the number of sources updated.
+    """
+    headers = {"Authorization": f"ApiKey {API_KEY}"}
+    r = session.get(DELTA_URL, headers=headers, timeout=20)
+    r.raise_for_status()
+    domains = r.json().get("domains") or {}
+    if not domains:
+        return 0
+
+    with sync_playwright() as pw:
+        ctx = open_ctx(pw, USER_PROFILE_DIR, headless=True)
+        try:
+            if visit:
+                # let each site rotate its session cookies the way a visit would
+                page = ctx.new_page()
+                for domain, url in domains.items():
+                    try:
+                        page.goto(url, wait_until="domcontentloaded", timeout=45_000)
+                    except (PWError, PWTimeout):
+                        log(f"{domain}: visit timed out")
+            jars = cookies_by_domain(ctx, domains)
+        finally:
+            try:
+                ctx.close()
+            except Exception:
+                pass
+
+    state = load_refresh_state()
+    deltas = {d: cookie_delta(state.get(d) or {}, jar) for d, jar in jars.items()}
+    deltas = {d: delta for d, delta in deltas.items() if delta}
+    if not deltas:
+        log("cookies unchanged")
+        return 0
+
+    body = gzip.compress(json.dumps({"domains": deltas}, separators=(",", ":")).encode("utf-8"))
+    r = session.post(DELTA_URL, data=body, timeout=30, headers={
+        **headers, "Content-Type": "application/json", "Content-Encoding": "gzip",
+    })
+    if r.status_code != 200:
+        print("[link] cookie refresh failed:", r.status_code, r.text, file=sys.stderr)
+        r.raise_for_status()
+    state.update({d: jars[d] for d in deltas})
+    save_refresh_state(state)
+    updated = r.json().get("updated", 0)
+    for d, delta in deltas.items():
+        log(f"{d}: {len(delta.get('set', {}))} set, {len(delta.get('delete', []))} deleted")
+    log(f"{updated} source(s) updated ({len(body)} bytes sent)")
+    return updated
+
+
+def refresh_loop(interval: float, visit: bool = False, once: bool = False):
+    """Keep the server's copies of the profile's cookies current (--refresh)."""
+    session = requests.Session()
+    while True:
+        try:
+            refresh_once(session, visit=visit)
+        except Exception as e:
+            # e.g. the profile is open in another browser (link or edge checking)
+            log("refresh pass failed:", e)
+        if once:
+            return
+        time.sleep(interval * random.uniform(0.9, 1.1))
+
+
 def main():
     if not API_KEY:
         raise SystemExit("Set WN_API_KEY to your real key.")
 
     ap = argparse.ArgumentParser()
-    ap.add_argument("--name", required=True, help="App name (e.g., Fiverr)")
-    ap.add_argument("--url",  required=True, help="Inbox URL (e.g., https://www.fiverr.com/inbox)")
+    ap.add_argument("--name", help="App name (e.g., Fiverr)")
+    ap.add_argument("--url",  help="Inbox URL (e.g., https://www.fiverr.com/inbox)")
+    ap.add_argument("--manifest",
+                    help="JSON file of sources to link in one go (one browser session, one login per domain).")
     ap.add_argument("--rendered", action="store_true",
                     help="Use headless browser rendering for this source (for dynamic pages).")
     ap.add_argument("--fresh", action="store_true",
                     help="Use a brand-new temporary Chromium profile for this run.")
 
     ap.add_argument("--login", action="store_true", help="Open browser to log in and capture cookies")
+    ap.add_argument("--refresh", action="store_true",
+                    help="Keep running: periodically re-read cookies from the persistent profile "
+                         "and upload only the ones that changed.")
+    ap.add_argument("--once", action="store_true", help="With --refresh: one pass, then exit (cron).")
+    ap.add_argument("--interval", type=float, default=REFRESH_SEC,
+                    help="Seconds between --refresh passes (default WN_COOKIE_REFRESH_SEC or 1800).")
+    ap.add_argument("--visit", action="store_true",
+                    help="With --refresh: open each source's page headless first so sites can renew sessions.")
     args = ap.parse_args()
 
+    if args.refresh:
+        refresh_loop(max(60.0, args.interval), visit=args.visit, once=args.once)
+        return
+    if args.manifest:
+        link_manifest(load_manifest(args.manifest), login=args.login, fresh=args.fresh)
+        log("done.")
+        return
+    if not args.name or not args.url:
+        ap.error("--name and --url are required (or use --manifest / --refresh)")
+
     headers = {"Authorization": f"ApiKey {API_KEY}", "Content-Type": "application/json"}
 
     # 1) Create source on the server
@@ -0,0 +1,180 @@
+# webnotify/active_cache.py
+"""
+Cached "current active notification" payloads, already serialized to JSON.
+
+Every poller (desktop client, dashboard tab, notifications page) asks the
+same question every few seconds, so the answer is kept in the shared cache
+(Redis in production, see WN_CACHE_URL) per user, response shape and
+device:
+
+    desktop  GET /api/active_notification/          oldest unseen (+ ring_count)
+    key      GET /api/notifications/active_key/     newest unplayed
+    api      GET /api/notifications/active/         newest unplayed (+ counts)
+
+Keys embed a per-user generation number. inbox.py bumps it after every
+commit that changes the user's inbox, which invalidates every shape and
+device at once. New notifications are written through. The DB stays
+the source of truth and ACTIVE_CACHE_TTL bounds staleness if an
+invalidation is ever lost.
+
+Without a shared cache (no WN_CACHE_URL), each process would keep its own
+copy that the other processes' invalidations never reach, while the
+version behind the ETag (versions.py) still moves. So every body is built
+from the DB instead, and nothing is cached or written through.
+"""
+import json
+import logging
+import time
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+TTL = int(getattr(settings, "ACTIVE_CACHE_TTL", 30))
+VARIANTS = ("desktop", "key", "api")
+
+
+def _gen_key(user_id) -> str:
+    return f"wn:active:gen:{user_id}"
+
+
+def _key(user_id, gen, variant, device="") -> str:
+    return f"wn:active:{user_id}:{gen}:{variant}:{device}"
+
+
+def generation(user_id) -> int:
+    gen = cache.get(_gen_key(user_id))
+    if gen is None:
+        # time-based seed so a flushed cache never reuses an old generation
+        gen = int(time.time() * 1000)
+        if not cache.add(_gen_key(user_id), gen, None):
+            gen = cache.get(_gen_key(user_id), gen)
+    return gen
+
+
+def invalidate(user_id) -> None:
+    if not versions.SHARED_CACHE:
+        return
+    try:
+        cache.incr(_gen_key(user_id))
+    except ValueError:
+        cache.set(_gen_key(user_id), int(time.time() * 1000), None)
+    except Exception:
+        logger.warning("active cache invalidation failed for user %s", user_id)
+
+
+def _dumps(payload: dict) -> str:
+    return json.dumps(payload, cls=DjangoJSONEncoder)
+
+
+# --------------------------- payload shapes ---------------------------
+
+def _desktop_payload(notif, user) -> dict:
+    if not notif:
+        return {"has": False}
+    # ring_count lives on your custom User in your project; default to 1 if missing
+    ring_count = getattr(user, "ring_count", 1)
+    return {
+        "has": True,
+        "id": notif.id,
+        "source_name": getattr(notif.source, "name", "App"),
+        "title": notif.title or "",
+        "message": notif.message or "",
+        "ring_count": int(min(5, max(0, ring_count))),  # hard-cap 0..5
+        "detected_at": notif.detected_at.isoformat(),
+    }
+
+
+def _key_payload(notif) -> dict:
+    if not notif:
+        return {"ok": True, "has": False}
+    return {
+        "ok": True,
+        "has": True,
+        "id": notif.pk,
+        "title": notif.title,
+        "message": notif.message,
+        "link": notif.link,
+        "detected_at": notif.detected_at.isoformat(),
+        "source": notif.source.name if notif.source else None,
+    }
+
+
+def _api_payload(notif, counts) -> dict:
+    from .serializers import NotificationSerializer
+
+    if not notif:
+        return {"has": False, "counts": counts}
+    return {"has": True, **NotificationSerializer(notif).data, "counts": counts}
+
+
+def build(variant: str, user, device: str = "") -> dict:
+    """Compute a payload from the DB (cache miss path)."""
+    from . import inbox
+
+    qs = inbox.pending(user, device).select_related("source")
+    if variant == "desktop":
+        return _desktop_payload(qs.filter(seen=False).order_by("detected_at").first(), user)
+    notif = qs.filter(played=False).order_by("-detected_at").first()
+    if variant == "key":
+        return _key_payload(notif)
+    if variant == "api":
+        return _api_payload(notif, inbox.counts(user.pk))
+    raise ValueError(f"unknown active payload variant {variant!r}")
+
+
+# --------------------------- read / write ---------------------------
+
+def cached(user, variant: str, device: str = "", builder: Optional[Callable[[], dict]] = None) -> str:
+    """JSON body for this poll; hits the DB only on a cache miss."""
+    if not versions.SHARED_CACHE:
+        return _dumps(builder() if builder else build(variant, user, device))
+    try:
+        key = _key(user.pk, generation(user.pk), variant, device)
+        body = cache.get(key)
+    except Exception:
+        logger.warning("active cache unavailable; reading from DB")
+        key, body = None, None
+    if body is not None:
+        return body
+    body = _dumps(builder() if builder else build(variant, user, device))
+    if key:
+        try:
+            cache.set(key, body, TTL)
+        except Exception:
+            pass
+    return body
+
+
+def notification_created(notif) -> None:
+    """
+    Run after the inserting transaction commits: invalidate, then write the
+    new row through as the "newest unplayed" answer for the user-wide view.
+    "desktop" (oldest unseen) is only written through when it was empty.
+    """
+    from . import inbox
+
+    if not versions.SHARED_CACHE:
+        return
+    uid = notif.user_id
+    try:
+        old_gen = generation(uid)
+        desktop_was_empty = cache.get(_key(uid, old_gen, "desktop")) == _dumps({"has": False})
+        invalidate(uid)
+        gen = generation(uid)
+        user = notif.user
+        entries = {
+            _key(uid, gen, "key"): _dumps(_key_payload(notif)),
+            _key(uid, gen, "api"): _dumps(_api_payload(notif, inbox.counts(uid))),
+        }
+        if desktop_was_empty:
+            entries[_key(uid, gen, "desktop")] = _dumps(_desktop_payload(notif, user))
+        cache.set_many(entries, TTL)
+    except Exception:
+        logger.exception("active cache write-through failed for user %s", uid)
+        invalidate(uid)
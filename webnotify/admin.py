@@ -1,6 +1,13 @@
 from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-from webnotify.models import NotificationSource, Notification, CustomRingtone, UserSettings
+from webnotify import captures
+from webnotify.models import (
+    NotificationSource, Notification, CustomRingtone, UserSettings, CheckRun, CheckRunRollup, CheckCapture,
+)
 
 
 # Register your models here.
@@ -23,4 +30,65 @@ class CustomRingtoneAdmin(admin.ModelAdmin):
 
 @admin.register(UserSettings)
 class UserSettingsAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "default_ringtone", "volume", "play_loop")
\ No newline at end of file
+    list_display = ("id", "user", "default_ringtone", "volume", "play_loop")
+
+@admin.register(CheckRun)
+class CheckRunAdmin(admin.ModelAdmin):
+    list_display = ("id", "source", "created_at", "mode", "status_code", "bytes", "fetch_ms", "render_ms", "parse_ms", "detector", "outcome")
+    list_filter = ("mode", "outcome", "detector")
+    date_hierarchy = "created_at"
+    raw_id_fields = ("source",)
+
+@admin.register(CheckRunRollup)
+class CheckRunRollupAdmin(admin.ModelAdmin):
+    list_display = ("id", "source", "period", "bucket", "mode", "runs", "fetch_ms_sum", "render_ms_sum", "parse_ms_sum")
+    list_filter = ("period", "mode")
+    date_hierarchy = "bucket"
+    raw_id_fields = ("source",)
+
+@admin.register(CheckCapture)
+class CheckCaptureAdmin(admin.ModelAdmin):
+    PREVIEW_CHARS = 20000
+
+    list_display = ("id", "source", "created_at", "reason", "mode", "outcome", "status_code", "total_ms", "body_bytes", "stored_bytes")
+    list_filter = ("reason", "mode", "outcome")
+    date_hierarchy = "created_at"
+    raw_id_fields = ("source",)
+    exclude = ("body",)
+    readonly_fields = (
+        "source", "created_at", "reason", "mode", "outcome", "status_code", "url", "total_ms", "timings",
+        "request_headers", "response_headers", "trace", "content_kind", "codec", "body_bytes", "stored_bytes",
+        "body_preview",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path("<int:pk>/body/", self.admin_site.admin_view(self.body_view), name="webnotify_checkcapture_body"),
+        ] + super().get_urls()
+
+    def body_view(self, request, pk):
+        """The captured page, decompressed, as plain text (never rendered)."""
+        capture = get_object_or_404(CheckCapture, pk=pk)
+        response = HttpResponse(captures.decompress(capture), content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="capture-{pk}.html"'
+        return response
+
+    @admin.display(description="body")
+    def body_preview(self, obj):
+        if not obj.stored_bytes:
+            return "-"
+        try:
+            text = captures.decompress(obj).decode("utf-8", "replace")
+        except Exception as e:
+            return f"cannot decompress: {e}"
+        return format_html(
+            '<a href="{}">download ({} bytes)</a><pre style="white-space: pre-wrap; max-height: 40em; overflow: auto">{}</pre>',
+            reverse("admin:webnotify_checkcapture_body", args=[obj.pk]), obj.body_bytes,
+            text[:self.PREVIEW_CHARS] + ("…" if len(text) > self.PREVIEW_CHARS else ""),
+        )
@@ -0,0 +1,185 @@
+# webnotify/authentication.py
+"""
+API-key authentication (desktop client, scripts), shared by the function
+views (user_from_request) and DRF (ApiKeyAuthentication).
+
+Keys arrive as "Authorization: ApiKey <key>", or as ?key= / a "key" field
+on the endpoints that allow it. Resolving key -> user id is cached twice:
+
+  * a process-local LRU (APIKEY_LRU_SIZE entries, APIKEY_LOCAL_TTL seconds)
+  * the shared cache (APIKEY_CACHE_TTL seconds)
+
+Both are keyed by the key's sha256, so raw keys never reach Redis. A miss
+looks the hash up through UserSettings.api_key_hash (unique index) and
+confirms the stored key with hmac.compare_digest.
+
+Rotating UserSettings.api_key (see UserSettings.save) removes the old hash
+from the shared cache and from this process's LRU. Saving a user with
+is_active=False (User.save) does the same for that user's key. Other
+processes stop accepting the old key within APIKEY_LOCAL_TTL.
+QuerySet.update() skips both paths.
+
+The user handed back is lazy: .pk / .id come from the cache, and the row
+is only loaded when a view needs anything else.
+"""
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from rest_framework import authentication, exceptions
+
+from .db_router import bind_user
+
+logger = logging.getLogger(__name__)
+
+LRU_SIZE = int(getattr(settings, "APIKEY_LRU_SIZE", 1024))
+LOCAL_TTL = float(getattr(settings, "APIKEY_LOCAL_TTL", 30))
+CACHE_TTL = int(getattr(settings, "APIKEY_CACHE_TTL", 300))
+KEYWORD = "ApiKey"
+
+_lru: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _cache_key(key_hash: str) -> str:
+    return f"wn:apikey:{key_hash}"
+
+
+# --------------------------- LRU ---------------------------
+
+def _lru_get(key_hash: str) -> Optional[int]:
+    with _lock:
+        hit = _lru.get(key_hash)
+        if hit is None:
+            return None
+        user_id, expires = hit
+        if expires < time.monotonic():
+            del _lru[key_hash]
+            return None
+        _lru.move_to_end(key_hash)
+        return user_id
+
+
+def _lru_put(key_hash: str, user_id: int) -> None:
+    with _lock:
+        _lru[key_hash] = (user_id, time.monotonic() + LOCAL_TTL)
+        _lru.move_to_end(key_hash)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+# --------------------------- resolution ---------------------------
+
+def _lookup(key: str, key_hash: str) -> Optional[int]:
+    from .models import UserSettings
+
+    row = (
+        UserSettings.objects.filter(api_key_hash=key_hash, user__is_active=True)
+        .values_list("user_id", "api_key")
+        .first()
+    )
+    if row is None or not hmac.compare_digest(row[1] or "", key):
+        return None
+    return row[0]
+
+
+def resolve(key: str) -> Optional[int]:
+    """User id for an API key, or None. Only cache misses touch the DB."""
+    if not key:
+        return None
+    key_hash = hash_key(key)
+    user_id = _lru_get(key_hash)
+    if user_id is not None:
+        return user_id
+    try:
+        user_id = cache.get(_cache_key(key_hash))
+    except Exception:
+        logger.warning("api key cache unavailable; reading from DB")
+        user_id = None
+    if user_id is None:
+        user_id = _lookup(key, key_hash)
+        if user_id is None:
+            return None
+        try:
+            cache.set(_cache_key(key_hash), user_id, CACHE_TTL)
+        except Exception:
+            pass
+    _lru_put(key_hash, user_id)
+    return user_id
+
+
+def forget(key_hash: str) -> None:
+    """Stop honouring a (rotated) key: drop it from the shared cache and this process."""
+    with _lock:
+        _lru.pop(key_hash, None)
+    try:
+        cache.delete(_cache_key(key_hash))
+    except Exception:
+        logger.warning("could not drop rotated api key from the cache")
+
+
+# --------------------------- request helpers ---------------------------
+
+class ApiKeyUser(SimpleLazyObject):
+    """The key's user; the row is loaded on first access to anything but pk/id."""
+
+    def __init__(self, user_id: int):
+        super().__init__(lambda: get_user_model()._default_manager.get(pk=user_id))
+        self.__dict__.update(pk=user_id, id=user_id, is_authenticated=True, is_anonymous=False)
+
+    def __bool__(self):
+        return True
+
+
+def key_from_request(request, allow_query: bool = True) -> str:
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith(KEYWORD + " "):
+        return auth.split(None, 1)[1].strip()
+    if allow_query:
+        return (request.GET.get("key") or request.POST.get("key") or "").strip()
+    return ""
+
+
+def user_for_key(key: str) -> Optional[ApiKeyUser]:
+    user_id = resolve(key)
+    return ApiKeyUser(user_id) if user_id is not None else None
+
+
+def user_from_request(request, key: Optional[str] = None, allow_query: bool = True):
+    """
+    Authenticate a function view by API key (header, else ?key= / POST key
+    when allow_query) and bind the user for the DB router. None if invalid.
+    """
+    user = user_for_key(key or key_from_request(request, allow_query))
+    if user is not None:
+        bind_user(request, user)
+    return user
+
+
+class ApiKeyAuthentication(authentication.BaseAuthentication):
+    """DRF: "Authorization: ApiKey <key>" (header only; no CSRF, no session)."""
+
+    def authenticate(self, request):
+        key = key_from_request(request, allow_query=False)
+        if not key:
+            return None
+        user = user_for_key(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed("Invalid API key")
+        bind_user(request._request, user)
+        return user, None
+
+    def authenticate_header(self, request):
+        return KEYWORD
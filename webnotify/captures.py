@@ -0,0 +1,210 @@
+# webnotify/captures.py
+"""
+Snapshots of slow, failed or surprising checks, for the admin (CheckCapture).
+
+check_source() passes every finished run to maybe_capture() with a `trace`
+dict of references it already holds: response headers and body or the
+rendered DOM, detection.analyze() output, the previous count. Nothing is
+copied, compressed or written unless the run is worth keeping:
+
+  error        check_source raised, or every fetch failed
+  slow         the whole check took CAPTURE_SLOW_MS or more
+  count_jump   the unread count moved by CAPTURE_COUNT_JUMP or more
+  count_lost   a count was detected last time but not this time
+  debug        extra_config["debug"] is set (every run)
+
+Sampling: each (source, reason) is captured at most once per
+CAPTURE_COOLDOWN_SECONDS (debug excepted), so a source that keeps failing
+leaves one capture an hour instead of one per check. Bodies are cut at
+CAPTURE_MAX_BODY_BYTES and zstd-compressed (gzip without the optional
+`zstandard` package). Storage is a ring buffer: the newest
+CAPTURE_PER_SOURCE rows per source, and the oldest rows overall go once
+the compressed total passes CAPTURE_MAX_BYTES. That total is a running
+count in the cache, so a capture costs no scan of the table. The table is
+summed only when the count passes the limit, or at most every
+TOTAL_RECOUNT_SECONDS so that per-process caches do not drift far.
+"""
+import gzip
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .models import CheckCapture
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+    _ZSTD_AVAILABLE = True
+except Exception:
+    _ZSTD_AVAILABLE = False
+
+ENABLED = bool(getattr(settings, "CAPTURE_ENABLED", True))
+SLOW_MS = int(getattr(settings, "CAPTURE_SLOW_MS", 15000))
+COUNT_JUMP = int(getattr(settings, "CAPTURE_COUNT_JUMP", 25))
+COOLDOWN_SECONDS = int(getattr(settings, "CAPTURE_COOLDOWN_SECONDS", 3600))
+PER_SOURCE = int(getattr(settings, "CAPTURE_PER_SOURCE", 5))
+MAX_BYTES = int(getattr(settings, "CAPTURE_MAX_BYTES", 64 * 1024 * 1024))
+MAX_BODY_BYTES = int(getattr(settings, "CAPTURE_MAX_BODY_BYTES", 5 * 1024 * 1024))
+
+REDACTED_HEADERS = {"authorization", "proxy-authorization", "cookie", "set-cookie", "x-api-key"}
+TRACE_KEYS_MAX = 20  # new_keys / item_keys kept in the trace
+TOTAL_KEY = "wn:capture:bytes"
+TOTAL_RECOUNT_SECONDS = 600
+
+
+def reason_for(run: Dict, trace: Dict, total_ms: int) -> Optional[str]:
+    outcome = run.get("outcome")
+    if outcome in ("error", "fetch_failed"):
+        return "error"
+    if total_ms >= SLOW_MS:
+        return "slow"
+    result, prev = trace.get("result"), trace.get("prev_count")
+    if result is not None and prev is not None and outcome != "baseline":
+        count = result.get("count")
+        if count is None:
+            return "count_lost"
+        if abs(int(count) - int(prev)) >= COUNT_JUMP:
+            return "count_jump"
+    if trace.get("debug"):
+        return "debug"
+    return None
+
+
+def maybe_capture(run: Dict, trace: Dict, total_ms: int) -> Optional[CheckCapture]:
+    """Store a capture if this run deserves one; never raises."""
+    if not ENABLED:
+        return None
+    reason = reason_for(run, trace, total_ms)
+    if reason is None:
+        return None
+    try:
+        if reason != "debug" and not cache.add(f"wn:capture:{run['source_id']}:{reason}", 1, COOLDOWN_SECONDS):
+            return None
+        capture = _store(run, trace, total_ms, reason)
+        _trim(run["source_id"], capture.stored_bytes)
+        return capture
+    except Exception:
+        # debugging aids must never break checking
+        logger.exception("check capture failed for source %s", run.get("source_id"))
+        return None
+
+
+# --------------------------- compression ---------------------------
+
+def compress(raw: bytes) -> Tuple[str, bytes]:
+    if _ZSTD_AVAILABLE:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    return "gzip", gzip.compress(raw, compresslevel=6)
+
+
+def decompress(capture: CheckCapture) -> bytes:
+    blob = bytes(capture.body or b"")
+    if not blob:
+        return b""
+    if capture.codec == "zstd":
+        if not _ZSTD_AVAILABLE:
+            raise RuntimeError("this capture is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(blob, max_output_size=MAX_BODY_BYTES)
+    return gzip.decompress(blob)
+
+
+# ----------------------------- storage -----------------------------
+
+def _redact(headers) -> Dict[str, str]:
+    return {
+        str(k): ("<redacted>" if str(k).lower() in REDACTED_HEADERS else str(v))
+        for k, v in dict(headers or {}).items()
+    }
+
+
+def _trace_json(trace: Dict) -> Dict:
+    out = {k: trace[k] for k in ("prev_count", "prev_hash", "error") if trace.get(k) is not None}
+    result = trace.get("result")
+    if result is not None:
+        result = dict(result)
+        for k in ("new_keys", "item_keys"):
+            if k in result:
+                keys = list(result[k] or [])
+                result[k] = keys[:TRACE_KEYS_MAX]
+                result[f"{k}_total"] = len(keys)
+        out["result"] = json.loads(json.dumps(result, default=str))
+    return out
+
+
+def _store(run: Dict, trace: Dict, total_ms: int, reason: str) -> CheckCapture:
+    if trace.get("dom"):
+        kind, body = "dom", trace["dom"].encode("utf-8", "ignore")
+    elif trace.get("body"):
+        kind, body = "response", bytes(trace["body"])
+    else:
+        kind, body = "", b""
+    codec, blob = compress(body[:MAX_BODY_BYTES]) if body else ("", b"")
+    return CheckCapture.objects.create(
+        source_id=run["source_id"],
+        reason=reason,
+        mode=run.get("mode") or "",
+        outcome=run.get("outcome") or "",
+        status_code=run.get("status_code"),
+        url=trace.get("url") or "",
+        total_ms=total_ms,
+        timings={k: run.get(k) or 0 for k in ("fetch_ms", "render_ms", "parse_ms")},
+        request_headers=_redact(trace.get("request_headers")),
+        response_headers=_redact(trace.get("response_headers")),
+        trace=_trace_json(trace),
+        content_kind=kind,
+        codec=codec,
+        body=blob,
+        body_bytes=len(body),
+        stored_bytes=len(blob),
+    )
+
+
+def _remember(total: int) -> int:
+    try:
+        cache.set(TOTAL_KEY, total, TOTAL_RECOUNT_SECONDS)
+    except Exception:
+        pass
+    return total
+
+
+def _recount() -> int:
+    return _remember(CheckCapture.objects.aggregate(n=Sum("stored_bytes"))["n"] or 0)
+
+
+def _running_total(delta: int) -> int:
+    """Compressed bytes of all captures after adding `delta`; sums the table only when not counted yet."""
+    try:
+        return cache.incr(TOTAL_KEY, delta)
+    except ValueError:
+        return _recount()  # never counted, or the count expired
+    except Exception:
+        logger.warning("capture byte count unavailable; summing the table")
+        return _recount()
+
+
+def _trim(source_id: int, added: int) -> int:
+    """Ring buffer: newest PER_SOURCE per source, then the oldest overall past MAX_BYTES."""
+    stale = list(
+        CheckCapture.objects.filter(source_id=source_id)
+        .order_by("-created_at", "-pk").values_list("pk", "stored_bytes")[PER_SOURCE:]
+    )
+    deleted = CheckCapture.objects.filter(pk__in=[pk for pk, _ in stale]).delete()[0] if stale else 0
+    if _running_total(added - sum(size for _, size in stale)) <= MAX_BYTES:
+        return deleted
+    total = _recount()  # the running count only bounds it; trim on the real figure
+    if total <= MAX_BYTES:
+        return deleted
+    stale = []
+    for pk, size in CheckCapture.objects.order_by("created_at", "pk").values_list("pk", "stored_bytes").iterator():
+        if total <= MAX_BYTES:
+            break
+        stale.append(pk)
+        total -= size
+    deleted += CheckCapture.objects.filter(pk__in=stale).delete()[0]
+    _remember(total)
+    return deleted
@@ -0,0 +1,221 @@
+# webnotify/checkruns.py
+"""
+Append-only CheckRun recording + rollups.
+
+check_source() fills a small `run` dict while it works; record() buffers it
+in-process and flush() writes the buffer with one bulk_create: when
+CHECKRUN_BATCH_SIZE rows are waiting, else from a timer thread in the same
+process CHECKRUN_FLUSH_SECONDS after the first buffered row (buffers are
+per process, so nothing outside it could drain them), and on worker
+shutdown. A crash loses at most that window. Celery beat calls
+rollup_recent() / prune() (see tasks.py) to downsample into
+CheckRunRollup and expire old raw rows. Rollup buckets are UTC hours and
+days.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import CheckRun, CheckRunRollup
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(getattr(settings, "CHECKRUN_BATCH_SIZE", 50))
+FLUSH_SECONDS = float(getattr(settings, "CHECKRUN_FLUSH_SECONDS", 30))
+RETENTION_DAYS = int(getattr(settings, "CHECKRUN_RETENTION_DAYS", 7))
+HOURLY_RETENTION_DAYS = int(getattr(settings, "CHECKRUN_HOURLY_RETENTION_DAYS", 90))
+
+_FIELDS = ("mode", "status_code", "bytes", "fetch_ms", "render_ms", "parse_ms", "detector", "outcome")
+
+_buffer: List[CheckRun] = []
+_buffer_since: Optional[float] = None
+_timer: Optional[threading.Timer] = None
+_lock = threading.Lock()
+
+
+def new_run(source_id: int) -> Dict:
+    """Blank run record; check_source() fills it in as stages complete."""
+    return {
+        "source_id": source_id,
+        "created_at": timezone.now(),
+        "mode": "",
+        "status_code": None,
+        "bytes": 0,
+        "fetch_ms": 0,
+        "render_ms": 0,
+        "parse_ms": 0,
+        "detector": "",
+        "outcome": "",
+    }
+
+
+def ms_since(t0: float) -> int:
+    return int((time.monotonic() - t0) * 1000)
+
+
+def record(run: Dict) -> None:
+    """Buffer one run; flushes when the batch is full or old enough."""
+    global _buffer_since
+    if not run.get("mode") or not run.get("outcome"):
+        return  # source vanished / disabled before anything happened
+    values = {k: run.get(k) for k in _FIELDS}
+    for k in ("bytes", "fetch_ms", "render_ms", "parse_ms"):
+        values[k] = int(values[k] or 0)
+    values["detector"] = values["detector"] or ""
+    row = CheckRun(source_id=run["source_id"], created_at=run["created_at"], **values)
+    with _lock:
+        _buffer.append(row)
+        if _buffer_since is None:
+            _buffer_since = time.monotonic()
+        due = len(_buffer) >= BATCH_SIZE or (time.monotonic() - _buffer_since) >= FLUSH_SECONDS
+        if not due:
+            _schedule_flush()
+    if due:
+        flush()
+
+
+def _schedule_flush() -> None:
+    """Make sure an idle process still writes its buffer (call with _lock held)."""
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(FLUSH_SECONDS, _timed_flush)
+        _timer.daemon = True
+        _timer.start()
+
+
+def _timed_flush() -> None:
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush()
+    finally:
+        connections.close_all()  # this timer thread's own connections
+
+
+def flush() -> int:
+    """Write all buffered runs in one INSERT. Returns rows written."""
+    global _buffer, _buffer_since
+    with _lock:
+        rows, _buffer, _buffer_since = _buffer, [], None
+    if not rows:
+        return 0
+    try:
+        CheckRun.objects.bulk_create(rows, batch_size=500)
+    except Exception:
+        # never let bookkeeping break checking
+        logger.exception("CheckRun flush failed (%s rows dropped)", len(rows))
+        return 0
+    return len(rows)
+
+
+# --------------------------- rollups ---------------------------
+
+def _merge_counts(dst: Dict, src: Dict) -> Dict:
+    c = Counter(dst or {})
+    c.update(src or {})
+    return dict(c)
+
+
+def rollup_hours(start, end) -> int:
+    """
+    (Re)build hourly rollups for [start, end) from raw CheckRun rows.
+    Idempotent: buckets are recomputed from scratch, so it is safe to run
+    over the current (still filling) hour repeatedly.
+    """
+    qs = CheckRun.objects.filter(created_at__gte=start, created_at__lt=end).annotate(
+        bucket=TruncHour("created_at", tzinfo=dt_timezone.utc),
+    )
+    group = ("source_id", "bucket", "mode")
+
+    totals = qs.values(*group).annotate(
+        runs=Count("id"),
+        bytes_sum=Sum("bytes"),
+        fetch_ms_sum=Sum("fetch_ms"), fetch_ms_max=Max("fetch_ms"),
+        render_ms_sum=Sum("render_ms"), render_ms_max=Max("render_ms"),
+        parse_ms_sum=Sum("parse_ms"), parse_ms_max=Max("parse_ms"),
+    ).order_by()
+
+    breakdown = {}
+    for field, target in (("outcome", "outcomes"), ("detector", "detectors"), ("status_code", "status_codes")):
+        for row in qs.values(*group, field).annotate(n=Count("id")).order_by():
+            key = (row["source_id"], row["bucket"], row["mode"])
+            label = "" if row[field] is None else str(row[field])
+            breakdown.setdefault(key, {}).setdefault(target, {})[label or "-"] = row["n"]
+
+    written = 0
+    for row in totals:
+        key = (row["source_id"], row["bucket"], row["mode"])
+        defaults = {k: row[k] or 0 for k in (
+            "runs", "bytes_sum", "fetch_ms_sum", "fetch_ms_max",
+            "render_ms_sum", "render_ms_max", "parse_ms_sum", "parse_ms_max",
+        )}
+        defaults.update({k: v for k, v in breakdown.get(key, {}).items()})
+        CheckRunRollup.objects.update_or_create(
+            source_id=row["source_id"], period=CheckRunRollup.PERIOD_HOUR,
+            bucket=row["bucket"], mode=row["mode"], defaults=defaults,
+        )
+        written += 1
+    return written
+
+
+def rollup_days(start, end) -> int:
+    """(Re)build daily rollups for [start, end) from hourly rollups."""
+    hourly = CheckRunRollup.objects.filter(
+        period=CheckRunRollup.PERIOD_HOUR, bucket__gte=start, bucket__lt=end,
+    ).order_by("bucket")
+
+    days: Dict = {}
+    for h in hourly:
+        day = h.bucket.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        d = days.setdefault((h.source_id, day, h.mode), {
+            "runs": 0, "bytes_sum": 0,
+            "fetch_ms_sum": 0, "fetch_ms_max": 0,
+            "render_ms_sum": 0, "render_ms_max": 0,
+            "parse_ms_sum": 0, "parse_ms_max": 0,
+            "outcomes": {}, "detectors": {}, "status_codes": {},
+        })
+        for k in ("runs", "bytes_sum", "fetch_ms_sum", "render_ms_sum", "parse_ms_sum"):
+            d[k] += getattr(h, k)
+        for k in ("fetch_ms_max", "render_ms_max", "parse_ms_max"):
+            d[k] = max(d[k], getattr(h, k))
+        for k in ("outcomes", "detectors", "status_codes"):
+            d[k] = _merge_counts(d[k], getattr(h, k))
+
+    for (source_id, day, mode), defaults in days.items():
+        CheckRunRollup.objects.update_or_create(
+            source_id=source_id, period=CheckRunRollup.PERIOD_DAY,
+            bucket=day, mode=mode, defaults=defaults,
+        )
+    return len(days)
+
+
+def rollup_recent(hours: int = 2) -> Dict[str, int]:
+    """Refresh the last few hourly buckets and the days they belong to."""
+    now = timezone.now().astimezone(dt_timezone.utc)
+    hour_start = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=max(1, hours) - 1)
+    day_start = hour_start.replace(hour=0)
+    return {
+        "hours": rollup_hours(hour_start, now),
+        "days": rollup_days(day_start, now),
+    }
+
+
+def prune() -> Dict[str, int]:
+    """Expire raw runs (and old hourly rollups); daily rollups are kept."""
+    now = timezone.now()
+    raw, _ = CheckRun.objects.filter(created_at__lt=now - timedelta(days=RETENTION_DAYS)).delete()
+    hourly, _ = CheckRunRollup.objects.filter(
+        period=CheckRunRollup.PERIOD_HOUR,
+        bucket__lt=now - timedelta(days=HOURLY_RETENTION_DAYS),
+    ).delete()
+    return {"raw": raw, "hourly": hourly}
@@ -0,0 +1,246 @@
+# webnotify/db_router.py
+"""
+Read-replica routing for the polling endpoints.
+
+Only views wrapped with @replica_reads (function views) or using
+ReplicaReadsMixin (DRF, safe methods only) ever read from a replica;
+everything else — and every write — stays on "default".
+
+Read-your-writes: PrimaryPinMiddleware pins a user to the primary for
+REPLICA_PIN_SECONDS after any successful unsafe request by that user, so a
+client that just acknowledged a notification never reads a stale replica.
+
+Replica lag is measured by tasks.measure_replica_lag (celery beat) and
+stored in the cache; replicas that are too far behind, or whose lag has
+not been measured recently, are skipped.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import List, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PIN_SECONDS = int(getattr(settings, "REPLICA_PIN_SECONDS", 10))
+MAX_LAG_SECONDS = float(getattr(settings, "REPLICA_MAX_LAG_SECONDS", 5))
+LAG_TTL_SECONDS = 30      # lag readings older than this are treated as "unknown" (=> primary)
+_HEALTH_MEMO_SECONDS = 2.0
+
+_replica_ok: ContextVar[bool] = ContextVar("wn_replica_ok", default=False)
+_user_id: ContextVar[Optional[int]] = ContextVar("wn_db_user_id", default=None)
+_pinned: ContextVar[Optional[bool]] = ContextVar("wn_db_pinned", default=None)
+
+_health = {"at": 0.0, "aliases": []}
+
+
+def replica_aliases() -> List[str]:
+    return [a for a in getattr(settings, "DATABASE_REPLICAS", []) if a in settings.DATABASES]
+
+
+# ------------------------- pinning -------------------------
+
+def _pin_key(user_id) -> str:
+    return f"wn:dbpin:{user_id}"
+
+
+def pin_primary(user_id) -> None:
+    """Route this user's reads to the primary for the next PIN_SECONDS."""
+    if user_id is None or not replica_aliases():
+        return
+    try:
+        cache.set(_pin_key(user_id), 1, PIN_SECONDS)
+    except Exception:
+        logger.warning("could not store primary pin for user %s", user_id)
+
+
+def _is_pinned() -> bool:
+    pinned = _pinned.get()
+    if pinned is None:
+        uid = _user_id.get()
+        try:
+            pinned = uid is not None and bool(cache.get(_pin_key(uid)))
+        except Exception:
+            pinned = True  # cache down => play safe
+        _pinned.set(pinned)
+    return pinned
+
+
+def bind_user(request, user) -> None:
+    """
+    Tell the router (and PrimaryPinMiddleware) who this request belongs to.
+    API-key views call this once the key is resolved.
+    """
+    uid = getattr(user, "pk", None)
+    request._wn_user_id = uid
+    _user_id.set(uid)
+    _pinned.set(None)
+
+
+# ------------------------- lag -------------------------
+
+def _lag_key(alias) -> str:
+    return f"wn:replica_lag:{alias}"
+
+
+def measure_lag(alias: str) -> Optional[float]:
+    """Seconds the replica is behind its primary (None if unknown)."""
+    conn = connections[alias]
+    with conn.cursor() as cur:
+        if conn.vendor == "postgresql":
+            cur.execute(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+            )
+            return float(cur.fetchone()[0] or 0)
+        if conn.vendor == "mysql":
+            cur.execute("SHOW REPLICA STATUS")
+            row = cur.fetchone()
+            if not row:
+                return None
+            cols = [c[0] for c in cur.description]
+            status = dict(zip(cols, row))
+            lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+            return None if lag is None else float(lag)
+    return 0.0  # e.g. sqlite test mirrors
+
+
+def record_lags() -> dict:
+    """Measure every replica and publish the readings for the routers."""
+    out = {}
+    for alias in replica_aliases():
+        try:
+            lag = measure_lag(alias)
+        except Exception as e:
+            logger.warning("replica %s lag check failed: %s", alias, e)
+            lag = None
+        out[alias] = lag
+        if lag is None:
+            cache.delete(_lag_key(alias))
+        else:
+            cache.set(_lag_key(alias), lag, LAG_TTL_SECONDS)
+    return out
+
+
+def _healthy_replicas() -> List[str]:
+    now = time.monotonic()
+    if now - _health["at"] < _HEALTH_MEMO_SECONDS:
+        return _health["aliases"]
+    aliases = replica_aliases()
+    healthy = []
+    if aliases:
+        try:
+            lags = cache.get_many([_lag_key(a) for a in aliases])
+        except Exception:
+            lags = {}
+        healthy = [a for a in aliases
+                   if lags.get(_lag_key(a)) is not None and lags[_lag_key(a)] <= MAX_LAG_SECONDS]
+    _health.update(at=now, aliases=healthy)
+    return healthy
+
+
+# ------------------------- router -------------------------
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_ok.get() or _is_pinned():
+            return None
+        healthy = _healthy_replicas()
+        return random.choice(healthy) if healthy else None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas mirror default
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_aliases()
+
+
+# ------------------------- view helpers -------------------------
+
+def _enter(user_id):
+    return _replica_ok.set(True), _user_id.set(user_id), _pinned.set(None)
+
+
+def _exit(tokens):
+    ok, uid, pinned = tokens
+    _pinned.reset(pinned)
+    _user_id.reset(uid)
+    _replica_ok.reset(ok)
+
+
+def replica_reads(view):
+    """Allow reads inside this (read-only) function view to hit a replica."""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        user = getattr(request, "user", None)
+        uid = user.pk if user is not None and user.is_authenticated else None
+        tokens = _enter(uid)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _exit(tokens)
+    return inner
+
+
+class ReplicaReadsMixin:
+    """DRF views: GET/HEAD/OPTIONS read from a replica after authentication."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in ("GET", "HEAD", "OPTIONS"):
+            user = request.user
+            self._replica_tokens = _enter(user.pk if user.is_authenticated else None)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        tokens = getattr(self, "_replica_tokens", None)
+        if tokens is not None:
+            self._replica_tokens = None
+            _exit(tokens)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def _pin_after(request, response) -> None:
+    if request.method not in ("GET", "HEAD", "OPTIONS", "TRACE") and response.status_code < 400:
+        uid = getattr(request, "_wn_user_id", None)
+        if uid is None:
+            user = getattr(request, "user", None)
+            uid = user.pk if user is not None and user.is_authenticated else None
+        pin_primary(uid)
+
+
+class PrimaryPinMiddleware:
+    """
+    Pin the user to the primary after any successful unsafe request.
+    Async-capable so ASGI requests (long-polls, SSE) keep an async handler
+    chain instead of holding a thread through async_to_sync.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        _pin_after(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS", "TRACE") and response.status_code < 400:
+            # request.user is lazy (session + DB) and pinning writes the cache
+            await sync_to_async(_pin_after)(request, response)
+        return response
@@ -0,0 +1,500 @@
+# webnotify/detection.py
+"""
+The detection pipeline of check_source: page -> unread count / text
+fingerprint / item keys.
+
+Django-free on purpose (bs4, plus Playwright when rendering), so the
+desktop client can load this file by path and run exactly the same
+heuristics on its own browser profile (edge mode, see edge.py).
+tasks.check_source and edge results both end in tasks.apply_result().
+"""
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# Generic keywords that commonly appear near inbox/notification badges
+KEYWORDS = re.compile(r"\b(inbox|message|messages|notification|notifications|alert|alerts)\b", re.I)
+
+# A sane desktop UA helps some sites behave correctly
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+    )
+}
+
+
+# --------------------- content parsing (counts) -------------------
+
+
+def visible_text(soup: BeautifulSoup) -> str:
+    for script in soup(["script", "style", "noscript", "template"]):
+        script.decompose()
+    return soup.get_text("\n", strip=True)
+
+
+def gmail_unread_count(soup: BeautifulSoup) -> Optional[int]:
+    """
+    Count Gmail unread rows (modern Gmail marks unread rows with class zA zE).
+    This function tries several heuristics and returns an integer or None.
+    """
+    try:
+        # modern Gmail (web UI): rows with classes 'zA zE' indicate unread
+        nodes = soup.select("tr.zA.zE, .zA.zE, .zA.zE *")
+        if nodes:
+            # prefer counting unique row containers (some selectors return child nodes)
+            rows = soup.select("tr.zA.zE")
+            if rows:
+                return len(rows)
+            # fallback: count unique elements matching .zA.zE
+            return len({elem for elem in nodes})
+
+        # class 'unread' or 'bsu' variants
+        nodes = soup.select(".unread, .unread-count, .bsu")
+        if nodes:
+            return len(nodes)
+
+        # try title like "(3) Inbox"
+        try:
+            title = (soup.title.string or "").strip()
+        except Exception:
+            title = ""
+        m = re.search(r"^\s*\((\d{1,4})\)\s*Inbox", title)
+        if m:
+            return int(m.group(1))
+
+        # fallback: scan visible text for "Inbox (N)" or "Unread N"
+        text = visible_text(soup)
+        m = re.search(r"Inbox\s*\(?(\d{1,4})\)?", text, re.I)
+        if m:
+            return int(m.group(1))
+        m = re.search(r"Unread[:\s]*?(\d{1,4})", text, re.I)
+        if m:
+            return int(m.group(1))
+    except Exception:
+        # don't let Gmail-specific errors break whole task
+        logger.exception("Error in gmail_unread_count")
+    return None
+
+
+def extract_count_from_title(soup: BeautifulSoup) -> Optional[int]:
+    # e.g. "(3) Inbox - Example"
+    try:
+        title = (soup.title.string or "").strip()
+    except Exception:
+        title = ""
+    m = re.search(r"\((\d{1,3})\)", title)
+    return int(m.group(1)) if m else None
+
+
+def extract_count_from_aria_or_badges(soup: BeautifulSoup) -> Optional[int]:
+    """
+    Aggressive heuristic: try to find unread-count badges / numbers near inbox links.
+    Returns integer count or None.
+    Logs candidate matches (logger.debug) to help tuning.
+    """
+    candidates = []
+
+    try:
+        # 1) Title like "(3) Inbox - " or "3 new"
+        try:
+            title = (soup.title.string or "").strip()
+        except Exception:
+            title = ""
+        if title:
+            m = re.search(r"^\s*\((\d{1,5})\)", title) or re.search(
+                r"\b(\d{1,5})\s+(?:unread|new)\b", title, re.I
+            )
+            if m:
+                val = int(m.group(1))
+                logger.debug("count-candidate: title -> %s", val)
+                return val
+            if title:
+                candidates.append(("title", title[:200]))
+
+        # 2) scan attributes that often carry badges / tooltips
+        attr_names = ("aria-label", "title", "data-tooltip", "alt", "data-count", "data-unread")
+        for attr in attr_names:
+            for el in soup.find_all(attrs={attr: True}):
+                valstr = str(el.get(attr) or "").strip()
+                if not valstr:
+                    continue
+                if any(k in valstr.lower() for k in ("inbox", "unread", "new", "notifications", "notification")):
+                    m = re.search(r"\b(\d{1,5})\b", valstr)
+                    if m:
+                        num = int(m.group(1))
+                        logger.debug("count-candidate: %s attr -> %s", attr, num)
+                        return num
+                    candidates.append((f"attr:{attr}", valstr[:200]))
+
+        # 3) anchors / buttons linking to inbox/mail; look at their text and siblings
+        anchors = list(soup.find_all(["a", "button"], href=True))
+        anchors += [b for b in soup.find_all("button") if b not in anchors]
+        for a in anchors:
+            href = (a.get("href") or "").lower()
+            text = a.get_text(" ", strip=True) or ""
+            if any(x in href for x in ("#inbox", "/inbox", "/mail", "mail.google.com", "notifications", "/feed/notifications")) or "inbox" in text.lower() or "mail" in href:
+                m = re.search(r"\b(\d{1,5})\b", text)
+                if m:
+                    num = int(m.group(1))
+                    logger.debug("count-candidate: anchor text -> %s (href=%s)", num, href[:120])
+                    return num
+                try:
+                    sib_texts = []
+                    for ch in a.find_all(recursive=False):
+                        sib_txt = ch.get_text(" ", strip=True)
+                        if sib_txt:
+                            sib_texts.append(sib_txt)
+                    p = a.parent
+                    if p:
+                        for sib in p.find_all(recursive=False):
+                            if sib is a:
+                                continue
+                            t = sib.get_text(" ", strip=True)
+                            if t:
+                                sib_texts.append(t)
+                    for s in sib_texts:
+                        m = re.search(r"\b(\d{1,5})\b", s)
+                        if m:
+                            num = int(m.group(1))
+                            logger.debug("count-candidate: anchor sibling -> %s (href=%s)", num, href[:120])
+                            return num
+                except Exception:
+                    pass
+                if text:
+                    candidates.append(("anchor", text[:200]))
+
+        # 4) class-name heuristic: look for elements whose class contains "badge", "count", "unread", "bsU"
+        for el in soup.find_all(class_=True):
+            cls = " ".join(el.get("class") or [])
+            low = cls.lower()
+            if any(tok in low for tok in ("badge", "count", "unread", "unread-count", "bsu", "bsu-")):
+                txt = el.get_text(" ", strip=True)
+                if not txt:
+                    for span in el.find_all(["span", "b"]):
+                        t = span.get_text(" ", strip=True)
+                        if t:
+                            txt = t
+                            break
+                if txt:
+                    m = re.search(r"\b(\d{1,5})\b", txt)
+                    if m:
+                        num = int(m.group(1))
+                        logger.debug("count-candidate: class(%s) -> %s", cls, num)
+                        return num
+                    candidates.append((f"class:{cls[:100]}", txt[:200]))
+
+        # 5) final pass: find lines in visible text that mention Inbox/Unread/Notifications near a number
+        visible = visible_text(soup)
+        if visible:
+            for line in visible.splitlines():
+                L = line.strip()
+                if not L:
+                    continue
+                low = L.lower()
+                if any(k in low for k in ("inbox", "unread", "notification", "notifications", "new")):
+                    m = re.search(r"\b(\d{1,5})\b", L)
+                    if m:
+                        num = int(m.group(1))
+                        logger.debug("count-candidate: visible-line -> %s", num)
+                        return num
+                    candidates.append(("visible-line", L[:200]))
+
+    except Exception as ex:
+        logger.exception("Error in badge heuristic: %s", ex)
+
+    if candidates:
+        logger.debug("badge-candidates found: %s", candidates[:10])
+    else:
+        logger.debug("badge-candidates: none")
+
+    return None
+
+
+def extract_count_from_text(soup_text: str) -> Optional[int]:
+    # lines like "Inbox (4)" or "Notifications 7"
+    best = None
+    for line in soup_text.splitlines():
+        line = line.strip()
+        if not line or not KEYWORDS.search(line):
+            continue
+        m = re.search(r"\b(\d{1,3})\b", line)
+        if m:
+            val = int(m.group(1))
+            best = val if best is None else max(best, val)
+    return best
+
+
+def detect_count(soup: BeautifulSoup, text: str) -> Tuple[Optional[int], str]:
+    """
+    Run the count detectors in priority order (Gmail first, then fallbacks).
+    Same semantics as chaining them with `or` (a 0 falls through to the next
+    detector). Returns (count, detector_name); name is "" when nothing matched.
+    """
+    detectors = (
+        ("gmail", lambda: gmail_unread_count(soup)),
+        ("title", lambda: extract_count_from_title(soup)),
+        ("badges", lambda: extract_count_from_aria_or_badges(soup)),
+        ("text", lambda: extract_count_from_text(text)),
+    )
+    value, name = None, ""
+    for name, fn in detectors:
+        value = fn()
+        if value:
+            return value, name
+    return value, (name if value is not None else "")
+
+
+def hash_text(txt: str) -> str:
+    return hashlib.sha256(txt.encode("utf-8", "ignore")).hexdigest()
+
+
+# --------------------- Playwright rendered fetch ------------------
+
+def fetch_rendered_html(
+    url: str,
+    cookies: dict,
+    user_data_dir: str = None,
+    wait_ms: int = 3000,
+    click_selector: str = None,
+    wait_selector: str = None,
+    scroll_down: int = 0,
+    headless: Optional[bool] = None,
+    **_ignore,
+) -> str:
+    """
+    Playwright-rendered HTML fetch.
+    - headless=None => choose default, but caller can force headful/headless via extra_config.
+    - wait_selector: CSS selector to wait for (useful for Gmail: 'tr.zA' or 'tr.zA.zE')
+    - user_data_dir: persistent profile path (must match the profile used by link_source)
+    """
+    if not isinstance(url, str):
+        try:
+            url = str(url)
+        except Exception:
+            logger.warning("Rendered fetch got non-string URL; aborting.")
+            return ""
+
+    try:
+        from playwright.sync_api import sync_playwright, Error as PWError, TimeoutError as PWTimeout
+    except Exception as e:
+        logger.warning("Playwright not available: %s", e)
+        return ""
+
+    # default profile path if not provided
+    if not user_data_dir:
+        base = os.path.dirname(os.path.dirname(__file__))
+        user_data_dir = os.path.join(base, "desktop_client", ".pw_profile")
+
+    # choose headless: if explicit arg provided, obey it; else default True except for gmail fallback
+    auto_headless = True
+    if headless is not None:
+        auto_headless = bool(headless)
+    else:
+        # prefer headful for Gmail because Google often serves limited basic HTML to headless browsers
+        if "mail.google.com" in url:
+            auto_headless = False
+
+    html = ""
+    with sync_playwright() as pw:
+        ctx = None
+        for channel in ("chrome", "msedge", None):
+            try:
+                ctx = pw.chromium.launch_persistent_context(
+                    user_data_dir=user_data_dir,
+                    headless=auto_headless,
+                    channel=channel,
+                    args=[
+                        "--disable-blink-features=AutomationControlled",
+                        "--disable-dev-shm-usage",
+                        "--no-first-run",
+                        "--no-default-browser-check",
+                        "--disable-gpu",
+                        "--disable-renderer-backgrounding",
+                        "--disable-features=IsolateOrigins,site-per-process",
+                        "--password-store=basic",
+                    ],
+                    viewport={"width": 1366, "height": 900},
+                )
+                break
+            except Exception:
+                ctx = None
+        if ctx is None:
+            logger.warning("Could not launch any Chromium channel for rendered fetch.")
+            return ""
+
+        # seed cookies (profile usually already has them)
+        if cookies:
+            try:
+                ck = [{"name": k, "value": v, "path": "/", "httpOnly": False, "secure": True} for k, v in cookies.items()]
+                if ck:
+                    ctx.add_cookies(ck)
+            except Exception:
+                pass
+
+        def open_and_render(target_url: str) -> str:
+            page = ctx.new_page()
+            try:
+                # set a desktop UA so Gmail gives full UI
+                try:
+                    page.set_extra_http_headers({"User-Agent": DEFAULT_HEADERS["User-Agent"]})
+                except Exception:
+                    pass
+
+                page.goto(target_url, wait_until="domcontentloaded", timeout=90_000)
+
+                # If a concrete selector is given, wait for it. This helps Gmail.
+                if wait_selector:
+                    try:
+                        page.wait_for_selector(wait_selector, timeout=max(12000, wait_ms), state="visible")
+                        # small additional wait to let JS finish populating rows
+                        page.wait_for_timeout(800)
+                    except PWTimeout:
+                        # continue even if selector didn't appear
+                        pass
+
+                # wait the requested ms to give client JS time to render extra bits
+                page.wait_for_timeout(wait_ms)
+
+                # optional lazy scrolls
+                for _ in range(int(scroll_down or 0)):
+                    page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                    page.wait_for_timeout(800)
+
+                # optional click
+                if click_selector:
+                    try:
+                        page.click(click_selector, timeout=8000)
+                        page.wait_for_timeout(1200)
+                    except Exception:
+                        pass
+
+                if page.is_closed():
+                    return ""
+                return page.content()
+            except Exception as e:
+                logger.warning("Rendered fetch failed for %s: %s", target_url, e)
+                return ""
+            finally:
+                try:
+                    if not page.is_closed():
+                        page.close()
+                except Exception:
+                    pass
+
+        # first try requested URL
+        html = open_and_render(url)
+
+        # gmail fallback: sometimes the root / redirects; try safe inbox/mobile variants
+        if (not html or len(html) < 2000) and ("mail.google.com" in url):
+            # prefer the basic inbox path (but still headful) or mobile
+            for alt in ("https://mail.google.com/mail/u/0/#inbox", "https://mail.google.com/"):
+                alt_html = open_and_render(alt)
+                if alt_html and len(alt_html) > len(html):
+                    html = alt_html
+
+        try:
+            ctx.close()
+        except Exception:
+            pass
+
+    return html
+
+
+def extract_item_keys(soup: BeautifulSoup) -> list:
+    """
+    Build stable 'keys' for items we consider notifications/messages.
+    We prefer anchors inside list-like structures. Key = href or href+text.
+    This stays generic across sites.
+    """
+    keys = []
+
+    # Common list structures first (keeps noise down)
+    containers = soup.select('[role="list"], [role="listbox"], ul, ol, .list, .notifications, .inbox, .menu')
+    if not containers:
+        containers = [soup]  # fall back to whole doc
+
+    seen = set()
+    for cont in containers:
+        for a in cont.select('a[href]'):
+            href = a.get('href', '').strip()
+            if not href:
+                continue
+            text = a.get_text(" ", strip=True)[:120]
+            key = href
+            if len(text) >= 8:  # add text to reduce collisions when hrefs are generic
+                key = f"{href} :: {text}"
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+
+        # Also look for obvious “item” blocks with text (no href)
+        for item in cont.select('[role="listitem"], li, .notification, .inbox-item, .message'):
+            t = item.get_text(" ", strip=True)
+            if t and len(t) >= 12:
+                key = f"TXT::{t[:160]}"
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+
+    return keys[:500]  # cap
+
+
+def render_snapshots(url: str, cookies: dict, user_data_dir: str = None,
+                     short_ms: int = 400, long_ms: int = 3000, **render_opts) -> Tuple[str, str]:
+    """
+    Two-stage render: a short snapshot to catch transient badges, and a
+    longer one for the 'stable' DOM. Returns (short_html, long_html).
+    """
+    short_html = fetch_rendered_html(url, cookies=cookies, user_data_dir=user_data_dir,
+                                     wait_ms=short_ms, **render_opts) or ""
+    long_html = fetch_rendered_html(url, cookies=cookies, user_data_dir=user_data_dir,
+                                    wait_ms=long_ms, **render_opts) or ""
+    return short_html, long_html
+
+
+def analyze(html: str, url: str = "", with_keys: bool = False) -> Dict:
+    """
+    Everything check_source decides on, from one HTML snapshot:
+      count / detector   unread count and the detector that found it (None / "")
+      text_hash          sha256 of the visible text (fallback change signal)
+      keywords           whether the visible text mentions inbox/message words
+      preview            first 200 chars of the visible text
+      text_len
+      item_keys          stable keys of list items (only with_keys=True)
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    text = visible_text(soup)
+
+    # First try Gmail-specific detector, then fallbacks
+    count, detector = detect_count(soup, text)
+    if count is None and "mail.google.com" in (url or ""):
+        try:
+            unread_rows = soup.select("tr.zA.zE")
+            if unread_rows:
+                count, detector = len(unread_rows), "gmail-rows"
+            else:
+                # try mobile/basic variants
+                unread_spans = soup.select('[aria-label*="unread"], .zF, .yP')  # some Gmail label classes
+                if unread_spans:
+                    count, detector = len(unread_spans), "gmail-labels"
+        except Exception:
+            logger.exception("Gmail parse error")
+
+    result = {
+        "count": count,
+        "detector": detector if count is not None else "",
+        "text_hash": hash_text(text),
+        "keywords": bool(KEYWORDS.search(text)),
+        "preview": text[:200] + ("…" if len(text) > 200 else ""),
+        "text_len": len(text),
+    }
+    if with_keys:
+        result["item_keys"] = extract_item_keys(soup)
+    return result
@@ -0,0 +1,173 @@
+# webnotify/edge.py
+"""
+Edge checking: a user's desktop client renders that user's rendered
+sources on its own logged-in browser profile (webnotify/detection.py,
+loaded by file path) and reports compact results instead of HTML.
+
+  GET  /api/edge/assignments/   which sources to render, and how often
+  POST /api/edge/results/       bulk results -> tasks.apply_result()
+
+Handing out an assignment leases those sources to the client for
+EDGE_LEASE_SECONDS, and every accepted result renews the lease. While a
+lease is live, check_source skips its own Playwright render. If the
+client goes quiet, the lease runs out and the servers take the source
+back. Leases live in the shared cache; losing the cache only means the
+servers render again until the next assignment.
+
+Edge results are recorded under their own mode ("edge"). When a source
+moves between the client's profile and the servers', the unread counts
+are compared if both sides have one. Otherwise the source is re-baselined
+(CheckRun outcome "rebaselined") instead of notifying on the difference
+between two renders.
+"""
+import logging
+import re
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from . import checkruns, metrics
+from .models import NotificationSource
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = int(getattr(settings, "EDGE_CHECK_SECONDS", 60))
+LEASE_SECONDS = int(getattr(settings, "EDGE_LEASE_SECONDS", 180))
+MAX_RESULTS = int(getattr(settings, "EDGE_MAX_RESULTS", 100))
+MODE = "edge"
+
+# extra_config keys passed through to the client's renderer
+RENDER_OPTIONS = ("short_render_ms", "render_timeout_ms", "wait_selector", "click_selector", "scroll_down", "headless")
+
+_HEX_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _lease_key(source_id) -> str:
+    return f"wn:edge:lease:{source_id}"
+
+
+def leased(source_id) -> bool:
+    try:
+        return cache.get(_lease_key(source_id)) is not None
+    except Exception:
+        return False  # cache down: render server-side
+
+
+def _lease(source_ids) -> None:
+    if not source_ids:
+        return
+    try:
+        cache.set_many({_lease_key(pk): 1 for pk in source_ids}, LEASE_SECONDS)
+    except Exception:
+        logger.warning("could not lease %s source(s) to an edge client", len(source_ids))
+
+
+def eligible(user):
+    """The user's enabled rendered sources, minus those opted out with extra_config.edge = false."""
+    # a missing key is NULL in SQL, so a plain exclude(edge=False) would drop it too
+    return NotificationSource.objects.filter(
+        Q(extra_config__edge__isnull=True) | ~Q(extra_config__edge=False),
+        user_id=user.pk, enabled=True, extra_config__rendered=True,
+    )
+
+
+def assignments(user) -> Dict:
+    """What this user's client should render; leases every source handed out."""
+    sources = []
+    for pk, url, extra in eligible(user).order_by("pk").values_list("pk", "check_url", "extra_config"):
+        extra = extra or {}
+        try:
+            interval = max(CHECK_SECONDS, int(extra.get("interval") or 0))
+        except (TypeError, ValueError):
+            interval = CHECK_SECONDS
+        sources.append({
+            "id": pk,
+            "url": url,
+            "interval": interval,
+            "render": {k: extra[k] for k in RENDER_OPTIONS if k in extra},
+        })
+    _lease([s["id"] for s in sources])
+    return {"sources": sources, "lease_seconds": LEASE_SECONDS, "refresh_after": LEASE_SECONDS // 3}
+
+
+def _clean(item: Dict):
+    """A client result reduced to what apply_result reads; None if it is unusable."""
+    text_hash = str(item.get("text_hash") or "").lower()
+    if not _HEX_RE.match(text_hash):
+        return None
+    count = item.get("count")
+    if count is not None:
+        try:
+            count = max(0, int(count))
+        except (TypeError, ValueError):
+            return None
+    new_keys = item.get("new_keys") or []
+    if not isinstance(new_keys, list):
+        new_keys = []
+    return {
+        "count": count,
+        "detector": str(item.get("detector") or "")[:32],
+        "text_hash": text_hash,
+        "keywords": bool(item.get("keywords")),
+        "preview": str(item.get("preview") or "")[:201],
+        "new_keys": [str(k)[:64] for k in new_keys[:50]],
+    }
+
+
+def _int(v) -> int:
+    try:
+        return max(0, int(v or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def ingest(user, items: List[Dict]) -> List[Dict]:
+    """
+    Apply a batch of edge results for `user`: [{"source_id", "ok", "count",
+    "detector", "text_hash", "keywords", "preview", "new_keys", "render_ms",
+    "parse_ms", "bytes"}]. Returns [{"source_id", "outcome"}] in input order.
+    """
+    from .tasks import apply_result  # tasks imports this module
+
+    items = [i for i in items[:MAX_RESULTS] if isinstance(i, dict)]
+    wanted = {_int(i.get("source_id")) for i in items}
+    allowed = set(eligible(user).filter(pk__in=wanted).values_list("pk", flat=True))
+
+    outcomes, accepted = [], []
+    for item in items:
+        source_id = _int(item.get("source_id"))
+        if source_id not in allowed:
+            outcomes.append({"source_id": source_id, "outcome": "not_assigned"})
+            continue
+        run = checkruns.new_run(source_id)
+        run["mode"] = MODE
+        for k in ("render_ms", "parse_ms", "bytes"):
+            run[k] = _int(item.get(k))
+        result = _clean(item) if item.get("ok", True) else None
+        try:
+            with transaction.atomic():
+                # serialize with any other writer of this source's baseline
+                source = (
+                    NotificationSource.objects.select_for_update(of=("self",))
+                    .select_related("user").get(pk=source_id)
+                )
+                if result is None:
+                    NotificationSource.objects.filter(pk=source_id).update(last_checked=run["created_at"])
+                    run["outcome"] = "fetch_failed" if not item.get("ok", True) else "invalid"
+                else:
+                    apply_result(source, source.extra_config or {}, run, MODE, ("", "", result["text_hash"]), result)
+        except NotificationSource.DoesNotExist:
+            outcomes.append({"source_id": source_id, "outcome": "not_assigned"})
+            continue
+        except Exception:
+            logger.exception("edge result for source %s failed", source_id)
+            run["outcome"] = "error"
+        checkruns.record(run)
+        metrics.record_check(run)
+        outcomes.append({"source_id": source_id, "outcome": run["outcome"]})
+        accepted.append(source_id)
+    _lease(accepted)
+    return outcomes
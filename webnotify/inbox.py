@@ -0,0 +1,311 @@
+# webnotify/inbox.py
+"""
+Per-user inbox state: every change to a notification's seen/played state
+(and every insert/delete) goes through here so the maintained
+NotificationCounter rows stay in step with the notifications table.
+
+Acknowledgement is watermark based (AckWatermark): "mark everything read"
+just moves the user's high-water mark to the newest id, a single-row
+write however long the history is. Row-level seen/played flags are only
+written for targeted acks above the mark. Use pending() for "what is
+still unacknowledged" instead of filtering on the flags alone.
+
+The watermark replaces a per-row seen_at. Notification has no such
+column: the old bulk mark-read passed one to update(), which the model
+never had. Neither path stamps rows with a time. When a user last
+acknowledged everything is AckWatermark.updated_at.
+
+Views and tasks should call these helpers instead of running
+Notification.objects...update()/delete() themselves.
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from . import active_cache, push, versions
+from .models import AckWatermark, Notification, NotificationCounter
+
+logger = logging.getLogger(__name__)
+
+PER_SOURCE = bool(getattr(settings, "NOTIFICATION_COUNTERS_PER_SOURCE", True))
+
+
+# --------------------------- watermarks ---------------------------
+
+def device_from_request(request) -> str:
+    """Optional client id for per-device acks: X-WN-Device header or ?device=."""
+    dev = request.headers.get("X-WN-Device") or request.GET.get("device") or ""
+    return dev.strip()[:64]
+
+
+def watermark(user_id, device: str = "") -> int:
+    """Effective mark for this user/device (max of user-wide and device marks)."""
+    devices = {"", device or ""}
+    wm = AckWatermark.objects.filter(user_id=user_id, device__in=devices).aggregate(m=Max("last_id"))["m"]
+    return int(wm or 0)
+
+
+def pending(user, device: str = ""):
+    """Notifications above the watermark (row flags still apply on top)."""
+    uid = getattr(user, "pk", user)
+    return Notification.objects.filter(user_id=uid, pk__gt=watermark(uid, device))
+
+
+def _advance_watermark(user_id, device: str, last_id: int) -> bool:
+    """Move the mark forward (never back). Returns True if it moved."""
+    # update() skips auto_now; updated_at is when the user last acked everything
+    moved = (
+        AckWatermark.objects.filter(user_id=user_id, device=device, last_id__lt=last_id)
+        .update(last_id=last_id, updated_at=timezone.now())
+    )
+    if moved:
+        return True
+    if AckWatermark.objects.filter(user_id=user_id, device=device).exists():
+        return False
+    try:
+        with transaction.atomic():
+            AckWatermark.objects.create(user_id=user_id, device=device, last_id=last_id)
+        return True
+    except IntegrityError:
+        return bool(
+            AckWatermark.objects.filter(user_id=user_id, device=device, last_id__lt=last_id)
+            .update(last_id=last_id, updated_at=timezone.now())
+        )
+
+
+# --------------------------- counters ---------------------------
+
+def _actual_counts(user_id) -> Dict[Optional[int], Dict[str, int]]:
+    """{source_id: {"unseen": n, "unplayed": n}} straight from the notifications table."""
+    out: Dict[Optional[int], Dict[str, int]] = defaultdict(lambda: {"unseen": 0, "unplayed": 0})
+    rows = (
+        pending(user_id)
+        .filter(Q(seen=False) | Q(played=False))
+        .values("source_id")
+        .annotate(unseen=Count("id", filter=Q(seen=False)), unplayed=Count("id", filter=Q(played=False)))
+        .order_by()
+    )
+    for row in rows:
+        out[row["source_id"]] = {"unseen": row["unseen"], "unplayed": row["unplayed"]}
+    return out
+
+
+def _bump(user_id, source_id, unseen=0, unplayed=0):
+    """Atomic += on the user's total row (and the per-source row)."""
+    if not unseen and not unplayed:
+        return
+    targets = [None]
+    if PER_SOURCE and source_id is not None:
+        targets.append(source_id)
+    for sid in targets:
+        updated = NotificationCounter.objects.filter(user_id=user_id, source_id=sid).update(
+            unseen=F("unseen") + unseen, unplayed=F("unplayed") + unplayed,
+        )
+        if not updated:
+            # first time we see this user/source: seed from the table (already includes this change)
+            _seed(user_id, sid, unseen, unplayed)
+
+
+def _seed(user_id, source_id, unseen, unplayed):
+    actual = _actual_counts(user_id)
+    if source_id is None:
+        vals = {
+            "unseen": sum(v["unseen"] for v in actual.values()),
+            "unplayed": sum(v["unplayed"] for v in actual.values()),
+        }
+    else:
+        vals = dict(actual.get(source_id) or {"unseen": 0, "unplayed": 0})
+    try:
+        with transaction.atomic():
+            NotificationCounter.objects.create(user_id=user_id, source_id=source_id, **vals)
+    except IntegrityError:
+        # someone else seeded it first; apply our delta on top
+        NotificationCounter.objects.filter(user_id=user_id, source_id=source_id).update(
+            unseen=F("unseen") + unseen, unplayed=F("unplayed") + unplayed,
+        )
+
+
+def _apply_row_deltas(user_id, rows: Iterable, seen_after: bool, played_after: Optional[bool]):
+    """rows: (id, source_id, seen, played) tuples about to change / be deleted."""
+    deltas: Dict[Optional[int], Dict[str, int]] = defaultdict(lambda: {"unseen": 0, "unplayed": 0})
+    for _pk, sid, seen, played in rows:
+        if not seen and seen_after:
+            deltas[sid]["unseen"] -= 1
+        if played_after is None:
+            # deleted
+            if not played:
+                deltas[sid]["unplayed"] -= 1
+        elif played != played_after:
+            deltas[sid]["unplayed"] += -1 if played_after else 1
+    for sid, d in deltas.items():
+        _bump(user_id, sid, **d)
+
+
+def counts(user_id, by_source: bool = False) -> Dict:
+    """
+    {"unseen": n, "unplayed": n} from the maintained counters (one indexed read).
+    by_source=True adds {"sources": {source_id: {...}}}.
+    """
+    qs = NotificationCounter.objects.filter(user_id=user_id)
+    if not by_source:
+        qs = qs.filter(source__isnull=True)
+    rows = list(qs.values_list("source_id", "unseen", "unplayed"))
+    total = next(((u, p) for sid, u, p in rows if sid is None), None)
+    if total is None:
+        reconcile(user_id)
+        return counts(user_id, by_source=by_source)
+    out = {"unseen": max(0, total[0]), "unplayed": max(0, total[1])}
+    if by_source:
+        out["sources"] = {
+            sid: {"unseen": max(0, u), "unplayed": max(0, p)} for sid, u, p in rows if sid is not None
+        }
+    return out
+
+
+def reconcile(user_id) -> bool:
+    """Rewrite the user's counters from the table. Returns True if anything drifted."""
+    drifted = False
+    with transaction.atomic():
+        existing = {
+            c.source_id: c for c in NotificationCounter.objects.select_for_update().filter(user_id=user_id)
+        }
+        actual = _actual_counts(user_id)
+        wanted = {None: {
+            "unseen": sum(v["unseen"] for v in actual.values()),
+            "unplayed": sum(v["unplayed"] for v in actual.values()),
+        }}
+        if PER_SOURCE:
+            wanted.update({sid: v for sid, v in actual.items() if sid is not None})
+
+        for sid, vals in wanted.items():
+            row = existing.pop(sid, None)
+            if row is None:
+                NotificationCounter.objects.create(user_id=user_id, source_id=sid, **vals)
+                drifted = drifted or any(vals.values())
+            elif (row.unseen, row.unplayed) != (vals["unseen"], vals["unplayed"]):
+                NotificationCounter.objects.filter(pk=row.pk).update(**vals)
+                drifted = True
+        # per-source rows with nothing pending any more
+        leftovers = list(existing.values())
+        if leftovers:
+            drifted = drifted or any(c.unseen or c.unplayed for c in leftovers)
+            NotificationCounter.objects.filter(pk__in=[c.pk for c in leftovers]).delete()
+        if drifted:
+            _changed(user_id)
+    return drifted
+
+
+# --------------------------- state changes ---------------------------
+
+def _changed(user_id) -> None:
+    """Once committed: drop cached views of this user's inbox and tell live clients."""
+    def _after():
+        active_cache.invalidate(user_id)
+        versions.bump(user_id)
+        push.publish_ack(user_id)
+    transaction.on_commit(_after)
+
+
+def settings_changed(user_id) -> None:
+    """Once committed: new validators for this user, and live clients re-sync their settings."""
+    def _after():
+        versions.bump(user_id)
+        push.publish_settings(user_id)
+    transaction.on_commit(_after)
+
+
+def record_created(notification: Notification) -> None:
+    """Call inside the transaction that inserted `notification`."""
+    _bump(
+        notification.user_id, notification.source_id,
+        unseen=0 if notification.seen else 1,
+        unplayed=0 if notification.played else 1,
+    )
+    def _after():
+        active_cache.notification_created(notification)
+        versions.bump(notification.user_id)
+        push.publish_notification(notification)
+    transaction.on_commit(_after)
+
+
+def acknowledge(user, ids=None, played: bool = True, device: str = "") -> int:
+    """
+    Mark the user's notifications (all, or just `ids`) seen, and played/unplayed.
+
+    ids=None (with played=True) is "mark everything read": it only advances
+    the watermark. Targeted acks flag the individual rows above the mark.
+    Returns how many notifications became acknowledged.
+    """
+    if ids is None and played:
+        return acknowledge_all(user, device=device)
+
+    qs = pending(user, device)
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    with transaction.atomic():
+        rows = list(
+            qs.filter(Q(seen=False) | ~Q(played=played))
+            .select_for_update()
+            .values_list("id", "source_id", "seen", "played")
+        )
+        if not rows:
+            return 0
+        Notification.objects.filter(pk__in=[r[0] for r in rows]).update(seen=True, played=played)
+        _apply_row_deltas(user.pk, rows, seen_after=True, played_after=played)
+        _changed(user.pk)
+    return len(rows)
+
+
+def acknowledge_all(user, upto_id: Optional[int] = None, device: str = "") -> int:
+    """
+    Acknowledge everything up to `upto_id` (default: the newest notification)
+    by moving the watermark; O(1) in the size of the history. Rows are not
+    touched, so the ack time is the mark's updated_at (no per-row seen_at).
+    Returns the number of notifications that were unseen according to the
+    counters (0 for per-device marks, which don't touch the counters).
+    """
+    uid = user.pk
+    acked, recount = 0, False
+    with transaction.atomic():
+        # lock the total counter first so concurrent inserts queue behind us
+        total = NotificationCounter.objects.select_for_update().filter(user_id=uid, source__isnull=True).first()
+        newest = Notification.objects.filter(user_id=uid).order_by("-pk").values_list("pk", flat=True).first()
+        if not newest:
+            return 0
+        upto = newest if upto_id is None else min(int(upto_id), newest)
+        if not _advance_watermark(uid, device, upto):
+            return 0
+        _changed(uid)
+        if device:
+            return 0
+        if total is None or upto != newest:
+            recount = True  # rows above the mark remain; count just those
+        else:
+            acked = max(0, total.unseen)
+            NotificationCounter.objects.filter(user_id=uid).update(unseen=0, unplayed=0)
+    if recount:
+        before = total.unseen if total else 0
+        reconcile(uid)
+        acked = max(0, before - counts(uid)["unseen"])
+    return acked
+
+
+def delete(user, queryset=None) -> int:
+    """Hard-delete the user's notifications (or a filtered subset)."""
+    qs = queryset if queryset is not None else Notification.objects.filter(user=user)
+    with transaction.atomic():
+        unacked = list(
+            qs.filter(pk__gt=watermark(user.pk))
+            .filter(Q(seen=False) | Q(played=False))
+            .select_for_update()
+            .values_list("id", "source_id", "seen", "played")
+        )
+        deleted, _ = qs.delete()
+        _apply_row_deltas(user.pk, unacked, seen_after=True, played_after=None)
+        _changed(user.pk)
+    return deleted
@@ -0,0 +1,316 @@
+import gc
+import json
+import os
+import platform
+import statistics
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bs4
+from bs4 import BeautifulSoup
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import corpus
+from webnotify import captures, checkruns, detection, metrics
+from webnotify.models import NotificationSource
+from webnotify.tasks import check_source
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(corpus.__file__), "baseline.json")
+
+# stage -> fn(soup, page); each call gets its own freshly parsed soup
+# (visible_text decomposes <script>/<style>, so soups are never shared)
+SOUP_STAGES = {
+    "visible_text": lambda soup, page: detection.visible_text(soup),
+    "gmail": lambda soup, page: detection.gmail_unread_count(soup),
+    "badges": lambda soup, page: detection.extract_count_from_aria_or_badges(soup),
+    "item_keys": lambda soup, page: detection.extract_item_keys(soup),
+}
+STAGES = ("parse", *SOUP_STAGES, "text_count", "analyze", "check_source")
+LARGE_PAGE_BYTES = 1024 * 1024 + 4096
+
+
+def _parse(page):
+    return BeautifulSoup(page["html"], "html.parser")
+
+
+def _timed(fn):
+    # like timeit: no collector pauses inside the measurement
+    gc.collect()
+    gc.disable()
+    try:
+        t0 = time.perf_counter()
+        fn()
+        return (time.perf_counter() - t0) * 1000
+    finally:
+        gc.enable()
+
+
+def _peak_kb(fn):
+    """Peak Python heap allocated while fn() runs (tracemalloc), in KiB."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+class _PageServer:
+    """
+    Serves corpus pages on 127.0.0.1 without ETag/Last-Modified, so every
+    check_source run does the full fetch + parse + compare + save.
+    """
+
+    def __init__(self, pages):
+        bodies = {"/" + p["name"]: p["html"].encode("utf-8") for p in pages}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = bodies.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, page):
+        return f"http://127.0.0.1:{self.httpd.server_port}/{page['name']}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark check_source and each detector over the benchmarks/ corpus: "
+        "time and peak memory per stage and page size, compared to a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kinds", nargs="+", choices=corpus.KINDS, default=list(corpus.KINDS),
+                            help="Synthetic page kinds (default: all).")
+        parser.add_argument("--sizes", nargs="+", choices=list(corpus.SIZES), default=list(corpus.SIZES),
+                            help="Synthetic page sizes (default: all, 10k..5m).")
+        parser.add_argument("--no-recorded", action="store_true",
+                            help="Skip benchmarks/recorded/*.html.")
+        parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                            help="Stages to run (default: all; check_source needs the database).")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Timed runs per stage, the fastest is reported (default 5; "
+                                 "pages over 1 MiB, whose stages take seconds, get a third of that).")
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                            help="Baseline JSON to compare against / write (default benchmarks/baseline.json, "
+                                 "per machine and not committed).")
+        parser.add_argument("--update-baseline", action="store_true",
+                            help="Write this run's results as the new baseline instead of comparing.")
+        parser.add_argument("--threshold", type=float, default=0.5,
+                            help="Allowed slowdown vs baseline, as a fraction (default 0.5, which "
+                                 "absorbs shared-VM noise; use less on a dedicated machine).")
+        parser.add_argument("--mem-threshold", type=float, default=0.10,
+                            help="Allowed peak-memory growth vs baseline, as a fraction (default 0.10).")
+        parser.add_argument("--min-ms", type=float, default=10.0,
+                            help="Ignore slowdowns smaller than this many ms (timer and disk noise).")
+        parser.add_argument("--json", dest="json_out", help="Also write the results to this file.")
+
+    def handle(self, *args, **opts):
+        repeat = max(1, opts["repeat"])
+        stages = [s for s in STAGES if s in opts["stages"]]
+        pages = corpus.pages(opts["kinds"], opts["sizes"], recorded=not opts["no_recorded"])
+
+        results = {}
+        checker = _CheckSourceBench(pages, repeat) if "check_source" in stages else None
+        try:
+            for page in pages:
+                self.stdout.write(f"{page['name']} ({page['bytes'] / 1024:.0f} KiB)")
+                results[page["name"]] = {
+                    "kind": page["kind"], "size": page["size"], "bytes": page["bytes"],
+                    "sha256": page["sha256"], "stages": self._bench_page(page, stages, repeat, checker),
+                }
+        finally:
+            if checker:
+                checker.close()
+
+        report = {
+            "corpus_version": corpus.CORPUS_VERSION,
+            "repeat": repeat,
+            "environment": {"python": platform.python_version(), "bs4": bs4.__version__,
+                            "machine": platform.machine(), "system": platform.system()},
+            "pages": results,
+        }
+        if opts["json_out"]:
+            self._write(opts["json_out"], report)
+        if opts["update_baseline"]:
+            self._write(opts["baseline"], report)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written: {opts['baseline']}"))
+            return
+        self._compare(report, opts)
+
+    # ----------------------------------------------------------------
+
+    def _bench_page(self, page, stages, repeat, checker):
+        samples = {s: [] for s in stages}
+        peaks = {}
+        warmup = 1  # first pass of small pages runs on cold caches; dropped below
+        if page["bytes"] > LARGE_PAGE_BYTES:
+            repeat, warmup = max(1, -(-repeat // 3)), 0
+
+        for _ in range(warmup + repeat):
+            for name, fn in SOUP_STAGES.items():
+                if name not in stages and "parse" not in stages:
+                    continue
+                soup = None
+
+                def parse():
+                    nonlocal soup
+                    soup = _parse(page)
+                parse_ms = _timed(parse)
+                if "parse" in stages:
+                    samples["parse"].append(parse_ms)
+                if name in stages:
+                    samples[name].append(_timed(lambda: fn(soup, page)))
+            if "text_count" in stages or "analyze" in stages:
+                text = detection.visible_text(_parse(page))
+                if "text_count" in stages:
+                    samples["text_count"].append(_timed(lambda: detection.extract_count_from_text(text)))
+                if "analyze" in stages:
+                    samples["analyze"].append(_timed(lambda: detection.analyze(page["html"], page["url"])))
+            if checker:
+                samples["check_source"].append(_timed(lambda: checker.run(page)))
+
+        # one more traced run per stage for peak memory (tracemalloc slows timing, so kept apart)
+        if "parse" in stages:
+            peaks["parse"] = _peak_kb(lambda: _parse(page))
+        for name, fn in SOUP_STAGES.items():
+            if name in stages:
+                soup = _parse(page)
+                peaks[name] = _peak_kb(lambda: fn(soup, page))
+        if "text_count" in stages:
+            text = detection.visible_text(_parse(page))
+            peaks["text_count"] = _peak_kb(lambda: detection.extract_count_from_text(text))
+        if "analyze" in stages:
+            peaks["analyze"] = _peak_kb(lambda: detection.analyze(page["html"], page["url"]))
+        if checker:
+            peaks["check_source"] = _peak_kb(lambda: checker.run(page))
+
+        out = {}
+        for name in stages:
+            samples[name] = samples[name][warmup * len(samples[name]) // (warmup + repeat):]
+            out[name] = {
+                "ms": round(min(samples[name]), 2),
+                "median_ms": round(statistics.median(samples[name]), 2),
+                "peak_kb": peaks[name],
+            }
+            self.stdout.write(f"  {name:<13} {out[name]['ms']:>10.2f} ms  {out[name]['peak_kb']:>9} KiB peak")
+        return out
+
+    def _compare(self, report, opts):
+        try:
+            with open(opts["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {opts['baseline']}; run with --update-baseline to create one."))
+            return
+        if baseline.get("corpus_version") != report["corpus_version"]:
+            raise CommandError(
+                f"Baseline is for corpus v{baseline.get('corpus_version')}, this is "
+                f"v{report['corpus_version']}: re-run with --update-baseline.")
+        if baseline.get("environment") != report["environment"]:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline recorded on {baseline.get('environment')}; timings may not be comparable."))
+
+        regressions = []
+        self.stdout.write("\nvs baseline:")
+        for name, res in report["pages"].items():
+            base = baseline.get("pages", {}).get(name)
+            if not base:
+                self.stdout.write(f"  {name}: not in baseline")
+                continue
+            if base.get("sha256") != res["sha256"]:
+                self.stdout.write(self.style.WARNING(f"  {name}: page bytes differ from the baseline's, skipped"))
+                continue
+            for stage, cur in res["stages"].items():
+                old = base.get("stages", {}).get(stage)
+                if not old:
+                    continue
+                slower = cur["ms"] - old["ms"]
+                grew = cur["peak_kb"] - old["peak_kb"]
+                bad = []
+                limit = 1 + opts["threshold"]
+                # fastest AND median run both slower: one noisy run is not a regression
+                if (slower > opts["min_ms"] and cur["ms"] > old["ms"] * limit
+                        and cur["median_ms"] > old.get("median_ms", old["ms"]) * limit):
+                    bad.append(f"time {old['ms']:.2f} -> {cur['ms']:.2f} ms")
+                if grew > 64 and cur["peak_kb"] > old["peak_kb"] * (1 + opts["mem_threshold"]):
+                    bad.append(f"peak {old['peak_kb']} -> {cur['peak_kb']} KiB")
+                pct = (cur["ms"] / old["ms"] - 1) * 100 if old["ms"] else 0.0
+                line = f"  {name:<16} {stage:<13} {pct:+7.1f}% time  {grew:+8d} KiB peak"
+                if bad:
+                    regressions.append(f"{name}/{stage}: " + ", ".join(bad))
+                    self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+                else:
+                    self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s):\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions."))
+
+    def _write(self, path, report):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+class _CheckSourceBench:
+    """
+    End-to-end check_source runs against the local page server, on
+    throwaway sources owned by a throwaway user (deleted afterwards, with
+    their CheckRuns). The first check of each source (its baseline) is done
+    up front, so timed runs take the steady-state "unchanged" path.
+    Captures and metrics are off meanwhile: benchmark runs must not fill the
+    capture ring buffer or the shared counters.
+    """
+
+    def __init__(self, pages, repeat):
+        self.server = _PageServer(pages)
+        self.user = None
+        self.flags = captures.ENABLED, metrics.ENABLED
+        captures.ENABLED = metrics.ENABLED = False
+        try:
+            self.user = get_user_model().objects.create_user(
+                email=f"benchmark-{os.getpid()}@localhost.invalid", password=None)
+            self.sources = {}
+            for page in pages:
+                src = NotificationSource.objects.create(
+                    user=self.user, name=f"benchmark {page['name']}",
+                    check_url=self.server.url(page), enabled=True, extra_config={})
+                self.sources[page["name"]] = src.pk
+                check_source(src.pk)
+        except BaseException:
+            self.close()
+            raise
+
+    def run(self, page):
+        check_source(self.sources[page["name"]])
+
+    def close(self):
+        try:
+            checkruns.flush()
+            if self.user is not None:
+                self.user.delete()
+        finally:
+            captures.ENABLED, metrics.ENABLED = self.flags
+            self.server.close()
@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 
 from webnotify.models import NotificationSource
+from webnotify import checkruns
 from webnotify.tasks import check_source
 
 User = get_user_model()
@@ -72,4 +73,6 @@ class Command(BaseCommand):
                     f"[skip] Source {src.pk} ({src.name}) failed: {e}"
                 ))
 
+        checkruns.flush()
+
         self.stdout.write(self.style.SUCCESS(f"Checked sources: {checked}, New notifications: {created}"))
\ No newline at end of file
@@ -0,0 +1,212 @@
+import heapq
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from benchmarks import fakesite
+from webnotify import checkruns
+from webnotify.models import CheckRun, Notification, NotificationSource
+from webnotify.tasks import check_source
+
+# profile -> (fake-site query params, extra_config); mixed with --mix
+PROFILES = {
+    "plain": ({}, {}),
+    "etag": ({"validators": "1"}, {}),
+    "slow": ({"latency_ms": "500", "jitter_ms": "200"}, {}),
+    "throttled": ({"rate": "0.2"}, {}),
+    "redirect": ({"redirect": "2"}, {}),
+    "cookie": ({"cookie": "sid"}, {}),          # extra_config gets the right cookie
+    "expired": ({"cookie": "sid"}, {"cookies": {"sid": "stale"}}),
+    "js": ({"js": "1"}, {"rendered": True}),    # needs Playwright
+}
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PROFILES:
+            raise CommandError(f"unknown profile {name!r} (choose from {', '.join(PROFILES)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end checker throughput against a local fake site (benchmarks/fakesite.py): "
+        "creates N throwaway sources, runs check_source on them for a while, reports "
+        "checks/s, check latency p50/p99 and detection latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sources", "-n", type=int, default=50, help="Sources to create (default 50).")
+        parser.add_argument("--concurrency", "-c", type=int, default=8, help="Checker threads (default 8).")
+        parser.add_argument("--duration", "-d", type=float, default=60, help="Seconds to run (default 60).")
+        parser.add_argument("--interval", type=float, default=10,
+                            help="Seconds between checks of one source; 0 = back to back (default 10).")
+        parser.add_argument("--every", type=float, default=15,
+                            help="Seconds between unread-count increases on each page (default 15).")
+        parser.add_argument("--latency-ms", type=float, default=20, help="Base page latency (default 20).")
+        parser.add_argument("--size", type=int, default=fakesite.DEFAULT_SIZE, help="Page size in bytes.")
+        parser.add_argument("--mix", default="plain=4,etag=4,slow=1,throttled=1",
+                            help=f"Weighted profiles, e.g. plain=4,etag=2,js=1 (from: {', '.join(PROFILES)}).")
+        parser.add_argument("--site", help="Base URL of an already running fake site (default: start one).")
+        parser.add_argument("--keep", action="store_true", help="Keep the throwaway user and sources.")
+
+    def handle(self, *args, **opts):
+        mix = _parse_mix(opts["mix"])
+        site_proc, base = None, opts["site"]
+        if not base:
+            site_proc, base = self._start_site()
+        base = base.rstrip("/")
+        user = None
+        try:
+            requests.post(f"{base}/_reset", timeout=5)
+            t0 = time.time()
+            user, sources = self._create_sources(opts, mix, base, t0)
+            self.stdout.write(f"{len(sources)} sources on {base} ({opts['mix']}), "
+                              f"{opts['concurrency']} threads, {opts['duration']:.0f}s")
+            latencies, errors, started, ended = self._run(sources, opts)
+            checkruns.flush()
+            self._report(user, sources, latencies, errors, ended - started, t0, opts,
+                         requests.get(f"{base}/_stats", timeout=5).json())
+        finally:
+            if user is not None and not opts["keep"]:
+                user.delete()
+            if site_proc:
+                site_proc.terminate()
+                site_proc.wait(timeout=10)
+
+    # ----------------------------------------------------------------
+
+    def _start_site(self):
+        """Fake site in its own process, so it does not share the checkers' GIL."""
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fakesite", "--port", "0"],
+            stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.dirname(fakesite.__file__)),
+        )
+        line = proc.stdout.readline()  # "fake site on http://127.0.0.1:<port>/"
+        if "http" not in line:
+            proc.terminate()
+            raise CommandError(f"fake site did not start: {line!r}")
+        return proc, line.split(" on ", 1)[1].strip()
+
+    def _create_sources(self, opts, mix, base, t0):
+        user = get_user_model().objects.create_user(
+            email=f"checker-load-{os.getpid()}@localhost.invalid", password=None)
+        names = [name for name, weight in mix.items() for _ in range(weight)]
+        rows = []
+        for i in range(opts["sources"]):
+            profile = names[i % len(names)]
+            params, extra = PROFILES[profile]
+            query = {"t0": f"{t0:.3f}", "every": opts["every"], "latency_ms": opts["latency_ms"],
+                     "size": opts["size"], **params}
+            extra = dict(extra)
+            if profile == "cookie":
+                extra["cookies"] = {"sid": f"ok-{i}"}
+            rows.append(NotificationSource(
+                user=user, name=f"load {profile} {i}", enabled=True, extra_config=extra,
+                check_url=f"{base}/inbox/{i}?{urlencode(query)}",
+            ))
+        NotificationSource.objects.bulk_create(rows)
+        return user, {s.pk: s.name.split()[1] for s in NotificationSource.objects.filter(user=user)}
+
+    def _run(self, sources, opts):
+        """Worker threads take the source that is due first and re-queue it `interval` later."""
+        interval = max(0.0, opts["interval"])
+        due = [(0.0, pk) for pk in sources]
+        heapq.heapify(due)
+        lock = threading.Lock()
+        latencies, errors = [], Counter()
+        started = time.monotonic()
+        deadline = started + opts["duration"]
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        item = heapq.heappop(due) if due else None
+                    if item is None:  # more threads than sources: all are being checked
+                        if time.monotonic() >= deadline:
+                            return
+                        time.sleep(0.01)
+                        continue
+                    when, pk = item
+                    now = time.monotonic() - started
+                    if when > now:
+                        if started + when >= deadline:
+                            return
+                        time.sleep(when - now)
+                    if time.monotonic() >= deadline:
+                        return
+                    t = time.monotonic()
+                    try:
+                        check_source(pk)
+                    except Exception as e:
+                        errors[type(e).__name__] += 1
+                    elapsed = time.monotonic() - t
+                    with lock:
+                        latencies.append(elapsed * 1000)
+                        heapq.heappush(due, (max(time.monotonic() - started, when + interval), pk))
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, opts["concurrency"]))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies, errors, started, time.monotonic()
+
+    def _report(self, user, sources, latencies, errors, elapsed, t0, opts, site_stats):
+        checks = len(latencies)
+        self.stdout.write("")
+        self.stdout.write(f"checks            {checks} in {elapsed:.1f}s = {checks / elapsed:.1f}/s")
+        self.stdout.write(f"check latency     p50 {_percentile(latencies, 50):.0f} ms, "
+                          f"p99 {_percentile(latencies, 99):.0f} ms, max {max(latencies, default=0):.0f} ms")
+
+        runs = CheckRun.objects.filter(source__user=user)
+        outcomes = Counter(runs.values_list("outcome", flat=True))
+        self.stdout.write("outcomes          " + ", ".join(f"{k}={v}" for k, v in outcomes.most_common()))
+
+        by_profile = Counter()
+        for source_id, outcome in runs.values_list("source_id", "outcome"):
+            by_profile[(sources[source_id], outcome)] += 1
+        for profile in sorted({p for p, _ in by_profile}):
+            row = {o: n for (p, o), n in by_profile.items() if p == profile}
+            self.stdout.write(f"  {profile:<15} " + ", ".join(f"{k}={v}" for k, v in sorted(row.items())))
+
+        # the page showed `now` from change_time(now) on; a notification is that change detected
+        delays = []
+        for detected_at, meta in Notification.objects.filter(user=user).values_list("detected_at", "meta"):
+            count = (meta or {}).get("now")
+            if isinstance(count, int):
+                delays.append(detected_at.timestamp() - fakesite.change_time(t0, opts["every"], count))
+        if delays:
+            self.stdout.write(f"detection latency p50 {statistics.median(delays):.1f}s, "
+                              f"p99 {_percentile(delays, 99):.1f}s over {len(delays)} notifications")
+        else:
+            self.stdout.write("detection latency n/a (no count increases detected)")
+        self.stdout.write(f"site responses    {site_stats['status']}")
+        if errors:
+            self.stdout.write(self.style.WARNING("errors            " + ", ".join(
+                f"{k}={v}" for k, v in errors.most_common())))
@@ -0,0 +1,251 @@
+import random
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from importlib import import_module
+from urllib.parse import urljoin
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from webnotify.models import NotificationSource, UserSettings
+from webnotify.tasks import _create_notification
+
+from .seed_load import load_users
+
+DASHBOARD_POLL_SEC = 4.0  # dashboard.html's active poll
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Stats:
+    """Latency / status / query-count samples per endpoint, shared by all simulated clients."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.status = defaultdict(Counter)
+        self.queries = defaultdict(list)
+        self.delivery = []  # seconds from insert to a client holding the notification
+
+    def request(self, name, session, method, url, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            r = session.request(method, url, timeout=30, **kwargs)
+            code = r.status_code
+        except requests.RequestException as e:
+            r, code = None, type(e).__name__
+        ms = (time.perf_counter() - t0) * 1000
+        with self.lock:
+            self.latency[name].append(ms)
+            self.status[name][code] += 1
+            if r is not None and "X-DB-Queries" in r.headers:
+                self.queries[name].append(int(r.headers["X-DB-Queries"]))
+        return r
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the polling API against a running server: N desktop clients following "
+        "desktop_client/app.py (sync + acks, ringtone revalidation) and M dashboard tabs "
+        "polling /api/notifications/active/ every 4s, on users from manage.py seed_load. "
+        "Start the server with QUERY_COUNT_HEADER=1 to also get DB queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000/", help="Server under test.")
+        parser.add_argument("--clients", "-n", type=int, default=50, help="Desktop clients (default 50).")
+        parser.add_argument("--tabs", "-m", type=int, default=20, help="Dashboard tabs (default 20).")
+        parser.add_argument("--duration", "-d", type=float, default=60, help="Seconds to run (default 60).")
+        parser.add_argument("--poll", type=float,
+                            help="Override the server's poll_after for desktop clients (seconds).")
+        parser.add_argument("--notify-per-min", type=float, default=30,
+                            help="New notifications inserted per minute across all users (default 30).")
+        parser.add_argument("--stream", action="store_true",
+                            help="Desktop clients also hold the SSE stream and sync when it fires (needs ASGI).")
+
+    def handle(self, *args, **opts):
+        base = opts["base_url"]
+        users = list(load_users().order_by("pk"))
+        if not users:
+            raise CommandError("No load users: run manage.py seed_load first.")
+        keys = dict(UserSettings.objects.filter(user__in=users).values_list("user_id", "api_key"))
+        sources = defaultdict(list)
+        for src in NotificationSource.objects.filter(user__in=users).select_related("user"):
+            sources[src.user_id].append(src)
+        try:
+            requests.get(urljoin(base, "api/sync/"), timeout=5)
+        except requests.RequestException as e:
+            raise CommandError(f"Server not reachable at {base}: {e}")
+
+        stats = Stats()
+        created = {}  # notification id -> insert time (time.time())
+        stop = threading.Event()
+        deadline = time.monotonic() + opts["duration"]
+        threads = []
+        for i in range(opts["clients"]):
+            user = users[i % len(users)]
+            threads.append(threading.Thread(target=self._desktop, daemon=True, args=(
+                base, keys[user.pk], f"load-{i}", stats, created, stop, opts)))
+        for i in range(opts["tabs"]):
+            user = users[i % len(users)]
+            threads.append(threading.Thread(target=self._tab, daemon=True, args=(
+                base, self._session_cookie(user), stats, stop)))
+        if opts["notify_per_min"] > 0:
+            threads.append(threading.Thread(target=self._inject, daemon=True, args=(
+                [s for u in users[:max(opts["clients"], 1)] for s in sources[u.pk][:1]],
+                opts["notify_per_min"], created, stats, stop)))
+
+        self.stdout.write(f"{opts['clients']} desktop clients, {opts['tabs']} tabs on {len(users)} users "
+                          f"-> {base} for {opts['duration']:.0f}s")
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self.stderr.write("interrupted")
+        stop.set()
+        for t in threads:
+            t.join(timeout=35)
+        self._report(stats, time.monotonic() - started, len(created))
+
+    # ------------------------ simulated clients ------------------------
+
+    def _desktop(self, base, key, device, stats, created, stop, opts):
+        """desktop_client/app.py's Syncer (+ StreamListener with --stream)."""
+        http = requests.Session()
+        http.headers.update({"Authorization": f"ApiKey {key}", "X-WN-Device": device})
+        sync_url, sound_url = urljoin(base, "api/sync/"), urljoin(base, "api/sound/")
+        wake = threading.Event()
+        if opts["stream"]:
+            threading.Thread(target=self._stream, daemon=True,
+                             args=(urljoin(base, "api/notifications/stream/"), key, wake, stats, stop)).start()
+        stop.wait(random.uniform(0, 5))  # app.py's random startup offset
+        cursor, ack, ringtone_etag = None, None, None
+        while not stop.is_set():
+            payload = {"cursor": cursor}
+            if ack:
+                payload["ack"] = {"ids": ack, "played": True}
+            r = stats.request("sync", http, "POST", sync_url, json=payload)
+            if r is None or r.status_code != 200:
+                stop.wait(5)  # app.py backs off; a fixed pause is enough here
+                continue
+            js = r.json()
+            cursor = js.get("cursor")
+            got = [n["id"] for n in js.get("notifications") or []]
+            now = time.time()
+            with stats.lock:
+                stats.delivery.extend(now - created[i] for i in got if i in created)
+            ack = got or None  # the popup shows them; acked with the next sync, right away
+            settings_js = js.get("settings") or {}
+            etag = settings_js.get("default_ringtone_etag") if settings_js else ringtone_etag
+            if settings_js and etag != ringtone_etag:
+                headers = {"If-None-Match": f'"{ringtone_etag}"'} if ringtone_etag else {}
+                stats.request("sound", http, "GET", sound_url, headers=headers)
+                ringtone_etag = etag
+            if ack or js.get("has_more"):
+                continue
+            wait = opts["poll"] if opts["poll"] is not None else js.get("poll_after", 10)
+            wake.clear()
+            # with a live stream, a push wakes us early; either way stop ends the wait
+            for _ in range(int(max(wait, 0.1) * random.uniform(0.9, 1.1) / 0.1)):
+                if wake.is_set() or stop.is_set():
+                    break
+                time.sleep(0.1)
+
+    def _stream(self, url, key, wake, stats, stop):
+        http = requests.Session()
+        http.headers["Authorization"] = f"ApiKey {key}"
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                with http.get(url, stream=True, timeout=(10, 60), headers={"Accept": "text/event-stream"}) as r:
+                    with stats.lock:
+                        stats.status["stream"][r.status_code] += 1
+                        stats.latency["stream"].append((time.perf_counter() - t0) * 1000)
+                    if r.status_code != 200:
+                        stop.wait(10)
+                        continue
+                    for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                        if stop.is_set():
+                            return
+                        if line and line.startswith("event:"):
+                            wake.set()
+            except requests.RequestException as e:
+                with stats.lock:
+                    stats.status["stream"][type(e).__name__] += 1
+                stop.wait(2)
+
+    def _tab(self, base, cookies, stats, stop):
+        """dashboard.html: conditional GET of the active notification every 4s."""
+        http = requests.Session()
+        http.cookies.update(cookies)
+        url, etag = urljoin(base, "api/notifications/active/"), None
+        stop.wait(random.uniform(0, DASHBOARD_POLL_SEC))
+        while not stop.is_set():
+            r = stats.request("active", http, "GET", url, headers={"If-None-Match": etag} if etag else {})
+            if r is not None and r.status_code == 200:
+                etag = r.headers.get("ETag") or etag
+            stop.wait(DASHBOARD_POLL_SEC)
+
+    def _session_cookie(self, user):
+        """A logged-in session for `user`, created directly in the session store."""
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return {settings.SESSION_COOKIE_NAME: session.session_key}
+
+    def _inject(self, sources, per_min, created, stats, stop):
+        """New notifications through the checker's own insert path (versions bump, push)."""
+        try:
+            while sources and not stop.wait(random.expovariate(per_min / 60.0)):
+                src = random.choice(sources)
+                t = time.time()
+                notif = _create_notification(src, title=f"New messages on {src.name}",
+                                             message="Unread count: 1", meta={"detector": "count", "load": True})
+                with stats.lock:
+                    created[notif.pk] = t
+        finally:
+            close_old_connections()
+            connection.close()
+
+    # ------------------------------ report ------------------------------
+
+    def _report(self, stats, elapsed, inserted):
+        total = sum(len(v) for v in stats.latency.values())
+        self.stdout.write("")
+        self.stdout.write(f"{total} requests in {elapsed:.1f}s = {total / elapsed:.1f} req/s")
+        self.stdout.write(f"{'endpoint':<8} {'n':>7} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} "
+                          f"{'err%':>6} {'queries':>9}  statuses")
+        for name in sorted(stats.latency):
+            lat, codes = stats.latency[name], stats.status[name]
+            errors = sum(n for code, n in codes.items() if not (isinstance(code, int) and code < 400))
+            q = stats.queries.get(name)
+            queries = f"{statistics.mean(q):.1f}/{max(q)}" if q else "-"
+            self.stdout.write(
+                f"{name:<8} {len(lat):>7} {len(lat) / elapsed:>7.1f} {_percentile(lat, 50):>6.1f}ms "
+                f"{_percentile(lat, 95):>6.1f}ms {_percentile(lat, 99):>6.1f}ms "
+                f"{100 * errors / max(1, sum(codes.values())):>5.1f}% {queries:>9}  "
+                + ", ".join(f"{k}={v}" for k, v in sorted(codes.items(), key=str))
+            )
+        if not stats.queries:
+            self.stdout.write("(no X-DB-Queries headers: start the server with QUERY_COUNT_HEADER=1)")
+        d = stats.delivery
+        if d:
+            self.stdout.write(f"delivery: {len(d)}/{inserted} inserted notifications reached a client, "
+                              f"p50 {_percentile(d, 50):.2f}s, p99 {_percentile(d, 99):.2f}s")
+        elif inserted:
+            self.stdout.write(f"delivery: none of {inserted} inserted notifications reached a client")
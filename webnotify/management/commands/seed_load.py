@@ -0,0 +1,112 @@
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from webnotify import inbox
+from webnotify.authentication import hash_key
+from webnotify.models import AckWatermark, Notification, NotificationSource, UserSettings
+
+User = get_user_model()
+
+EMAIL_PREFIX = "load-"
+EMAIL_DOMAIN = "@localhost.invalid"
+
+
+def load_users():
+    """The users seed_load created (what manage.py loadtest drives)."""
+    return User.objects.filter(email__startswith=EMAIL_PREFIX, email__endswith=EMAIL_DOMAIN)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed throwaway users for load tests (manage.py loadtest): each with an API key, "
+        "sources and a notification history. Emails are load-<n>@localhost.invalid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="Users to create (default 100).")
+        parser.add_argument("--sources", type=int, default=5, help="Sources per user (default 5).")
+        parser.add_argument("--notifications", type=int, default=200,
+                            help="Notification history per user (default 200).")
+        parser.add_argument("--unread", type=int, default=2,
+                            help="How many of those are still unacknowledged (default 2).")
+        parser.add_argument("--password", default="loadtest", help="Password of every load user.")
+        parser.add_argument("--reset", action="store_true", help="Delete earlier load users first.")
+        parser.add_argument("--batch", type=int, default=5000, help="Rows per bulk insert.")
+
+    def handle(self, *args, **opts):
+        if opts["reset"]:
+            deleted = load_users().delete()[1].get(User._meta.label, 0)
+            self.stdout.write(f"Deleted {deleted} earlier load users.")
+        start = load_users().count()
+        n_users, batch = opts["users"], opts["batch"]
+        password = make_password(opts["password"])  # hashed once, shared
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(email=f"{EMAIL_PREFIX}{start + i}{EMAIL_DOMAIN}", password=password)
+                for i in range(n_users)
+            ], batch_size=batch)
+            users = list(User.objects.filter(email__in=[u.email for u in users]).order_by("pk"))
+
+            keys = [uuid.uuid4().hex for _ in users]
+            UserSettings.objects.bulk_create([
+                UserSettings(user=u, api_key=key, api_key_hash=hash_key(key))
+                for u, key in zip(users, keys)
+            ], batch_size=batch)
+
+            NotificationSource.objects.bulk_create([
+                # disabled: the checker never fetches these
+                NotificationSource(user=u, name=f"Load source {j}", enabled=False,
+                                   check_url=f"https://load-{j}.example.invalid/inbox", extra_config={})
+                for u in users for j in range(opts["sources"])
+            ], batch_size=batch)
+            source_ids = {}
+            for uid, sid in NotificationSource.objects.filter(user__in=users).values_list("user_id", "pk"):
+                source_ids.setdefault(uid, []).append(sid)
+
+            now = timezone.now()
+            per_user = opts["notifications"]
+            rows = []
+            for u in users:
+                sids = source_ids.get(u.pk) or [None]
+                for k in range(per_user):
+                    rows.append(Notification(
+                        user=u, source_id=sids[k % len(sids)],
+                        title=f"New messages on Load source {k % len(sids)}",
+                        message=f"Unread count: {k % 9 + 1}",
+                        detected_at=now - timedelta(minutes=per_user - k),
+                        meta={"detector": "count"},
+                    ))
+                if len(rows) >= batch:
+                    Notification.objects.bulk_create(rows, batch_size=batch)
+                    rows = []
+            Notification.objects.bulk_create(rows, batch_size=batch)
+
+            # everything but the newest --unread rows is acknowledged (watermark)
+            marks = []
+            unread = max(0, opts["unread"])
+            for uid, ids in _ids_by_user(users).items():
+                if len(ids) > unread:
+                    marks.append(AckWatermark(user_id=uid, device="", last_id=ids[-unread - 1] if unread else ids[-1]))
+            AckWatermark.objects.bulk_create(marks, batch_size=batch)
+
+        for u in users:
+            inbox.reconcile(u.pk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users x {opts['sources']} sources x {per_user} notifications "
+            f"({unread} unread each); {load_users().count()} load users in total."
+        ))
+
+
+def _ids_by_user(users):
+    out = {}
+    for uid, nid in Notification.objects.filter(user__in=users).order_by("pk").values_list("user_id", "pk"):
+        out.setdefault(uid, []).append(nid)
+    return out
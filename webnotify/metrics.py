@@ -0,0 +1,276 @@
+# webnotify/metrics.py
+"""
+Counters and histograms for check_source and the polling views, exposed in
+Prometheus text format on GET /metrics/.
+
+Every process (web workers, celery workers) keeps its samples in memory
+and adds the increments since its last push to one Redis hash
+("wn:metrics") at most every METRICS_PUSH_SECONDS, on a short-lived
+thread started by whichever call notices the interval is up (celery
+workers push the rest on shutdown). The endpoint pushes its own process
+and then reads the hash, so a scrape sees the sum over all processes. If
+Redis is unavailable it answers with this process's own totals.
+
+Families (FAMILIES below):
+  wn_check_stage_seconds{stage}            load, fetch, render, parse, persist, total
+  wn_checks_total{mode,outcome}            outcome as recorded in CheckRun
+  wn_check_fetch_status_total{code}        requests-mode HTTP status (304s included)
+  wn_check_render_fallback_total           requests-mode checks that had to render
+  wn_check_detector_total{detector}        detector behind the compared value
+  wn_http_request_seconds{view,status}     per URL name (MetricsMiddleware)
+
+Off unless METRICS_ENABLED: then every call returns at its first line,
+timer() hands out one shared no-op context manager, the middleware is
+not installed and /metrics/ answers 404.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import push
+
+logger = logging.getLogger(__name__)
+
+ENABLED = bool(getattr(settings, "METRICS_ENABLED", False))
+PUSH_SECONDS = float(getattr(settings, "METRICS_PUSH_SECONDS", 10))
+REDIS_KEY = "wn:metrics"
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+FAMILIES = {
+    "wn_check_stage_seconds": ("histogram", "check_source time per stage"),
+    "wn_checks_total": ("counter", "check_source runs by fetch mode and outcome"),
+    "wn_check_fetch_status_total": ("counter", "HTTP status codes answered to the requests fetch"),
+    "wn_check_render_fallback_total": ("counter", "requests-mode checks that fell back to a rendered fetch"),
+    "wn_check_detector_total": ("counter", "detector that produced the compared value"),
+    "wn_http_request_seconds": ("histogram", "request latency by URL name and status class"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_pending: Dict[Tuple[str, Labels], float] = {}   # increments not pushed to Redis yet
+_local: Dict[Tuple[str, Labels], float] = {}     # this process's totals
+_histograms: Dict = {}
+_pushed_at = time.monotonic()
+_pushing = False
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _add(samples) -> None:
+    global _pushing
+    with _lock:
+        for key, value in samples:
+            _pending[key] = _pending.get(key, 0.0) + value
+            _local[key] = _local.get(key, 0.0) + value
+        due = not _pushing and time.monotonic() - _pushed_at >= PUSH_SECONDS
+        if due:
+            _pushing = True
+    if due:
+        # off the caller's thread: never hold a check or a request on Redis
+        threading.Thread(target=push_pending, name="wn-metrics-push", daemon=True).start()
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    if not ENABLED:
+        return
+    _add([((name, _labels(labels)), value)])
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """One histogram observation; buckets are stored cumulative, as exported."""
+    if not ENABLED:
+        return
+    buckets, total, count = _series(name, _labels(labels))
+    samples = [(key, 1.0 if seconds <= le else 0.0) for key, le in zip(buckets, BUCKETS)]
+    samples.append((total, seconds))
+    samples.append((count, 1.0))
+    _add(samples)
+
+
+def _series(name: str, base: Labels):
+    """Sample keys of one histogram series, built once."""
+    keys = _histograms.get((name, base))
+    if keys is None:
+        buckets = [(f"{name}_bucket", base + (("le", _fmt_le(le)),)) for le in BUCKETS]
+        keys = _histograms[(name, base)] = (buckets, (f"{name}_sum", base), (f"{name}_count", base))
+    return keys
+
+
+def observe_since(name: str, t0: float, **labels) -> None:
+    """observe() the time since a time.monotonic() reading."""
+    if not ENABLED:
+        return
+    observe(name, time.monotonic() - t0, **labels)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "t0")
+
+    def __init__(self, name, labels):
+        self.name, self.labels = name, labels
+
+    def __enter__(self):
+        self.t0 = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        observe_since(self.name, self.t0, **self.labels)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def timer(name: str, **labels):
+    """with metrics.timer("wn_check_stage_seconds", stage="load"): ..."""
+    if not ENABLED:
+        return _NOOP
+    return _Timer(name, labels)
+
+
+def record_check(run: Dict) -> None:
+    """Counters for one finished check_source run (checkruns.new_run() dict)."""
+    if not ENABLED or not run.get("outcome"):
+        return
+    inc("wn_checks_total", mode=run.get("mode") or "-", outcome=run["outcome"])
+    if run.get("status_code") is not None:
+        inc("wn_check_fetch_status_total", code=run["status_code"])
+    if run.get("detector"):
+        inc("wn_check_detector_total", detector=run["detector"])
+
+
+# --------------------------- Redis aggregation ---------------------------
+
+def _field(key) -> str:
+    name, labels = key
+    return json.dumps([name, labels], separators=(",", ":"))
+
+
+def push_pending() -> None:
+    """Add this process's unpushed increments to the shared hash."""
+    global _pending, _pushed_at, _pushing
+    with _lock:
+        batch, _pending, _pushed_at = _pending, {}, time.monotonic()
+    try:
+        if not batch:
+            return
+        pipe = push._redis().pipeline(transaction=False)
+        for key, value in batch.items():
+            pipe.hincrbyfloat(REDIS_KEY, _field(key), value)
+        pipe.execute()
+    except Exception as e:
+        # keep them for the next push; the key set is bounded, so this cannot grow
+        with _lock:
+            for key, value in batch.items():
+                _pending[key] = _pending.get(key, 0.0) + value
+        logger.warning("metrics push failed: %s", e)
+    finally:
+        with _lock:
+            _pushing = False
+
+
+def _shared():
+    push_pending()
+    samples = {}
+    for field, value in push._redis().hgetall(REDIS_KEY).items():
+        name, labels = json.loads(field)
+        samples[(name, tuple(tuple(pair) for pair in labels))] = float(value)
+    return samples
+
+
+# ------------------------------ exposition ------------------------------
+
+def _fmt_le(le: float) -> str:
+    return "+Inf" if le == float("inf") else repr(le)
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(v)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _family(name: str) -> str:
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in FAMILIES:
+            return name[: -len(suffix)]
+    return name
+
+
+def _sort_key(item):
+    (name, labels), _ = item
+    plain = tuple(pair for pair in labels if pair[0] != "le")
+    le = next((float(v) for k, v in labels if k == "le"), 0.0)
+    return _family(name), plain, name, le
+
+
+def exposition() -> str:
+    """Prometheus text format (version 0.0.4) of every process's samples."""
+    try:
+        samples, scope = _shared(), "all processes"
+    except Exception as e:
+        logger.warning("metrics read from Redis failed: %s", e)
+        with _lock:
+            samples, scope = dict(_local), "this process only (Redis unavailable)"
+    lines, family = [f"# wn metrics: {scope}"], None
+    for (name, labels), value in sorted(samples.items(), key=_sort_key):
+        if _family(name) != family:
+            family = _family(name)
+            kind, help_text = FAMILIES.get(family, ("untyped", ""))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+        rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        lines.append(f"{name}{{{rendered}}} {_fmt_value(value)}" if rendered else f"{name} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------ middleware ------------------------------
+
+def _observe_request(request, response, t0) -> None:
+    match = getattr(request, "resolver_match", None)
+    observe_since(
+        "wn_http_request_seconds", t0,
+        view=(match.url_name or match.view_name) if match else "-",
+        status=f"{response.status_code // 100}xx",
+    )
+
+
+class MetricsMiddleware:
+    """
+    Latency per URL name, for the polling views above all. Installed only
+    when METRICS_ENABLED (settings.py). Long-polls count their wait and
+    streaming responses (SSE) the time to the first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        t0 = time.monotonic()
+        response = self.get_response(request)
+        _observe_request(request, response, t0)
+        return response
+
+    async def __acall__(self, request):
+        t0 = time.monotonic()
+        response = await self.get_response(request)
+        _observe_request(request, response, t0)
+        return response
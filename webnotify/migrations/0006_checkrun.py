@@ -0,0 +1,67 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0005_usersettings_api_key_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('mode', models.CharField(max_length=16)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('bytes', models.PositiveIntegerField(default=0)),
+                ('fetch_ms', models.PositiveIntegerField(default=0)),
+                ('render_ms', models.PositiveIntegerField(default=0)),
+                ('parse_ms', models.PositiveIntegerField(default=0)),
+                ('detector', models.CharField(blank=True, max_length=32)),
+                ('outcome', models.CharField(max_length=16)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='check_runs', to='webnotify.notificationsource')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='CheckRunRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('bucket', models.DateTimeField()),
+                ('mode', models.CharField(max_length=16)),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('bytes_sum', models.BigIntegerField(default=0)),
+                ('fetch_ms_sum', models.BigIntegerField(default=0)),
+                ('fetch_ms_max', models.PositiveIntegerField(default=0)),
+                ('render_ms_sum', models.BigIntegerField(default=0)),
+                ('render_ms_max', models.PositiveIntegerField(default=0)),
+                ('parse_ms_sum', models.BigIntegerField(default=0)),
+                ('parse_ms_max', models.PositiveIntegerField(default=0)),
+                ('outcomes', models.JSONField(default=dict)),
+                ('detectors', models.JSONField(default=dict)),
+                ('status_codes', models.JSONField(default=dict)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='check_rollups', to='webnotify.notificationsource')),
+            ],
+            options={
+                'ordering': ('-bucket',),
+                'indexes': [models.Index(fields=['period', 'bucket'], name='webnotify_c_period_2f8f0f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='checkrunrollup',
+            constraint=models.UniqueConstraint(fields=('source', 'period', 'bucket', 'mode'), name='uniq_checkrun_rollup'),
+        ),
+        migrations.AddIndex(
+            model_name='checkrun',
+            index=models.Index(fields=['source', 'created_at'], name='webnotify_c_source__78c1a1_idx'),
+        ),
+    ]
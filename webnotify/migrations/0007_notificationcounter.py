@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0006_checkrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unseen', models.IntegerField(default=0)),
+                ('unplayed', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='webnotify.notificationsource')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='notificationcounter',
+            constraint=models.UniqueConstraint(fields=('user', 'source'), name='uniq_counter_user_source'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificationcounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('source__isnull', True)), fields=('user',), name='uniq_counter_user_total'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0007_notificationcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AckWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.CharField(blank=True, default='', max_length=64)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ack_watermarks', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ackwatermark',
+            constraint=models.UniqueConstraint(fields=('user', 'device'), name='uniq_ack_watermark_user_device'),
+        ),
+    ]
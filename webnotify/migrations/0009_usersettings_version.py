@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0008_ackwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersettings',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
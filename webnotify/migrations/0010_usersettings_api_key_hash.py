@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:56
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_api_key_hash(apps, schema_editor):
+    UserSettings = apps.get_model("webnotify", "UserSettings")
+    for us in UserSettings.objects.exclude(api_key__isnull=True).exclude(api_key="").only("pk", "api_key").iterator():
+        UserSettings.objects.filter(pk=us.pk).update(
+            api_key_hash=hashlib.sha256(us.api_key.encode("utf-8")).hexdigest(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0009_usersettings_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersettings',
+            name='api_key_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_api_key_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0010_usersettings_api_key_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-detected_at', '-id'], name='notif_user_detected_idx'),
+        ),
+    ]
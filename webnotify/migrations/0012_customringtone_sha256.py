@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:01
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_sha256(apps, schema_editor):
+    CustomRingtone = apps.get_model("webnotify", "CustomRingtone")
+    for rt in CustomRingtone.objects.filter(sha256="").exclude(file="").iterator():
+        digest = hashlib.sha256()
+        try:
+            with rt.file.open("rb") as fh:
+                for chunk in iter(lambda: fh.read(64 * 1024), b""):
+                    digest.update(chunk)
+        except OSError:
+            continue  # file gone; keeps the id/size based ETag
+        CustomRingtone.objects.filter(pk=rt.pk).update(sha256=digest.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0011_notification_user_detected_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customringtone',
+            name='sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(fill_sha256, migrations.RunPython.noop),
+    ]
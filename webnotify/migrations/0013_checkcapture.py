@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webnotify', '0012_customringtone_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckCapture',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('reason', models.CharField(max_length=16)),
+                ('mode', models.CharField(max_length=16)),
+                ('outcome', models.CharField(blank=True, max_length=16)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('url', models.URLField(max_length=2048)),
+                ('total_ms', models.PositiveIntegerField(default=0)),
+                ('timings', models.JSONField(default=dict)),
+                ('request_headers', models.JSONField(default=dict)),
+                ('response_headers', models.JSONField(default=dict)),
+                ('trace', models.JSONField(default=dict)),
+                ('content_kind', models.CharField(blank=True, max_length=8)),
+                ('codec', models.CharField(blank=True, max_length=8)),
+                ('body', models.BinaryField(blank=True, default=b'')),
+                ('body_bytes', models.PositiveIntegerField(default=0)),
+                ('stored_bytes', models.PositiveIntegerField(default=0)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='captures', to='webnotify.notificationsource')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['source', 'created_at'], name='webnotify_c_source__15637e_idx')],
+            },
+        ),
+    ]
@@ -3,7 +3,7 @@ import uuid
 from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 
@@ -42,6 +42,16 @@ class User(AbstractUser):
 
     objects = UserManager()   # <<< FIX: attach custom manager here
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.is_active:
+            from .authentication import forget
+
+            # the API-key caches only remember active users; drop this one's key now
+            key_hash = UserSettings.objects.filter(user_id=self.pk).values_list("api_key_hash", flat=True).first()
+            if key_hash:
+                transaction.on_commit(lambda: forget(key_hash))
+
     def __str__(self):
         return self.email
 
@@ -91,6 +101,7 @@ class CustomRingtone(models.Model):
     name = models.CharField(max_length=140, blank=True)
     file = models.FileField(upload_to="ringtones/%Y/%m/%d/")
     size_bytes = models.PositiveIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, default="")  # content hash; the download ETag
     duration_seconds = models.PositiveIntegerField(null=True, blank=True)  # optional, we can fill later
     created_at = models.DateTimeField(auto_now_add=True)
     is_default = models.BooleanField(default=False)
@@ -101,6 +112,13 @@ class CustomRingtone(models.Model):
     def __str__(self):
         return self.name or f"ringtone-{self.pk}"
 
+    @property
+    def etag(self) -> str:
+        """Strong ETag of the file contents; clients compare it before re-downloading."""
+        if self.sha256:
+            return f'"{self.sha256}"'
+        return f'"rt{self.pk}-{self.size_bytes or 0}"'
+
 
 
 
@@ -122,6 +140,10 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ("-detected_at",)
+        indexes = [
+            # keyset pagination of a user's list (NotificationCursorListAPI)
+            models.Index(fields=["user", "-detected_at", "-id"], name="notif_user_detected_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title or 'Notification'} [{self.user}]"
@@ -139,6 +161,25 @@ class UserSettings(models.Model):
 
     # NEW: simple API key for desktop client
     api_key = models.CharField(max_length=64, unique=True, blank=True, null=True)
+    # sha256(api_key); the index API-key auth looks keys up through (see authentication.py)
+    api_key_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)
+
+    # bumped on every inbox/settings/ringtone change; ETag source (see versions.py)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        from .authentication import forget, hash_key
+
+        # keep the lookup hash in step with the key; a rotated key stops working at once
+        new_hash = hash_key(self.api_key) if self.api_key else None
+        old_hash = self.api_key_hash
+        if new_hash != old_hash:
+            self.api_key_hash = new_hash
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "api_key_hash"}
+        super().save(*args, **kwargs)
+        if old_hash and new_hash != old_hash:
+            transaction.on_commit(lambda: forget(old_hash))
 
     def ensure_api_key(self):
         if not self.api_key:
@@ -147,4 +188,140 @@ class UserSettings(models.Model):
             self.save(update_fields=["api_key"])
 
     def __str__(self):
-        return f"Settings({self.user})"
\ No newline at end of file
+        return f"Settings({self.user})"
+
+
+
+class CheckRun(models.Model):
+    """
+    One row per executed check_source() run (append-only).
+    Written in bulk by the checker and expired after CHECKRUN_RETENTION_DAYS;
+    long-term numbers live in CheckRunRollup.
+    """
+    source = models.ForeignKey(NotificationSource, on_delete=models.CASCADE, related_name="check_runs")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    mode = models.CharField(max_length=16)                        # requests | rendered | edge
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    bytes = models.PositiveIntegerField(default=0)
+    fetch_ms = models.PositiveIntegerField(default=0)
+    render_ms = models.PositiveIntegerField(default=0)
+    parse_ms = models.PositiveIntegerField(default=0)
+    detector = models.CharField(max_length=32, blank=True)         # gmail | title | badges | text | text-hash
+    outcome = models.CharField(max_length=16)                     # not_modified | fetch_failed | baseline | rebaselined | notified | unchanged | error | edge | invalid
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [models.Index(fields=["source", "created_at"])]
+
+    def __str__(self):
+        return f"CheckRun({self.source_id}, {self.outcome})"
+
+
+class CheckRunRollup(models.Model):
+    """
+    Hourly / daily aggregates of CheckRun per source.
+    Sums are kept (not averages) so rollups can be re-aggregated.
+    """
+    PERIOD_HOUR = "hour"
+    PERIOD_DAY = "day"
+    PERIOD_CHOICES = ((PERIOD_HOUR, "Hour"), (PERIOD_DAY, "Day"))
+
+    source = models.ForeignKey(NotificationSource, on_delete=models.CASCADE, related_name="check_rollups")
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()                               # start of the hour / day (UTC)
+    mode = models.CharField(max_length=16)
+    runs = models.PositiveIntegerField(default=0)
+    bytes_sum = models.BigIntegerField(default=0)
+    fetch_ms_sum = models.BigIntegerField(default=0)
+    fetch_ms_max = models.PositiveIntegerField(default=0)
+    render_ms_sum = models.BigIntegerField(default=0)
+    render_ms_max = models.PositiveIntegerField(default=0)
+    parse_ms_sum = models.BigIntegerField(default=0)
+    parse_ms_max = models.PositiveIntegerField(default=0)
+    outcomes = models.JSONField(default=dict)                     # {"not_modified": 12, "notified": 1, ...}
+    detectors = models.JSONField(default=dict)                    # {"badges": 10, "text-hash": 3, ...}
+    status_codes = models.JSONField(default=dict)                 # {"200": 10, "304": 12, ...}
+
+    class Meta:
+        ordering = ("-bucket",)
+        constraints = [
+            models.UniqueConstraint(fields=["source", "period", "bucket", "mode"], name="uniq_checkrun_rollup"),
+        ]
+        indexes = [models.Index(fields=["period", "bucket"])]
+
+    def __str__(self):
+        return f"Rollup({self.source_id}, {self.period}, {self.bucket:%Y-%m-%d %H:00})"
+
+
+class CheckCapture(models.Model):
+    """
+    Snapshot of a slow, failed or surprising check_source() run: what was
+    fetched (compressed), headers, timings and the detector trace.
+    Written by webnotify/captures.py, which keeps it a bounded ring buffer.
+    """
+    source = models.ForeignKey(NotificationSource, on_delete=models.CASCADE, related_name="captures")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    reason = models.CharField(max_length=16)                      # error | slow | count_jump | count_lost | debug
+    mode = models.CharField(max_length=16)
+    outcome = models.CharField(max_length=16, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    url = models.URLField(max_length=2048)
+    total_ms = models.PositiveIntegerField(default=0)
+    timings = models.JSONField(default=dict)                      # {"fetch_ms": .., "render_ms": .., "parse_ms": ..}
+    request_headers = models.JSONField(default=dict)              # credentials redacted
+    response_headers = models.JSONField(default=dict)
+    trace = models.JSONField(default=dict)                        # detector result, previous count, error
+    content_kind = models.CharField(max_length=8, blank=True)     # response | dom | "" (nothing fetched)
+    codec = models.CharField(max_length=8, blank=True)            # zstd | gzip
+    body = models.BinaryField(blank=True, default=b"")
+    body_bytes = models.PositiveIntegerField(default=0)           # before compression (and truncation)
+    stored_bytes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [models.Index(fields=["source", "created_at"])]
+
+    def __str__(self):
+        return f"CheckCapture({self.source_id}, {self.reason})"
+
+
+class NotificationCounter(models.Model):
+    """
+    Maintained unseen/unplayed counts so badges never COUNT(*) the notifications table.
+    source=None is the per-user total; other rows are per source.
+    Kept in step by webnotify/inbox.py, drift fixed by tasks.reconcile_counters.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notification_counters")
+    source = models.ForeignKey(NotificationSource, on_delete=models.CASCADE, null=True, blank=True, related_name="counters")
+    unseen = models.IntegerField(default=0)
+    unplayed = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "source"], name="uniq_counter_user_source"),
+            models.UniqueConstraint(fields=["user"], condition=models.Q(source__isnull=True), name="uniq_counter_user_total"),
+        ]
+
+    def __str__(self):
+        return f"Counter({self.user_id}, {self.source_id or 'total'}: {self.unseen}/{self.unplayed})"
+
+
+class AckWatermark(models.Model):
+    """
+    High-water mark of acknowledged notifications: every notification with
+    id <= last_id counts as seen+played, whatever its row flags say.
+    device="" is the user-wide mark; other values are per desktop/browser client.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="ack_watermarks")
+    device = models.CharField(max_length=64, blank=True, default="")
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "device"], name="uniq_ack_watermark_user_device"),
+        ]
+
+    def __str__(self):
+        return f"Watermark({self.user_id}, {self.device or '*'}: {self.last_id})"
@@ -0,0 +1,170 @@
+# webnotify/push.py
+"""
+Real-time delivery over Redis pub/sub.
+
+Publishing (sync, from tasks/views): inbox.py publishes after commit on
+the per-user channel "wn:push:<user_id>":
+    {"type": "notification", "notification": {...}}   a new notification
+    {"type": "ack"}                                   something was acknowledged/cleared
+    {"type": "settings"}                              settings / default ringtone changed
+
+Consuming (async, ASGI): each web process keeps ONE pattern subscription
+(the Hub) and fans messages out to in-process asyncio queues, one per
+open SSE stream / long-poll request. Open connections therefore cost no
+Redis connections and no DB queries while idle.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = getattr(settings, "WN_REDIS_URL", "redis://localhost:6380/0")
+CHANNEL_PREFIX = "wn:push:"
+
+_client = None
+
+
+def channel(user_id) -> str:
+    return f"{CHANNEL_PREFIX}{user_id}"
+
+
+# --------------------------- publish (sync) ---------------------------
+
+def _redis():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+
+def publish(user_id, event: dict) -> None:
+    try:
+        _redis().publish(channel(user_id), json.dumps(event, cls=DjangoJSONEncoder))
+    except Exception as e:
+        # pushes are best effort; pollers still see everything via the DB/cache
+        logger.warning("push publish failed for user %s: %s", user_id, e)
+
+
+def notification_event(notif) -> dict:
+    return {
+        "id": notif.pk,
+        "title": notif.title,
+        "message": notif.message,
+        "link": notif.link,
+        "detected_at": notif.detected_at.isoformat(),
+        "seen": notif.seen,
+        "played": notif.played,
+        "source_name": notif.source.name if notif.source_id and notif.source else None,
+    }
+
+
+def publish_notification(notif) -> None:
+    publish(notif.user_id, {"type": "notification", "notification": notification_event(notif)})
+
+
+def publish_ack(user_id) -> None:
+    publish(user_id, {"type": "ack"})
+
+
+def publish_settings(user_id) -> None:
+    publish(user_id, {"type": "settings"})
+
+
+# --------------------------- subscribe (async) ---------------------------
+
+class Hub:
+    """One Redis pattern subscription per event loop, fanned out to local queues."""
+
+    QUEUE_SIZE = 100
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queues = defaultdict(set)
+        self.connected = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def attach(self, user_id) -> asyncio.Queue:
+        q = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.queues[int(user_id)].add(q)
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self._run())
+        return q
+
+    def detach(self, user_id, q) -> None:
+        qs = self.queues.get(int(user_id))
+        if qs is not None:
+            qs.discard(q)
+            if not qs:
+                self.queues.pop(int(user_id), None)
+
+    async def wait_connected(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _dispatch(self, raw_channel, raw_data) -> None:
+        try:
+            name = raw_channel.decode() if isinstance(raw_channel, bytes) else raw_channel
+            uid = int(name[len(CHANNEL_PREFIX):])
+            event = json.loads(raw_data)
+        except Exception:
+            return
+        for q in list(self.queues.get(uid, ())):
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # slow consumer; it will resync from the DB on reconnect
+
+    async def _run(self):
+        import redis.asyncio as aioredis
+
+        backoff = 1.0
+        while True:
+            client = pubsub = None
+            try:
+                client = aioredis.from_url(REDIS_URL)
+                pubsub = client.pubsub()
+                await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+                self.connected.set()
+                backoff = 1.0
+                async for msg in pubsub.listen():
+                    if msg.get("type") == "pmessage":
+                        self._dispatch(msg.get("channel"), msg.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("push hub disconnected: %s", e)
+            finally:
+                self.connected.clear()
+                for closer in (pubsub, client):
+                    try:
+                        if closer is not None:
+                            await closer.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+_hubs = {}
+
+
+def hub() -> Hub:
+    """The Hub for the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    h = _hubs.get(loop)
+    if h is None:
+        # drop hubs of loops that are gone (e.g. async views under WSGI)
+        for old in [lp for lp in _hubs if lp.is_closed()]:
+            _hubs.pop(old, None)
+        h = _hubs[loop] = Hub(loop)
+    return h
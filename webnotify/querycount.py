@@ -0,0 +1,90 @@
+# webnotify/querycount.py
+"""
+Per-request DB query accounting for load tests (manage.py loadtest).
+
+QueryCountMiddleware adds to every response:
+  X-DB-Queries   queries run by this request, on every database alias
+  X-DB-Time      their total time in ms
+
+It is only installed when QUERY_COUNT_HEADER is on (settings.py), so
+production pays nothing for it. Streaming responses (SSE) report what ran
+before the first byte.
+
+The counter lives in a context variable and every connection carries one
+execute wrapper that adds to it. Async views run their queries through
+sync_to_async, on other threads with their own connections, and the
+context travels with them. The middleware is async-capable, so the
+handler chain stays async and the numbers match production's.
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+class _Counter:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_current: ContextVar[Optional[_Counter]] = ContextVar("wn_query_counter", default=None)
+
+
+def _count(execute, sql, params, many, context):
+    counter = _current.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.queries += 1
+        counter.seconds += time.perf_counter() - t0
+
+
+def _install(connection, **_kwargs):
+    if _count not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count)
+
+
+class QueryCountMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(_install, dispatch_uid="wn_querycount")
+        for conn in connections.all(initialized_only=True):
+            _install(conn)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = _Counter()
+        token = _current.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _tag(response, counter)
+
+    async def __acall__(self, request):
+        counter = _Counter()
+        token = _current.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _tag(response, counter)
+
+
+def _tag(response, counter):
+    response["X-DB-Queries"] = str(counter.queries)
+    response["X-DB-Time"] = f"{counter.seconds * 1000:.1f}"
+    return response
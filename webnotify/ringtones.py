@@ -0,0 +1,134 @@
+# webnotify/ringtones.py
+"""
+Ringtone storage + delivery.
+
+Uploads are streamed into storage chunk by chunk while their sha256 is
+computed (CustomRingtone.sha256). Downloads (/api/sound/) are:
+
+  * conditional: strong ETag = content hash, 304 on If-None-Match;
+  * streamed from storage in fixed-size chunks (constant memory);
+  * Range-capable: a single "bytes=a-b" range is answered 206;
+  * optionally offloaded to the front web server when RINGTONE_SENDFILE is
+    "nginx" (X-Accel-Redirect to RINGTONE_SENDFILE_PREFIX + file name, an
+    internal location aliased to MEDIA_ROOT) or "apache" (X-Sendfile with
+    the absolute path). The front server then handles ranges itself.
+"""
+import hashlib
+import mimetypes
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+SENDFILE = (getattr(settings, "RINGTONE_SENDFILE", "") or "").lower()
+SENDFILE_PREFIX = getattr(settings, "RINGTONE_SENDFILE_PREFIX", "/protected-media/")
+CACHE_CONTROL = "private, no-cache"  # same URL, new content on change: always revalidate
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def save_upload(uploaded, relpath: str):
+    """Stream an UploadedFile into default_storage. Returns (saved name, sha256 hex)."""
+    digest = hashlib.sha256()
+    for chunk in uploaded.chunks():
+        digest.update(chunk)
+    uploaded.seek(0)
+    return default_storage.save(relpath, uploaded), digest.hexdigest()
+
+
+def _content_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _byte_range(header: str, size: int):
+    """(start, end) inclusive for a single satisfiable range, None for "serve it all", False if unsatisfiable."""
+    m = _RANGE_RE.match((header or "").replace(" ", ""))
+    if not m or size <= 0:
+        return None  # absent, multi-range or malformed: ignore and send 200
+    first, last = m.groups()
+    if first == "":
+        if last == "":
+            return None
+        start, end = max(0, size - int(last)), size - 1   # suffix: last N bytes
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _stream(fh, start: int, length: int):
+    """Yield `length` bytes from `start` of an already open file, then close it."""
+    try:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fh.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+def _local_path(field_file):
+    try:
+        return field_file.path
+    except NotImplementedError:
+        return None  # remote storage: no sendfile
+
+
+def ringtone_response(request, ringtone):
+    """GET/HEAD response for one CustomRingtone (304 / 200 / 206 / 416)."""
+    field_file = ringtone.file
+    etag = ringtone.etag
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["Cache-Control"] = CACHE_CONTROL
+        return not_modified
+
+    size = ringtone.size_bytes or field_file.size
+    content_type = _content_type(field_file.name)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": http_date(ringtone.created_at.timestamp()),
+    }
+
+    path = _local_path(field_file) if SENDFILE else None
+    if path and SENDFILE == "nginx":
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response["X-Accel-Redirect"] = SENDFILE_PREFIX.rstrip("/") + "/" + field_file.name
+        return response
+    if path and SENDFILE == "apache":
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response["X-Sendfile"] = path
+        return response
+
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if not if_range or if_range == etag:
+        byte_range = _byte_range(request.headers.get("Range", ""), size)
+    if byte_range is False:
+        response = HttpResponse(status=416, headers=headers)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = max(0, end - start + 1)
+    # open before answering: a missing file must fail here, where the view
+    # can still turn it into a 204, not halfway through a 200
+    body = _stream(field_file.open("rb"), start, length) if request.method != "HEAD" else iter(())
+    response = StreamingHttpResponse(body, content_type=content_type, headers=headers)
+    response["Content-Length"] = str(length)
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
@@ -1,3 +1,4 @@
+from django.db.models import F
 from rest_framework import serializers
 from .models import Notification, NotificationSource, UserSettings, CustomRingtone
 
@@ -11,6 +12,29 @@ class NotificationSerializer(serializers.ModelSerializer):
     def get_source_name(self, obj):
         return obj.source.name if obj.source else None
 
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        # everything at/below the ack watermark is acknowledged whatever its row flags say
+        if obj.pk <= self.context.get("watermark", 0):
+            data["seen"] = data["played"] = True
+        return data
+
+
+# Lean path for list endpoints: same fields as NotificationSerializer, read
+# with Notification.objects.values(*NOTIFICATION_VALUES, **NOTIFICATION_VALUE_EXPRS)
+# and fixed up as plain dicts (no per-instance serializer work).
+NOTIFICATION_VALUES = ("id", "title", "message", "link", "detected_at", "seen", "played")
+NOTIFICATION_VALUE_EXPRS = {"source_name": F("source__name")}
+
+
+def notification_rows(rows, watermark=0):
+    out = []
+    for row in rows:
+        if row["id"] <= watermark:
+            row["seen"] = row["played"] = True
+        out.append(row)
+    return out
+
 
 class NotificationSourceSerializer(serializers.ModelSerializer):
     class Meta:
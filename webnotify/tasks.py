@@ -1,35 +1,23 @@
 # webnotify/tasks.py
-from contextlib import contextmanager
 import hashlib
 import logging
-import re
+import time
 from typing import Dict, Tuple, Optional
-import os
 
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 import requests
-from bs4 import BeautifulSoup
 from django.db import transaction
 from django.utils import timezone
 from celery import shared_task
+from celery.signals import worker_process_shutdown
 
+from . import captures, checkruns, db_router, detection, edge, inbox, metrics
 from .models import NotificationSource, Notification
 
 logger = logging.getLogger(__name__)
 
-# Generic keywords that commonly appear near inbox/notification badges
-KEYWORDS = re.compile(r"\b(inbox|message|messages|notification|notifications|alert|alerts)\b", re.I)
-
-# A sane desktop UA helps some sites behave correctly
-DEFAULT_HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-    )
-}
-
 # ------------------------- helpers (state) -------------------------
 
 
@@ -37,10 +25,39 @@ def _get_extra(src: NotificationSource) -> Dict:
     return src.extra_config or {}
 
 
+# extra_config keys written by cookie uploads (views.py), never by a check
+UPLOADED_KEYS = ("cookies", "headers")
+
+
 def _save_extra(src: NotificationSource, extra: Dict):
-    src.extra_config = extra
-    src.last_checked = timezone.now()
-    src.save(update_fields=["extra_config", "last_checked"])
+    # a check runs for seconds on the extra_config it read at the start; keep
+    # any cookies uploaded meanwhile (source_cookies_delta_by_key) instead of
+    # writing the stale ones back
+    with transaction.atomic():
+        current = (
+            NotificationSource.objects.select_for_update()
+            .filter(pk=src.pk).values_list("extra_config", flat=True).first()
+        ) or {}
+        extra = {k: v for k, v in extra.items() if k not in UPLOADED_KEYS}
+        extra.update({k: current[k] for k in UPLOADED_KEYS if k in current})
+        src.extra_config = extra
+        src.last_checked = timezone.now()
+        src.save(update_fields=["extra_config", "last_checked"])
+
+
+def _create_notification(src: NotificationSource, **fields) -> Notification:
+    """Insert a Notification for the source's owner and update the inbox counters."""
+    with transaction.atomic():
+        notif = Notification.objects.create(
+            user=src.user,
+            source=src,
+            detected_at=timezone.now(),
+            seen=False,
+            played=False,
+            **fields,
+        )
+        inbox.record_created(notif)
+    return notif
 
 
 # --------------------- fingerprint-based change -------------------
@@ -91,218 +108,13 @@ def _build_cookies(extra: Dict) -> Dict[str, str]:
 
 def _build_headers(extra: Dict) -> Dict[str, str]:
     # Allow future overrides, keep simple for now
-    headers = dict(DEFAULT_HEADERS)
+    headers = dict(detection.DEFAULT_HEADERS)
     user_headers = extra.get("headers") or {}
     for k, v in user_headers.items():
         headers[str(k)] = str(v)
     return headers
 
 
-# --------------------- content parsing (counts) -------------------
-
-
-def _visible_text(soup: BeautifulSoup) -> str:
-    for script in soup(["script", "style", "noscript", "template"]):
-        script.decompose()
-    return soup.get_text("\n", strip=True)
-
-
-def _gmail_unread_count(soup: BeautifulSoup) -> Optional[int]:
-    """
-    Count Gmail unread rows (modern Gmail marks unread rows with class zA zE).
-    This function tries several heuristics and returns an integer or None.
-    """
-    try:
-        # modern Gmail (web UI): rows with classes 'zA zE' indicate unread
-        nodes = soup.select("tr.zA.zE, .zA.zE, .zA.zE *")
-        if nodes:
-            # prefer counting unique row containers (some selectors return child nodes)
-            rows = soup.select("tr.zA.zE")
-            if rows:
-                return len(rows)
-            # fallback: count unique elements matching .zA.zE
-            return len({elem for elem in nodes})
-
-        # class 'unread' or 'bsu' variants
-        nodes = soup.select(".unread, .unread-count, .bsu")
-        if nodes:
-            return len(nodes)
-
-        # try title like "(3) Inbox"
-        try:
-            title = (soup.title.string or "").strip()
-        except Exception:
-            title = ""
-        m = re.search(r"^\s*\((\d{1,4})\)\s*Inbox", title)
-        if m:
-            return int(m.group(1))
-
-        # fallback: scan visible text for "Inbox (N)" or "Unread N"
-        text = _visible_text(soup)
-        m = re.search(r"Inbox\s*\(?(\d{1,4})\)?", text, re.I)
-        if m:
-            return int(m.group(1))
-        m = re.search(r"Unread[:\s]*?(\d{1,4})", text, re.I)
-        if m:
-            return int(m.group(1))
-    except Exception:
-        # don't let Gmail-specific errors break whole task
-        logger.exception("Error in _gmail_unread_count")
-    return None
-
-
-def _extract_count_from_title(soup: BeautifulSoup) -> Optional[int]:
-    # e.g. "(3) Inbox - Example"
-    try:
-        title = (soup.title.string or "").strip()
-    except Exception:
-        title = ""
-    m = re.search(r"\((\d{1,3})\)", title)
-    return int(m.group(1)) if m else None
-
-
-def _extract_count_from_aria_or_badges(soup: BeautifulSoup) -> Optional[int]:
-    """
-    Aggressive heuristic: try to find unread-count badges / numbers near inbox links.
-    Returns integer count or None.
-    Logs candidate matches (logger.debug) to help tuning.
-    """
-    candidates = []
-
-    try:
-        # 1) Title like "(3) Inbox - " or "3 new"
-        try:
-            title = (soup.title.string or "").strip()
-        except Exception:
-            title = ""
-        if title:
-            m = re.search(r"^\s*\((\d{1,5})\)", title) or re.search(
-                r"\b(\d{1,5})\s+(?:unread|new)\b", title, re.I
-            )
-            if m:
-                val = int(m.group(1))
-                logger.debug("count-candidate: title -> %s", val)
-                return val
-            if title:
-                candidates.append(("title", title[:200]))
-
-        # 2) scan attributes that often carry badges / tooltips
-        attr_names = ("aria-label", "title", "data-tooltip", "alt", "data-count", "data-unread")
-        for attr in attr_names:
-            for el in soup.find_all(attrs={attr: True}):
-                valstr = str(el.get(attr) or "").strip()
-                if not valstr:
-                    continue
-                if any(k in valstr.lower() for k in ("inbox", "unread", "new", "notifications", "notification")):
-                    m = re.search(r"\b(\d{1,5})\b", valstr)
-                    if m:
-                        num = int(m.group(1))
-                        logger.debug("count-candidate: %s attr -> %s", attr, num)
-                        return num
-                    candidates.append((f"attr:{attr}", valstr[:200]))
-
-        # 3) anchors / buttons linking to inbox/mail; look at their text and siblings
-        anchors = list(soup.find_all(["a", "button"], href=True))
-        anchors += [b for b in soup.find_all("button") if b not in anchors]
-        for a in anchors:
-            href = (a.get("href") or "").lower()
-            text = a.get_text(" ", strip=True) or ""
-            if any(x in href for x in ("#inbox", "/inbox", "/mail", "mail.google.com", "notifications", "/feed/notifications")) or "inbox" in text.lower() or "mail" in href:
-                m = re.search(r"\b(\d{1,5})\b", text)
-                if m:
-                    num = int(m.group(1))
-                    logger.debug("count-candidate: anchor text -> %s (href=%s)", num, href[:120])
-                    return num
-                try:
-                    sib_texts = []
-                    for ch in a.find_all(recursive=False):
-                        sib_txt = ch.get_text(" ", strip=True)
-                        if sib_txt:
-                            sib_texts.append(sib_txt)
-                    p = a.parent
-                    if p:
-                        for sib in p.find_all(recursive=False):
-                            if sib is a:
-                                continue
-                            t = sib.get_text(" ", strip=True)
-                            if t:
-                                sib_texts.append(t)
-                    for s in sib_texts:
-                        m = re.search(r"\b(\d{1,5})\b", s)
-                        if m:
-                            num = int(m.group(1))
-                            logger.debug("count-candidate: anchor sibling -> %s (href=%s)", num, href[:120])
-                            return num
-                except Exception:
-                    pass
-                if text:
-                    candidates.append(("anchor", text[:200]))
-
-        # 4) class-name heuristic: look for elements whose class contains "badge", "count", "unread", "bsU"
-        for el in soup.find_all(class_=True):
-            cls = " ".join(el.get("class") or [])
-            low = cls.lower()
-            if any(tok in low for tok in ("badge", "count", "unread", "unread-count", "bsu", "bsu-")):
-                txt = el.get_text(" ", strip=True)
-                if not txt:
-                    for span in el.find_all(["span", "b"]):
-                        t = span.get_text(" ", strip=True)
-                        if t:
-                            txt = t
-                            break
-                if txt:
-                    m = re.search(r"\b(\d{1,5})\b", txt)
-                    if m:
-                        num = int(m.group(1))
-                        logger.debug("count-candidate: class(%s) -> %s", cls, num)
-                        return num
-                    candidates.append((f"class:{cls[:100]}", txt[:200]))
-
-        # 5) final pass: find lines in visible text that mention Inbox/Unread/Notifications near a number
-        visible = _visible_text(soup)
-        if visible:
-            for line in visible.splitlines():
-                L = line.strip()
-                if not L:
-                    continue
-                low = L.lower()
-                if any(k in low for k in ("inbox", "unread", "notification", "notifications", "new")):
-                    m = re.search(r"\b(\d{1,5})\b", L)
-                    if m:
-                        num = int(m.group(1))
-                        logger.debug("count-candidate: visible-line -> %s", num)
-                        return num
-                    candidates.append(("visible-line", L[:200]))
-
-    except Exception as ex:
-        logger.exception("Error in badge heuristic: %s", ex)
-
-    if candidates:
-        logger.debug("badge-candidates found: %s", candidates[:10])
-    else:
-        logger.debug("badge-candidates: none")
-
-    return None
-
-
-def _extract_count_from_text(soup_text: str) -> Optional[int]:
-    # lines like "Inbox (4)" or "Notifications 7"
-    best = None
-    for line in soup_text.splitlines():
-        line = line.strip()
-        if not line or not KEYWORDS.search(line):
-            continue
-        m = re.search(r"\b(\d{1,3})\b", line)
-        if m:
-            val = int(m.group(1))
-            best = val if best is None else max(best, val)
-    return best
-
-
-def _hash_text(txt: str) -> str:
-    return hashlib.sha256(txt.encode("utf-8", "ignore")).hexdigest()
-
-
 def _build_session(headers: Dict, cookies: Dict, timeout_connect=5, timeout_read=8) -> requests.Session:
     """
     Build a requests session with retries and separate connect/read timeouts.
@@ -326,240 +138,6 @@ def _build_session(headers: Dict, cookies: Dict, timeout_connect=5, timeout_read
     return sess
 
 
-# --------------------- optional Playwright rendered fetch ---------
-
-try:
-    from playwright.sync_api import sync_playwright  # noqa: F401
-    _PW_AVAILABLE = True
-except Exception:
-    _PW_AVAILABLE = False
-
-
-@contextmanager
-def _playwright_ctx():
-    if not _PW_AVAILABLE:
-        yield None, None
-        return
-    from playwright.sync_api import sync_playwright as _sp  # local import
-    pw = _sp().start()
-    ctx = None
-    try:
-        ctx = pw.chromium.launch_persistent_context(
-            user_data_dir="/tmp/wn_pw_profile",
-            headless=True,
-            viewport={"width": 1280, "height": 800},
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--disable-dev-shm-usage",
-                "--no-sandbox",
-                "--disable-gpu",
-                "--disable-renderer-backgrounding",
-            ],
-        )
-        yield pw, ctx
-    finally:
-        try:
-            if ctx:
-                ctx.close()
-        except Exception:
-            pass
-        try:
-            pw.stop()
-        except Exception:
-            pass
-
-
-# Replace your existing _fetch_rendered_html with this function
-
-def _fetch_rendered_html(
-    url: str,
-    cookies: dict,
-    user_data_dir: str = None,
-    wait_ms: int = 3000,
-    click_selector: str = None,
-    wait_selector: str = None,
-    scroll_down: int = 0,
-    headless: Optional[bool] = None,
-    **_ignore,
-) -> str:
-    """
-    Playwright-rendered HTML fetch.
-    - headless=None => choose default, but caller can force headful/headless via extra_config.
-    - wait_selector: CSS selector to wait for (useful for Gmail: 'tr.zA' or 'tr.zA.zE')
-    - user_data_dir: persistent profile path (must match the profile used by link_source)
-    """
-    if not isinstance(url, str):
-        try:
-            url = str(url)
-        except Exception:
-            logger.warning("Rendered fetch got non-string URL; aborting.")
-            return ""
-
-    try:
-        from playwright.sync_api import sync_playwright, Error as PWError, TimeoutError as PWTimeout
-    except Exception as e:
-        logger.warning("Playwright not available: %s", e)
-        return ""
-
-    # default profile path if not provided
-    if not user_data_dir:
-        base = os.path.dirname(os.path.dirname(__file__))
-        user_data_dir = os.path.join(base, "desktop_client", ".pw_profile")
-
-    # choose headless: if explicit arg provided, obey it; else default True except for gmail fallback
-    auto_headless = True
-    if headless is not None:
-        auto_headless = bool(headless)
-    else:
-        # prefer headful for Gmail because Google often serves limited basic HTML to headless browsers
-        if "mail.google.com" in url:
-            auto_headless = False
-
-    html = ""
-    with sync_playwright() as pw:
-        ctx = None
-        for channel in ("chrome", "msedge", None):
-            try:
-                ctx = pw.chromium.launch_persistent_context(
-                    user_data_dir=user_data_dir,
-                    headless=auto_headless,
-                    channel=channel,
-                    args=[
-                        "--disable-blink-features=AutomationControlled",
-                        "--disable-dev-shm-usage",
-                        "--no-first-run",
-                        "--no-default-browser-check",
-                        "--disable-gpu",
-                        "--disable-renderer-backgrounding",
-                        "--disable-features=IsolateOrigins,site-per-process",
-                        "--password-store=basic",
-                    ],
-                    viewport={"width": 1366, "height": 900},
-                )
-                break
-            except Exception:
-                ctx = None
-        if ctx is None:
-            logger.warning("Could not launch any Chromium channel for rendered fetch.")
-            return ""
-
-        # seed cookies (profile usually already has them)
-        if cookies:
-            try:
-                ck = [{"name": k, "value": v, "path": "/", "httpOnly": False, "secure": True} for k, v in cookies.items()]
-                if ck:
-                    ctx.add_cookies(ck)
-            except Exception:
-                pass
-
-        def open_and_render(target_url: str) -> str:
-            page = ctx.new_page()
-            try:
-                # set a desktop UA so Gmail gives full UI
-                try:
-                    page.set_extra_http_headers({"User-Agent": DEFAULT_HEADERS["User-Agent"]})
-                except Exception:
-                    pass
-
-                page.goto(target_url, wait_until="domcontentloaded", timeout=90_000)
-
-                # If a concrete selector is given, wait for it. This helps Gmail.
-                if wait_selector:
-                    try:
-                        page.wait_for_selector(wait_selector, timeout=max(12000, wait_ms), state="visible")
-                        # small additional wait to let JS finish populating rows
-                        page.wait_for_timeout(800)
-                    except PWTimeout:
-                        # continue even if selector didn't appear
-                        pass
-
-                # wait the requested ms to give client JS time to render extra bits
-                page.wait_for_timeout(wait_ms)
-
-                # optional lazy scrolls
-                for _ in range(int(scroll_down or 0)):
-                    page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    page.wait_for_timeout(800)
-
-                # optional click
-                if click_selector:
-                    try:
-                        page.click(click_selector, timeout=8000)
-                        page.wait_for_timeout(1200)
-                    except Exception:
-                        pass
-
-                if page.is_closed():
-                    return ""
-                return page.content()
-            except Exception as e:
-                logger.warning("Rendered fetch failed for %s: %s", target_url, e)
-                return ""
-            finally:
-                try:
-                    if not page.is_closed():
-                        page.close()
-                except Exception:
-                    pass
-
-        # first try requested URL
-        html = open_and_render(url)
-
-        # gmail fallback: sometimes the root / redirects; try safe inbox/mobile variants
-        if (not html or len(html) < 2000) and ("mail.google.com" in url):
-            # prefer the basic inbox path (but still headful) or mobile
-            for alt in ("https://mail.google.com/mail/u/0/#inbox", "https://mail.google.com/"):
-                alt_html = open_and_render(alt)
-                if alt_html and len(alt_html) > len(html):
-                    html = alt_html
-
-        try:
-            ctx.close()
-        except Exception:
-            pass
-
-    return html
-
-
-def _extract_item_keys(soup: BeautifulSoup) -> list:
-    """
-    Build stable 'keys' for items we consider notifications/messages.
-    We prefer anchors inside list-like structures. Key = href or href+text.
-    This stays generic across sites.
-    """
-    keys = []
-
-    # Common list structures first (keeps noise down)
-    containers = soup.select('[role="list"], [role="listbox"], ul, ol, .list, .notifications, .inbox, .menu')
-    if not containers:
-        containers = [soup]  # fall back to whole doc
-
-    seen = set()
-    for cont in containers:
-        for a in cont.select('a[href]'):
-            href = a.get('href', '').strip()
-            if not href:
-                continue
-            text = a.get_text(" ", strip=True)[:120]
-            key = href
-            if len(text) >= 8:  # add text to reduce collisions when hrefs are generic
-                key = f"{href} :: {text}"
-            if key not in seen:
-                seen.add(key)
-                keys.append(key)
-
-        # Also look for obvious “item” blocks with text (no href)
-        for item in cont.select('[role="listitem"], li, .notification, .inbox-item, .message'):
-            t = item.get_text(" ", strip=True)
-            if t and len(t) >= 12:
-                key = f"TXT::{t[:160]}"
-                if key not in seen:
-                    seen.add(key)
-                    keys.append(key)
-
-    return keys[:500]  # cap
-
-
 # -------------------------- main task -----------------------------
 
 
@@ -573,20 +151,49 @@ def check_source(source_id: int) -> bool:
            - unread COUNT increases, OR
            - (fallback) visible text containing inbox/message keywords changed.
       4) Uses conditional GET (If-None-Match / If-Modified-Since) for speed.
+    Rendered sources leased to an edge client (edge.py) are skipped here.
     Returns:
       True  = a new Notification was created
       False = no new Notification (or baseline/update only)
+    Every run is recorded as a CheckRun (see checkruns.py) and, with
+    METRICS_ENABLED, counted and timed per stage (see metrics.py). Slow,
+    failed or surprising runs leave a CheckCapture (see captures.py).
     """
+    run = checkruns.new_run(source_id)
+    trace = {}  # references for captures.py; only copied when a capture is taken
+    t_start = time.monotonic()
+    try:
+        return _check_source(source_id, run, trace)
+    except Exception as e:
+        run["outcome"] = "error"
+        trace["error"] = repr(e)
+        raise
+    finally:
+        checkruns.record(run)
+        metrics.record_check(run)
+        metrics.observe_since("wn_check_stage_seconds", t_start, stage="total")
+        captures.maybe_capture(run, trace, checkruns.ms_since(t_start))
+
+
+def _check_source(source_id: int, run: Dict, trace: Dict) -> bool:
     # ---------- load source ----------
     try:
-        source = NotificationSource.objects.select_related("user").get(pk=source_id, enabled=True)
+        with metrics.timer("wn_check_stage_seconds", stage="load"):
+            source = NotificationSource.objects.select_related("user").get(pk=source_id, enabled=True)
     except NotificationSource.DoesNotExist:
         return False
 
     extra = _get_extra(source)                # dict
     use_rendered = bool(extra.get("rendered", False))
-    prev_mode = extra.get("mode") or "requests"   # previous fetch mode recorded in baseline
     cur_mode = "rendered" if use_rendered else "requests"
+    run["mode"] = cur_mode
+    trace.update(url=source.check_url, prev_count=extra.get("last_count"), prev_hash=extra.get("last_hash"),
+                 debug=bool(extra.get("debug", False)))
+
+    # a desktop client is rendering this one on its own profile (edge.py)
+    if use_rendered and edge.leased(source.pk):
+        run["outcome"] = "edge"
+        return False
 
     cookies = _build_cookies(extra)
     headers = _build_headers(extra)
@@ -618,16 +225,25 @@ def check_source(source_id: int) -> bool:
 
         sess = _build_session(headers=req_headers, cookies=cookies,
                               timeout_connect=connect_t, timeout_read=read_t)
-        r = sess.get(
-            source.check_url,
-            timeout=(connect_t, read_t),
-            allow_redirects=True,
-        )
+        t0 = time.monotonic()
+        try:
+            r = sess.get(
+                source.check_url,
+                timeout=(connect_t, read_t),
+                allow_redirects=True,
+            )
+        finally:
+            run["fetch_ms"] = checkruns.ms_since(t0)
+            metrics.observe_since("wn_check_stage_seconds", t0, stage="fetch")
+        run["status_code"] = getattr(r, "status_code", None)
+        run["bytes"] = len(r.content or b"")
+        trace.update(request_headers=req_headers, response_headers=r.headers, body=r.content)
 
         # Short-circuit: 304 Not Modified => nothing changed
         if getattr(r, "status_code", None) == 304:
             source.last_checked = timezone.now()
             source.save(update_fields=["last_checked"])
+            run["outcome"] = "not_modified"
             return False
 
         r.raise_for_status()
@@ -635,10 +251,12 @@ def check_source(source_id: int) -> bool:
         resp_for_fp = r
     except Exception as e:
         logger.warning("Fetch failed for %s: %s", source.check_url, e)
+        trace["error"] = f"fetch: {e!r}"
 
-    # Rendered fallback (only if enabled or requests failed)
     # Rendered fallback (only if enabled or requests failed)
     if use_rendered or html_text is None:
+        if not use_rendered:
+            metrics.inc("wn_check_render_fallback_total")
         try:
             user_data_dir = extra.get("user_data_dir")  # optional override
 
@@ -647,23 +265,20 @@ def check_source(source_id: int) -> bool:
             short_ms = int(extra.get("short_render_ms", 400))  # capture early transient badges
             long_ms = int(extra.get("render_timeout_ms", 3000))  # stable render
 
-            short_html = _fetch_rendered_html(
+            t0 = time.monotonic()
+            short_html, long_html = detection.render_snapshots(
                 source.check_url,
                 cookies=cookies,
                 user_data_dir=user_data_dir,
-                wait_ms=short_ms,
-            ) or ""
-
-            long_html = _fetch_rendered_html(
-                source.check_url,
-                cookies=cookies,
-                user_data_dir=user_data_dir,
-                wait_ms=long_ms,
-            ) or ""
+                short_ms=short_ms,
+                long_ms=long_ms,
+            )
+            run["render_ms"] = checkruns.ms_since(t0)
+            metrics.observe_since("wn_check_stage_seconds", t0, stage="render")
 
-            # prefer long_html for the saved HTML_text (stable), but we will
-            # parse both to pick the highest/unread count seen.
+            # prefer long_html (stable DOM); detection.analyze() parses it below
             html_text = long_html or short_html or html_text
+            trace["dom"] = long_html or short_html
 
             # Build a fake response for fingerprinting (rendered mode)
             if html_text:
@@ -673,76 +288,64 @@ def check_source(source_id: int) -> bool:
                     def __init__(self, body: str): self.content = body.encode("utf-8", "ignore")
 
                 resp_for_fp = _FakeResp(html_text)
-
-            # Parse both snapshots and choose the highest parsed_count (to catch transient badge)
-            parsed_count_candidates = []
-            for h in (short_html, long_html):
-                if not h:
-                    continue
-                tmp_soup = BeautifulSoup(h, "html.parser")
-                tmp_text = _visible_text(tmp_soup)
-                tmp_count = (
-                        _extract_count_from_title(tmp_soup)
-                        or _extract_count_from_aria_or_badges(tmp_soup)
-                        or _extract_count_from_text(tmp_text)
-                )
-                if tmp_count is not None:
-                    parsed_count_candidates.append(int(tmp_count))
-
-            # if we found candidates, pick the max as parsed_count (otherwise leave parsed_count as None,
-            # it will be computed later from html_text again)
-            if parsed_count_candidates:
-                # we intentionally choose the maximum to avoid missing a transient unread badge
-                parsed_count = max(parsed_count_candidates)
         except Exception as e:
             logger.warning("Rendered fetch failed for %s: %s", source.check_url, e)
+            trace["error"] = f"render: {e!r}"
 
     if html_text is None or resp_for_fp is None:
         source.last_checked = timezone.now()
         source.save(update_fields=["last_checked"])
+        run["outcome"] = "fetch_failed"
         return False
 
     # ---------- fingerprint + parse ----------
+    t0 = time.monotonic()
     etag, last_mod, body_hash = _fingerprint_response(resp_for_fp)
-    soup = BeautifulSoup(html_text, "html.parser")
-    text = _visible_text(soup)
-
-    prev_count = extra.get("last_count")
-
-    # First try Gmail-specific detector, then fallbacks
-    parsed_count = (
-        _gmail_unread_count(soup)
-        or _extract_count_from_title(soup)
-        or _extract_count_from_aria_or_badges(soup)
-        or _extract_count_from_text(text)
-    )
-    if parsed_count is None and "mail.google.com" in (source.check_url or ""):
-        try:
-            unread_rows = soup.select("tr.zA.zE")
-            if unread_rows:
-                parsed_count = len(unread_rows)
-            else:
-                # try mobile/basic variants
-                unread_spans = soup.select('[aria-label*="unread"], .zF, .yP')  # some Gmail label classes
-                if unread_spans:
-                    parsed_count = len(unread_spans)
-        except Exception:
-            logger.exception("Gmail parse error")
-
-    text_hash = _hash_text(text)
-
-    # DEBUG (optional)
+    if not run["bytes"]:
+        run["bytes"] = len(getattr(resp_for_fp, "content", b"") or b"")
+    result = detection.analyze(html_text, source.check_url)
+    trace["result"] = result
+    run["parse_ms"] = checkruns.ms_since(t0)
+    metrics.observe_since("wn_check_stage_seconds", t0, stage="parse")
+
+    # DEBUG (optional): this line per check; captures.py also keeps the whole run
     if bool(extra.get("debug", False)):
         logger.warning(
             "DEBUG user=%s src=%s name=%s mode=%s parsed_count=%s text_len=%s keywords=%s url=%s",
             getattr(source.user, "email", None),
-            source.id, source.name, cur_mode, parsed_count, len(text),
-            bool(KEYWORDS.search(text)), source.check_url
+            source.id, source.name, cur_mode, result["count"], result["text_len"],
+            result["keywords"], source.check_url
         )
 
-    # ---------- baseline if first run OR fetch mode changed ----------
+    with metrics.timer("wn_check_stage_seconds", stage="persist"):
+        return apply_result(source, extra, run, cur_mode, (etag, last_mod, body_hash), result)
+
+
+def apply_result(source: NotificationSource, extra: Dict, run: Dict, cur_mode: str,
+                 fingerprint: Tuple[str, str, str], result: Dict) -> bool:
+    """
+    Baseline / compare / notify for one analyzed page (detection.analyze()
+    output, or the same fields reported by an edge client), then persist the
+    new baseline. Returns True when a Notification was created.
+
+    A change of fetch mode (requests / rendered / edge) keeps comparing when
+    both sides have an unread count; otherwise the text hashes of two
+    different renders cannot be compared and the source is re-baselined
+    (outcome "rebaselined", so the switch shows in CheckRun).
+    """
+    etag, last_mod, body_hash = fingerprint
+    parsed_count = result.get("count")
+    text_hash = result["text_hash"]
+    run["detector"] = result.get("detector") if parsed_count is not None else "text-hash"
+
+    prev_mode = extra.get("mode") or "requests"   # previous fetch mode recorded in baseline
+    prev_etag, prev_last, prev_hash = _load_previous_fingerprint(extra)
+    prev_count = extra.get("last_count")
+
+    # ---------- baseline if first run OR fetch mode changed (and counts can't bridge it) ----------
     first_baseline = (prev_etag, prev_last, prev_hash, prev_count) == ("", "", "", None)
-    if first_baseline or (prev_mode != cur_mode):
+    mode_changed = prev_mode != cur_mode and (prev_count is None or parsed_count is None)
+    if first_baseline or mode_changed:
         extra = _store_fingerprint(extra, etag, last_mod, body_hash)
         if parsed_count is not None:
             extra["last_count"] = int(parsed_count)
@@ -752,9 +355,11 @@ def check_source(source_id: int) -> bool:
             extra.pop("last_count", None)
         extra["mode"] = cur_mode
         _save_extra(source, extra)
+        run["outcome"] = "baseline" if first_baseline else "rebaselined"
         return False
 
     created = False
+    new_items = {"new_items": len(result["new_keys"])} if result.get("new_keys") else {}
 
     # ---------- preferred: unread-count increased ----------
     if parsed_count is not None:
@@ -762,17 +367,12 @@ def check_source(source_id: int) -> bool:
             extra["last_count"] = int(parsed_count)
         else:
             if int(parsed_count) > int(prev_count):
-                with transaction.atomic():
-                    Notification.objects.create(
-                        user=source.user,
-                        source=source,
-                        title=f"New messages on {source.name}",
-                        message=f"Unread count: {parsed_count}",
-                        detected_at=timezone.now(),
-                        seen=False,
-                        played=False,
-                        meta={"detector": "count", "prev": int(prev_count), "now": int(parsed_count)},
-                    )
+                _create_notification(
+                    source,
+                    title=f"New messages on {source.name}",
+                    message=f"Unread count: {parsed_count}",
+                    meta={"detector": "count", "prev": int(prev_count), "now": int(parsed_count), **new_items},
+                )
                 extra["last_count"] = int(parsed_count)
                 created = True
             else:
@@ -781,24 +381,18 @@ def check_source(source_id: int) -> bool:
     # ---------- fallback: only notify if KEYWORD text changed ----------
     if not created and parsed_count is None:
         prev_text_hash = extra.get("last_hash")
-        contains_keywords = bool(KEYWORDS.search(text))
         if prev_text_hash is None:
             extra["last_hash"] = text_hash  # baseline
         else:
-            if contains_keywords and text_hash != prev_text_hash:
-                preview = text[:200] + ("…" if len(text) > 200 else "")
-                with transaction.atomic():
-                    Notification.objects.create(
-                        user=source.user,
-                        source=source,
-                        title=f"Activity on {source.name}",
-                        message=preview if preview.strip() else "Page changed",
-                        link=source.check_url,
-                        detected_at=timezone.now(),
-                        seen=False,
-                        played=False,
-                        meta={"detector": "text-hash", "keywords": True},
-                    )
+            if result.get("keywords") and text_hash != prev_text_hash:
+                preview = result.get("preview") or ""
+                _create_notification(
+                    source,
+                    title=f"Activity on {source.name}",
+                    message=preview if preview.strip() else "Page changed",
+                    link=source.check_url,
+                    meta={"detector": "text-hash", "keywords": True, **new_items},
+                )
                 extra["last_hash"] = text_hash
                 created = True
             else:
@@ -809,4 +403,61 @@ def check_source(source_id: int) -> bool:
     extra["mode"] = cur_mode
     _save_extra(source, extra)
 
+    run["outcome"] = "notified" if created else "unchanged"
     return created
+
+
+# ------------------------ check-run upkeep ------------------------
+
+
+@shared_task
+def flush_check_runs() -> int:
+    """
+    Push the buffered CheckRun rows of the process that runs it. Not on the
+    beat schedule: each process flushes its own buffer on a timer (checkruns.py).
+    """
+    return checkruns.flush()
+
+
+@shared_task
+def rollup_check_runs(hours: int = 2) -> Dict[str, int]:
+    """Refresh hourly/daily CheckRunRollup buckets for the recent window."""
+    checkruns.flush()
+    return checkruns.rollup_recent(hours=hours)
+
+
+@shared_task
+def prune_check_runs() -> Dict[str, int]:
+    """Expire raw CheckRun rows past CHECKRUN_RETENTION_DAYS."""
+    return checkruns.prune()
+
+
+@shared_task
+def measure_replica_lag() -> Dict[str, Optional[float]]:
+    """Publish read-replica lag for db_router.ReplicaRouter."""
+    return db_router.record_lags()
+
+
+@shared_task
+def reconcile_counters(batch_size: int = 500) -> int:
+    """Rebuild NotificationCounter rows from the table; returns users that had drifted."""
+    from django.contrib.auth import get_user_model
+
+    drifted = 0
+    user_ids = get_user_model().objects.order_by("pk").values_list("pk", flat=True)
+    for uid in user_ids.iterator(chunk_size=batch_size):
+        try:
+            if inbox.reconcile(uid):
+                drifted += 1
+        except Exception:
+            logger.exception("counter reconcile failed for user %s", uid)
+    if drifted:
+        logger.warning("reconcile_counters fixed drift for %s user(s)", drifted)
+    return drifted
+
+
+@worker_process_shutdown.connect
+def _flush_check_runs_on_shutdown(**_kwargs):
+    checkruns.flush()
+    if metrics.ENABLED:
+        metrics.push_pending()
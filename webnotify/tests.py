@@ -1,3 +1,437 @@
-from django.test import TestCase
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from webnotify import active_cache, authentication, captures, checkruns, inbox, tasks, versions
+from webnotify.models import (
+    AckWatermark, CheckCapture, CheckRun, CheckRunRollup, CustomRingtone, Notification, NotificationCounter,
+    NotificationSource, UserSettings,
+)
+
+User = get_user_model()
+
+
+class AsyncMiddlewareTests(SimpleTestCase):
+    def assertChainStaysAsync(self):
+        with self.assertLogs("django.request", level="DEBUG") as logs:
+            logging.getLogger("django.request").debug("sentinel")
+            ASGIHandler()
+        adapted = [line for line in logs.output if "handler adapted for" in line]
+        self.assertEqual(adapted, [])
+
+    @override_settings(DEBUG=True)  # Django only logs adaptations in DEBUG
+    def test_asgi_handler_chain_stays_async(self):
+        self.assertChainStaysAsync()
+
+    def test_optional_middleware_stays_async(self):
+        optional = ["webnotify.querycount.QueryCountMiddleware", "webnotify.metrics.MetricsMiddleware"]
+        with override_settings(DEBUG=True, MIDDLEWARE=optional + list(settings.MIDDLEWARE)):
+            self.assertChainStaysAsync()
+
+
+class VersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="versions@example.com", password="x")
+
+    def bump(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            versions.bump(self.user.pk)
+
+    def test_bump_creates_missing_settings_row(self):
+        UserSettings.objects.filter(user=self.user).delete()
+        before = versions.etag(self.user, "api")
+        self.bump()
+        self.assertNotEqual(versions.etag(self.user, "api"), before)
+        self.assertEqual(UserSettings.objects.get(user=self.user).version, 1)
+
+    @mock.patch.object(versions, "SHARED_CACHE", True)
+    def test_cached_version_costs_no_query(self):
+        versions.current(self.user)  # seeds the cache
+        with self.assertNumQueries(0):
+            tag = versions.etag(self.user, "api")
+        self.bump()
+        with self.assertNumQueries(0):
+            self.assertNotEqual(versions.etag(self.user, "api"), tag)
+
+    @mock.patch.object(versions, "SHARED_CACHE", True)
+    def test_cache_miss_seeds_from_database(self):
+        self.bump()
+        self.bump()
+        cache.clear()
+        self.assertEqual(versions.current(self.user), 2)
+
+    def test_conditional_get_answers_304_until_a_change(self):
+        client = Client()
+        client.force_login(self.user)
+        first = client.get("/api/notifications/active/")
+        self.assertEqual(first.status_code, 200)
+        again = client.get("/api/notifications/active/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.bump()
+        changed = client.get("/api/notifications/active/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+
+class CheckRunTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(email="checkruns@example.com", password="x")
+        self.source = NotificationSource.objects.create(user=user, name="s", check_url="https://example.com/")
+
+    def run_record(self, **fields):
+        run = checkruns.new_run(self.source.pk)
+        run.update(mode="requests", outcome="unchanged", **fields)
+        return run
+
+    def test_idle_process_flushes_on_a_timer(self):
+        flushed = threading.Event()
+        with mock.patch.object(checkruns, "FLUSH_SECONDS", 0.05), \
+                mock.patch.object(checkruns, "flush", side_effect=lambda: flushed.set()):
+            checkruns.record(self.run_record())
+            self.assertTrue(flushed.wait(2), "buffered run never flushed without further checks")
+        checkruns._buffer.clear()
+        checkruns._buffer_since = None
+
+    @override_settings(TIME_ZONE="Asia/Kolkata")
+    def test_rollups_use_utc_hours_and_days(self):
+        at = datetime(2026, 3, 2, 23, 40, tzinfo=dt_timezone.utc)  # 05:10 next day in Kolkata (+05:30)
+        CheckRun.objects.create(source=self.source, created_at=at, mode="requests", outcome="unchanged", fetch_ms=7)
+        checkruns.rollup_hours(at - timedelta(hours=1), at + timedelta(hours=1))
+        checkruns.rollup_days(at.replace(hour=0, minute=0), at + timedelta(days=1))
+        hour = CheckRunRollup.objects.get(period=CheckRunRollup.PERIOD_HOUR)
+        day = CheckRunRollup.objects.get(period=CheckRunRollup.PERIOD_DAY)
+        self.assertEqual(hour.bucket, datetime(2026, 3, 2, 23, tzinfo=dt_timezone.utc))
+        self.assertEqual(day.bucket, datetime(2026, 3, 2, tzinfo=dt_timezone.utc))
+        self.assertEqual((day.runs, day.fetch_ms_sum), (1, 7))
+
+
+class RingtoneTests(TestCase):
+    BODY = bytes(range(256)) * 40  # 10240 bytes
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        media_override = override_settings(MEDIA_ROOT=media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        user = User.objects.create_user(email="ringtones@example.com", password="x")
+        us, _ = UserSettings.objects.get_or_create(user=user)
+        us.ensure_api_key()
+        self.auth = {"HTTP_AUTHORIZATION": f"ApiKey {us.api_key}"}
+        self.ringtone = CustomRingtone(user=user, name="r", size_bytes=len(self.BODY), sha256="ab" * 32)
+        self.ringtone.file.save("r.wav", ContentFile(self.BODY))
+
+    def get(self, **headers):
+        return self.client.get("/api/sound/", **self.auth, **headers)
+
+    def test_range_is_answered_206(self):
+        response = self.get(HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.BODY)}")
+        self.assertEqual(b"".join(response.streaming_content), self.BODY[100:200])
+
+    def test_suffix_range_and_stale_if_range(self):
+        tail = self.get(HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(tail.streaming_content), self.BODY[-10:])
+        whole = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"other"')
+        self.assertEqual(whole.status_code, 200)
+        self.assertEqual(b"".join(whole.streaming_content), self.BODY)
+
+    def test_unsatisfiable_range_is_416(self):
+        response = self.get(HTTP_RANGE=f"bytes={len(self.BODY)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.BODY)}")
+
+    def test_missing_file_is_404_not_a_truncated_200(self):
+        os.remove(self.ringtone.file.path)
+        self.assertEqual(self.get().status_code, 404)
+
+
+@skipUnless(importlib.util.find_spec("playwright"), "desktop_client needs playwright")
+class CookieDomainTests(SimpleTestCase):
+    class Context:
+        def storage_state(self):
+            return {"cookies": [
+                {"domain": ".notfiverr.com", "name": "evil", "value": "1"},
+                {"domain": ".www.fiverr.com", "name": "sub", "value": "2"},
+                {"domain": "fiverr.com", "name": "root", "value": "3"},
+            ]}
+
+    def test_domains_match_on_a_dot_boundary(self):
+        from desktop_client import link_source
+
+        expected = {"sub": "2", "root": "3"}
+        self.assertEqual(link_source.cookies_by_domain(self.Context(), ["fiverr.com"]), {"fiverr.com": expected})
+        self.assertEqual(link_source.read_cookies_from_ctx(self.Context(), "fiverr.com"), expected)
+
+
+class EdgeTests(TestCase):
+    HASH = "a" * 64
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="edge@example.com", password="x")
+        self.source = NotificationSource.objects.create(
+            user=self.user, name="inbox", check_url="https://example.com/inbox",
+            extra_config={"rendered": True, "mode": "rendered", "last_count": 2, "last_hash": None},
+        )
+        self.addCleanup(checkruns._buffer.clear)
+
+    def key(self, user):
+        us, _ = UserSettings.objects.get_or_create(user=user)
+        us.ensure_api_key()
+        return {"HTTP_AUTHORIZATION": f"ApiKey {us.api_key}"}
+
+    def post(self, results, **auth):
+        return self.client.post("/api/edge/results/", {"results": results}, content_type="application/json", **auth)
+
+    def outcome(self, response):
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"][0]["outcome"]
+
+    def test_results_need_a_key_and_the_owners_source(self):
+        item = {"source_id": self.source.pk, "text_hash": self.HASH, "count": 9}
+        self.assertEqual(self.post([item]).status_code, 401)
+        other = User.objects.create_user(email="edge-other@example.com", password="x")
+        self.assertEqual(self.outcome(self.post([item], **self.key(other))), "not_assigned")
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.extra_config["last_count"], 2)
+
+    def test_counts_are_compared_across_a_mode_switch(self):
+        item = {"source_id": self.source.pk, "text_hash": self.HASH, "count": 3}
+        self.assertEqual(self.outcome(self.post([item], **self.key(self.user))), "notified")
+        self.assertEqual(self.source.notifications.count(), 1)
+
+    def test_switch_without_counts_is_recorded_as_rebaselined(self):
+        item = {"source_id": self.source.pk, "text_hash": self.HASH}
+        self.assertEqual(self.outcome(self.post([item], **self.key(self.user))), "rebaselined")
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.extra_config["mode"], "edge")
+
+
+class CaptureTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(email="captures@example.com", password="x")
+        self.sources = [
+            NotificationSource.objects.create(user=user, name=f"s{i}", check_url="https://example.com/")
+            for i in range(3)
+        ]
+
+    def capture(self, source, body=b"x" * 4000):
+        run = {"source_id": source.pk, "mode": "requests", "outcome": "error"}
+        return captures.maybe_capture(run, {"body": body}, 5)
+
+    def test_total_is_not_summed_on_every_capture(self):
+        self.capture(self.sources[0])  # first one counts the table
+        with CaptureQueriesContext(connection) as ctx:
+            self.capture(self.sources[1])
+        self.assertFalse([q for q in ctx.captured_queries if "SUM(" in q["sql"].upper()])
+
+    def test_oldest_captures_go_past_the_byte_limit(self):
+        first = self.capture(self.sources[0], body=bytes(range(256)) * 64)
+        with mock.patch.object(captures, "MAX_BYTES", first.stored_bytes * 2):
+            for source in self.sources[1:]:
+                self.capture(source, body=bytes(range(256)) * 64)
+        self.assertFalse(CheckCapture.objects.filter(pk=first.pk).exists())
+        self.assertEqual(CheckCapture.objects.count(), 2)
+
+
+class CursorPagingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="cursor@example.com", password="x")
+        self.client.force_login(self.user)
+        at = datetime(2026, 5, 1, 12, tzinfo=dt_timezone.utc)
+        # runs of identical timestamps, which a seek on detected_at alone gets wrong
+        Notification.objects.bulk_create(
+            Notification(user=self.user, title=f"n{i}", detected_at=at + timedelta(seconds=i // 4)) for i in range(22)
+        )
+        self.newest_first = list(Notification.objects.filter(user=self.user).order_by("-detected_at", "-id")
+                                 .values_list("id", flat=True))
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(url).json()
+            self.assertFalse([q for q in ctx.captured_queries if "OFFSET" in q["sql"].upper()])
+            pages.append([row["id"] for row in data["results"]])
+            url = data[link]
+        return pages
+
+    def test_next_and_previous_links_cover_every_row_once(self):
+        forward = self.walk("/api/notifications/cursor/?page_size=5", "next")
+        self.assertEqual(sum(forward, []), self.newest_first)
+        self.assertEqual([len(p) for p in forward], [5, 5, 5, 5, 2])
+
+        last = self.client.get("/api/notifications/cursor/?page_size=5").json()
+        while last["next"]:
+            last = self.client.get(last["next"]).json()
+        backward = self.walk(last["previous"], "previous")
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_bad_cursor_is_404(self):
+        self.assertEqual(self.client.get("/api/notifications/cursor/?cursor=nonsense").status_code, 404)
+
+
+class ApiKeyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="apikey@example.com", password="x")
+        self.settings, _ = UserSettings.objects.get_or_create(user=self.user)
+        self.settings.ensure_api_key()
+        self.addCleanup(authentication._lru.clear)
+
+    def test_hits_skip_the_database(self):
+        key = self.settings.api_key
+        self.assertEqual(authentication.resolve(key), self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(authentication.resolve(key), self.user.pk)
+
+    def test_rotated_key_stops_working_at_once(self):
+        old = self.settings.api_key
+        authentication.resolve(old)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.settings.api_key = "f" * 32
+            self.settings.save()
+        self.assertIsNone(authentication.resolve(old))
+        self.assertEqual(authentication.resolve("f" * 32), self.user.pk)
+
+    def test_deactivated_user_is_refused_at_once(self):
+        key = self.settings.api_key
+        authentication.resolve(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(authentication.resolve(key))
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="inbox@example.com", password="x")
+        self.a, self.b = (
+            NotificationSource.objects.create(user=self.user, name=n, check_url=f"https://{n}.example.com/")
+            for n in ("a", "b")
+        )
+
+    def notify(self, source):
+        return tasks._create_notification(source, title="t", message="m")
+
+    def test_counters_follow_inserts_and_targeted_acks(self):
+        first, _, _ = self.notify(self.a), self.notify(self.a), self.notify(self.b)
+        counts = inbox.counts(self.user.pk, by_source=True)
+        self.assertEqual((counts["unseen"], counts["unplayed"]), (3, 3))
+        self.assertEqual(counts["sources"][self.a.pk], {"unseen": 2, "unplayed": 2})
+
+        self.assertEqual(inbox.acknowledge(self.user, ids=[first.pk], played=False), 1)
+        counts = inbox.counts(self.user.pk, by_source=True)
+        self.assertEqual((counts["unseen"], counts["unplayed"]), (2, 3))
+        self.assertEqual(counts["sources"][self.a.pk], {"unseen": 1, "unplayed": 2})
+
+    def test_mark_all_read_only_moves_the_watermark(self):
+        older = [self.notify(self.a) for _ in range(3)]
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(inbox.acknowledge(self.user), 3)
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "webnotify_notification"')])
+        self.assertEqual(inbox.watermark(self.user.pk), older[-1].pk)
+        self.assertFalse(Notification.objects.filter(pk__in=[n.pk for n in older], seen=True).exists())
+        self.assertFalse(inbox.pending(self.user).exists())
+
+        newer = self.notify(self.b)
+        self.assertEqual(list(inbox.pending(self.user)), [newer])
+        self.assertEqual(inbox.counts(self.user.pk)["unseen"], 1)
+
+    def test_watermark_records_when_everything_was_acked(self):
+        self.notify(self.a)
+        inbox.acknowledge(self.user)
+        AckWatermark.objects.filter(user=self.user).update(updated_at=datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+        self.notify(self.a)
+        inbox.acknowledge(self.user)
+        mark = AckWatermark.objects.get(user=self.user, device="")
+        self.assertGreater(mark.updated_at, datetime(2026, 1, 2, tzinfo=dt_timezone.utc))
+
+    def test_device_mark_leaves_other_devices_and_counters(self):
+        newest = [self.notify(self.a) for _ in range(2)][-1]
+        inbox.acknowledge_all(self.user, device="laptop")
+        self.assertEqual(inbox.watermark(self.user.pk, "laptop"), newest.pk)
+        self.assertEqual(inbox.watermark(self.user.pk), 0)
+        self.assertEqual(inbox.counts(self.user.pk)["unseen"], 2)
+
+    def test_reconcile_repairs_drift(self):
+        self.notify(self.a)
+        NotificationCounter.objects.filter(user=self.user).update(unseen=40, unplayed=40)
+        self.assertTrue(inbox.reconcile(self.user.pk))
+        self.assertEqual(inbox.counts(self.user.pk), {"unseen": 1, "unplayed": 1})
+        self.assertFalse(inbox.reconcile(self.user.pk))
+
+
+class BulkSourceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="bulk@example.com", password="x")
+        us, _ = UserSettings.objects.get_or_create(user=self.user)
+        us.ensure_api_key()
+        self.auth = {"HTTP_AUTHORIZATION": f"ApiKey {us.api_key}"}
+
+    def post(self, sources):
+        return self.client.post("/api/source/bulk_key/", {"sources": sources},
+                                content_type="application/json", **self.auth)
+
+    def manifest(self, n, name="s"):
+        return [{"name": f"{name}{i}", "check_url": f"https://example.com/{i}", "cookies": {"sid": name}}
+                for i in range(n)]
+
+    def test_rerunning_a_manifest_updates_instead_of_duplicating(self):
+        first = self.post(self.manifest(2)).json()["sources"]
+        self.assertEqual([s["created"] for s in first], [True, True])
+
+        again = self.post(self.manifest(3, name="t")).json()["sources"]
+        self.assertEqual([s["created"] for s in again], [False, False, True])
+        self.assertEqual([s["id"] for s in again[:2]], [s["id"] for s in first])
+        sources = NotificationSource.objects.filter(user=self.user)
+        self.assertEqual(sources.count(), 3)
+        self.assertEqual({s.extra_config["cookies"]["sid"] for s in sources}, {"t"})
+
+    def test_query_count_does_not_grow_with_the_manifest(self):
+        self.post(self.manifest(2))
+        with CaptureQueriesContext(connection) as small:
+            self.post(self.manifest(4))
+        NotificationSource.objects.filter(user=self.user).delete()
+        self.post(self.manifest(10))
+        with CaptureQueriesContext(connection) as large:
+            self.post(self.manifest(20))
+        self.assertEqual(len(small), len(large))
+
+
+class ActiveCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="active@example.com", password="x")
+        self.source = NotificationSource.objects.create(user=self.user, name="s", check_url="https://example.com/")
+        self.client.force_login(self.user)
+
+    def test_notification_from_another_process_is_shown(self):
+        first = self.client.get("/api/notifications/active/")
+        self.assertFalse(first.json()["has"])
+        # a celery worker without WN_CACHE_URL: its own LocMem cache, the same database
+        with mock.patch.object(active_cache, "cache", LocMemCache("worker", {})), \
+                self.captureOnCommitCallbacks(execute=True):
+            notif = tasks._create_notification(self.source, title="t", message="m")
+        again = self.client.get("/api/notifications/active/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()["id"], notif.pk)
@@ -29,7 +29,9 @@ urlpatterns = [
 
     # ------- DRF APIs (class-based) — single source of truth -------
     path("api/notifications/", views_api.NotificationListAPI.as_view(), name="api_notifications_list"),
+    path("api/notifications/cursor/", views_api.NotificationCursorListAPI.as_view(), name="api_notifications_cursor"),
     path("api/notifications/active/", views_api.NotificationActiveAPI.as_view(), name="api_notifications_active"),
+    path("api/notifications/stream/", views.notification_stream, name="api_notifications_stream"),
     path("api/notifications/mark-read/", views_api.NotificationMarkReadAPI.as_view(), name="api_notifications_mark_read"),
     path("api/notifications/clear-all/", views_api.NotificationClearAllAPI.as_view(), name="api_notifications_clear_all"),
     path("api/notifications/delete-all/", views_api.NotificationDeleteAllAPI.as_view(), name="api_notifications_delete_all"),
@@ -45,7 +47,13 @@ urlpatterns = [
 
     path("api/source/create_key/", views.source_create_by_key, name="source_create_by_key"),
     path("api/source/import_cookies_key/", views.source_import_cookies_by_key, name="source_import_cookies_by_key"),
+    path("api/source/bulk_key/", views.source_bulk_by_key, name="source_bulk_by_key"),
+    path("api/source/cookies_delta_key/", views.source_cookies_delta_by_key, name="source_cookies_delta_by_key"),
     path("api/settings/update_key/", views.settings_update_by_key, name="settings_update_by_key"),
+    path("api/sync/", views.client_sync, name="client_sync"),
+    path("api/edge/assignments/", views.edge_assignments, name="edge_assignments"),
+    path("api/edge/results/", views.edge_results, name="edge_results"),
+    path("metrics/", views.metrics_export, name="metrics"),
 
     path("api/settings/set_play_in_background/", views.set_play_in_background, name="set_play_in_background"),
 
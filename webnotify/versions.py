@@ -0,0 +1,107 @@
+# webnotify/versions.py
+"""
+Per-user version counter behind ETag / 304 on the polling endpoints.
+
+It is bumped after commit on every notification insert, acknowledgement
+and delete (inbox.py), on settings changes and on ringtone uploads. A
+poll whose If-None-Match still names the current version is answered 304
+after reading that one integer. The notification tables and the active
+cache are not touched.
+
+The integer lives in the shared cache ("wn:version:<user_id>"), so with
+cached API-key auth (authentication.py) an unchanged poll makes no DB
+query at all. UserSettings.version is its durable copy: bump() increments
+the row first (creating it if needed), then the cache key. A missing key
+is seeded from the primary, never from a replica that may lag, so
+versions only ever grow and an old ETag can never match again. Without a
+shared cache (no WN_CACHE_URL) other processes could not see the bumps,
+so every read goes to the primary instead.
+
+Always read the tag BEFORE building the body: a body newer than its tag
+only costs the client one extra refetch, an older one would be stale
+until the next change.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils.cache import get_conditional_response
+
+from .models import UserSettings
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE = bool(getattr(settings, "WN_CACHE_URL", ""))
+
+
+def _key(user_id) -> str:
+    return f"wn:version:{user_id}"
+
+
+def _stored(user_id) -> int:
+    version = (
+        UserSettings.objects.using("default").filter(user_id=user_id)
+        .values_list("version", flat=True).first()
+    )
+    return version or 0
+
+
+def bump(user_id) -> None:
+    """Invalidate every validator handed out for this user (after commit)."""
+    def _after():
+        if not UserSettings.objects.filter(user_id=user_id).update(version=F("version") + 1):
+            UserSettings.objects.get_or_create(user_id=user_id)
+            UserSettings.objects.filter(user_id=user_id).update(version=F("version") + 1)
+        if not SHARED_CACHE:
+            return
+        try:
+            cache.incr(_key(user_id))
+        except ValueError:
+            # not cached: store the new value so a reader seeding an older one loses
+            cache.set(_key(user_id), _stored(user_id), None)
+        except Exception:
+            logger.warning("version cache unavailable; dropping wn:version:%s", user_id)
+            try:
+                cache.delete(_key(user_id))
+            except Exception:
+                pass
+    transaction.on_commit(_after)
+
+
+def current(user) -> int:
+    if not SHARED_CACHE:
+        return _stored(user.pk)
+    try:
+        version = cache.get(_key(user.pk))
+        if version is None:
+            cache.add(_key(user.pk), _stored(user.pk), None)
+            version = cache.get(_key(user.pk))
+    except Exception:
+        version = None
+    return _stored(user.pk) if version is None else version
+
+
+def etag(user, scope: str, *parts) -> str:
+    """
+    Weak ETag for one representation: user + version + endpoint scope, plus
+    anything else the body depends on (device, session-held settings...).
+    """
+    tag = f"u{user.pk}.v{current(user)}.{scope}"
+    if parts:
+        tag += "." + hashlib.md5(json.dumps(parts, default=str).encode()).hexdigest()[:10]
+    return f'W/"{tag}"'
+
+
+def not_modified(request, tag):
+    """A 304 response if the client's If-None-Match still matches `tag`, else None."""
+    return get_conditional_response(request, etag=tag)
+
+
+def tagged(response, tag):
+    response["ETag"] = tag
+    response["Cache-Control"] = "private, no-cache"
+    return response
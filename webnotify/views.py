@@ -1,19 +1,32 @@
 # webnotify/views.py
+import asyncio
+import hmac
 import json
 import os
+import zlib
+from urllib.parse import urlparse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, HttpResponseBadRequest
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    JsonResponse, HttpResponse, HttpResponseForbidden, HttpResponseBadRequest, HttpResponseNotAllowed,
+    HttpResponseNotFound, StreamingHttpResponse,
+)
 from django.contrib.auth import login as auth_login, logout as auth_logout, authenticate, get_user_model
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST, require_http_methods, require_GET
+from django.views.decorators.http import require_POST, require_http_methods, require_GET, require_safe
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
 from django.views.decorators.http import require_POST
 
+from . import active_cache, edge, inbox, metrics, push, ringtones, versions
+from .authentication import user_from_request
+from .db_router import bind_user, replica_reads
 from .models import Notification, NotificationSource, CustomRingtone, UserSettings, NotificationSound
+from .serializers import NOTIFICATION_VALUE_EXPRS, NOTIFICATION_VALUES
 
 User = get_user_model()
 
@@ -44,8 +57,7 @@ def dashboard(request):
         return render(request, "webnotify/dashboard.html", ctx)
     except Exception:
         # fallback minimal response for environments without templates
-        from .models import Notification
-        unread_count = Notification.objects.filter(user=request.user, seen=False).count()
+        unread_count = inbox.counts(request.user.pk)["unseen"]
         html = f"<html><body><h1>Dashboard</h1><p>Hello, {request.user} — unread: {unread_count}</p></body></html>"
         return HttpResponse(html)
 
@@ -123,8 +135,9 @@ def active_notification(request):
     Once the client starts playing it, it should mark it as played to avoid repeats.
     """
     notif = (
-        Notification.objects
-        .filter(user=request.user, played=False)   # only unplayed
+        inbox.pending(request.user, inbox.device_from_request(request))
+        .filter(played=False)   # only unplayed
+        .select_related("source")
         .order_by("-detected_at")
         .first()
     )
@@ -166,7 +179,7 @@ def mark_notifications_read(request):
         return HttpResponseBadRequest("No ids provided.")
 
     played = body.get("played", True)
-    Notification.objects.filter(user=request.user, pk__in=ids).update(seen=True, played=bool(played))
+    inbox.acknowledge(request.user, ids, played=bool(played), device=inbox.device_from_request(request))
     return JsonResponse({"ok": True, "updated": len(ids)})
 
 @login_required
@@ -254,7 +267,7 @@ def upload_ringtone(request):
 
     # save file
     subpath = os.path.join("ringtones", timezone.now().strftime("%Y/%m/%d"))
-    saved_relpath = default_storage.save(os.path.join(subpath, uploaded.name), ContentFile(uploaded.read()))
+    saved_relpath, sha256 = ringtones.save_upload(uploaded, os.path.join(subpath, uploaded.name))
 
     # make this the ONLY default: unset previous defaults for this user
     CustomRingtone.objects.filter(user=request.user, is_default=True).update(is_default=False)
@@ -264,6 +277,7 @@ def upload_ringtone(request):
         name=uploaded.name,
         file=saved_relpath,
         size_bytes=uploaded.size,
+        sha256=sha256,
         is_default=True,
     )
 
@@ -280,6 +294,7 @@ def upload_ringtone(request):
     settings_obj, _ = UserSettings.objects.get_or_create(user=request.user)
     settings_obj.default_ringtone = rt
     settings_obj.save(update_fields=["default_ringtone", "last_updated"])
+    inbox.settings_changed(request.user.pk)
 
     return JsonResponse({"ok": True, "id": rt.pk, "file": abs_url})
 
@@ -352,22 +367,13 @@ def set_play_in_background(request):
     us, _ = UserSettings.objects.get_or_create(user=request.user)
     us.play_in_background = on
     us.save(update_fields=["play_in_background", "last_updated"])
+    inbox.settings_changed(request.user.pk)
 
     return JsonResponse({"ok": True, "play_in_background": on})
 
 #
 
 
-def user_from_apikey(key: str):
-    if not key:
-        return None
-    try:
-        from .models import UserSettings
-        us = UserSettings.objects.select_related("user").get(api_key=key)
-        return us.user
-    except Exception:
-        return None
-
 def json_bad_request(msg="bad request", code=400):
     return JsonResponse({"ok": False, "error": msg}, status=code)
 
@@ -375,69 +381,70 @@ def json_bad_request(msg="bad request", code=400):
 
 
 @csrf_exempt
+@replica_reads
 def settings_by_key(request):
     """
     GET /api/settings_key/?key=APIKEY
     Returns default_ringtone_url, volume, etc, for the user owning the key.
     """
-    key = request.GET.get("key") or request.POST.get("key")
-    user = user_from_apikey(key)
+    user = user_from_request(request)
     if not user:
         return json_bad_request("invalid key", 401)
 
-    from .models import UserSettings
-    settings_obj, _ = UserSettings.objects.get_or_create(user=user)
+    tag = versions.etag(user, "settings-key", request.get_host())
+    not_modified = versions.not_modified(request, tag)
+    if not_modified:
+        return not_modified
+
+    data = _settings_payload(request, user)
+    response = JsonResponse({"ok": True, "settings": data, "counts": inbox.counts(user.pk, by_source=True)})
+    return versions.tagged(response, tag)
+
+
+def _settings_payload(request, user):
+    """Settings as the desktop client sees them (settings_by_key, client_sync)."""
+    # plain read first (replica-friendly); get_or_create always goes to the primary
+    settings_obj = UserSettings.objects.select_related("default_ringtone").filter(user_id=user.pk).first()
+    if settings_obj is None:
+        settings_obj, _ = UserSettings.objects.get_or_create(user_id=user.pk)
+    ringtone = settings_obj.default_ringtone
     ringtone_url = None
-    if settings_obj.default_ringtone and settings_obj.default_ringtone.file:
+    if ringtone and ringtone.file:
         try:
-            rel_url = settings_obj.default_ringtone.file.url
+            rel_url = ringtone.file.url
         except Exception:
-            rel_url = f"{settings.MEDIA_URL.rstrip('/')}/{settings_obj.default_ringtone.file.name}"
+            rel_url = f"{settings.MEDIA_URL.rstrip('/')}/{ringtone.file.name}"
         ringtone_url = request.build_absolute_uri(rel_url)
 
-    data = {
+    return {
         "volume": settings_obj.volume,
         "play_loop": settings_obj.play_loop,
         "play_in_background": settings_obj.play_in_background,  # <-- add this
         "default_ringtone_url": ringtone_url,
-        "default_ringtone_name": settings_obj.default_ringtone.name if settings_obj.default_ringtone else None,
+        "default_ringtone_name": ringtone.name if ringtone else None,
+        "default_ringtone_etag": ringtone.etag if ringtone else None,
     }
-    return JsonResponse({"ok": True, "settings": data})
 
 #
 
 
-@csrf_exempt
-def active_notification_by_key(request):
+async def active_notification_by_key(request):
     """
-    GET /api/notifications/active_key/?key=APIKEY
-    Return latest UNPLAYED notification for that user.
+    GET /api/notifications/active_key/?key=APIKEY[&wait=SECONDS]
+    Return latest UNPLAYED notification for that user (served from active_cache).
+    With wait=N the request is held until one arrives (see _long_poll).
+    ETag / If-None-Match: 304 while the user's version is unchanged.
     """
-    key = request.GET.get("key") or request.POST.get("key")
-    user = user_from_apikey(key)
+    user, body, tag = await sync_to_async(_active_poll)(request, "key")
     if not user:
         return json_bad_request("invalid key", 401)
 
-    notif = (
-        Notification.objects
-        .filter(user=user, played=False)
-        .order_by("-detected_at")
-        .first()
-    )
-    if not notif:
-        return JsonResponse({"ok": True, "has": False})
+    body, tag = await _long_poll(request, user, "key", body, tag)
+    return _active_response(request, body, tag)
 
-    data = {
-        "ok": True,
-        "has": True,
-        "id": notif.pk,
-        "title": notif.title,
-        "message": notif.message,
-        "link": notif.link,
-        "detected_at": notif.detected_at.isoformat(),
-        "source": notif.source.name if notif.source else None,
-    }
-    return JsonResponse(data)
+
+# csrf_exempt() isn't async-aware on Django 4.2; this is all it does
+active_notification_by_key.csrf_exempt = True
 
 
 @csrf_exempt
@@ -451,8 +458,7 @@ def mark_notifications_read_by_key(request):
         body = json.loads(request.body.decode("utf-8") or "{}")
     except Exception:
         body = {}
-    key = body.get("key") or request.POST.get("key")
-    user = user_from_apikey(key)
+    user = user_from_request(request, key=body.get("key"))
     if not user:
         return json_bad_request("invalid key", 401)
 
@@ -461,157 +467,81 @@ def mark_notifications_read_by_key(request):
         return json_bad_request("ids required")
 
     played = bool(body.get("played", True))
-    updated = Notification.objects.filter(user=user, pk__in=ids).update(seen=True, played=played)
+    updated = inbox.acknowledge(user, ids, played=played, device=inbox.device_from_request(request))
     return JsonResponse({"ok": True, "updated": updated})
 
 
 
 
 
-def _user_from_apikey(request):
-    """
-    Authentication: header 'Authorization: ApiKey <key>'.
-    Returns user or None.
-    """
-    auth = request.headers.get("Authorization", "")
-    if not auth.startswith("ApiKey "):
-        return None
-    key = auth.split(None, 1)[1].strip()
-    try:
-        us = UserSettings.objects.select_related("user").get(api_key=key)
-        return us.user
-    except UserSettings.DoesNotExist:
-        return None
-
-
-@require_GET
-def active_notification(request):
+async def active_notification(request):
     """
     Return the next unseen notification for this user.
-    JSON shape used by the desktop client.
+    JSON shape used by the desktop client (served from active_cache).
+    Optional ?wait=N long-polls for up to N seconds (see _long_poll).
+    ETag / If-None-Match: 304 while the user's version is unchanged.
     """
-    user = _user_from_apikey(request)
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    user, body, tag = await sync_to_async(_active_poll)(request, "desktop")
     if not user:
         return HttpResponseForbidden("Invalid API key")
 
-    note = (
-        Notification.objects
-        .filter(user=user, seen=False)
-        .order_by("detected_at")
-        .first()
-    )
-    if not note:
-        return JsonResponse({"has": False})
-
-    # ring_count lives on your custom User in your project; default to 1 if missing
-    ring_count = getattr(user, "ring_count", 1)
-
-    return JsonResponse({
-        "has": True,
-        "id": note.id,
-        "source_name": getattr(note.source, "name", "App"),
-        "title": note.title or "",
-        "message": note.message or "",
-        "ring_count": int(min(5, max(0, ring_count))),  # hard-cap 0..5
-        "detected_at": note.detected_at.isoformat(),
-    })
+    body, tag = await _long_poll(request, user, "desktop", body, tag)
+    return _active_response(request, body, tag)
 
 @csrf_exempt
 @require_POST
 def mark_notifications_read(request):
     """
     Mark all unseen notifications as seen/played for the API user.
+    Optional JSON body {"upto_id": N} only acknowledges up to the id the
+    client actually showed. This moves the ack watermark; no rows are rewritten.
     """
-    user = _user_from_apikey(request)
+    user = user_from_request(request, allow_query=False)
     if not user:
         return HttpResponseForbidden("Invalid API key")
 
-    updated = (
-        Notification.objects
-        .filter(user=user, seen=False)
-        .update(seen=True, played=True, seen_at=timezone.now())
-    )
+    try:
+        body = json.loads(request.body.decode("utf-8") or "{}")
+    except Exception:
+        body = {}
+    try:
+        upto_id = int(body["upto_id"]) if body.get("upto_id") is not None else None
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("upto_id must be an integer")
+
+    updated = inbox.acknowledge_all(user, upto_id=upto_id, device=inbox.device_from_request(request))
     return JsonResponse({"ok": True, "updated": updated})
 
 
-@require_GET
+@require_safe
 def user_sound(request):
     """
-    Stream the user's current ringtone bytes.
-    Tries UserSettings.default_ringtone (FileField) first.
-    Falls back to latest NotificationSound for the user.
-    Returns empty body if nothing set.
+    GET/HEAD /api/sound/  (Authorization: ApiKey ...)
+    The user's ringtone: UserSettings.default_ringtone, else their newest
+    upload. Streamed, or handed to the front server's sendfile, with a
+    content-hash ETag; honours If-None-Match (304) and Range (206/416).
+    404 if there is nothing to play.
     """
-    user = _user_from_apikey(request)
+    user = user_from_request(request, allow_query=False)
     if not user:
         return HttpResponseForbidden("Invalid API key")
 
-    data = None
-    content_type = "application/octet-stream"
+    us = UserSettings.objects.select_related("default_ringtone").filter(user_id=user.pk).first()
+    ringtone = us.default_ringtone if us else None
+    if ringtone is None or not ringtone.file:
+        ringtone = CustomRingtone.objects.filter(user_id=user.pk).exclude(file="").order_by("-is_default", "-created_at").first()
+    if ringtone is None:
+        return HttpResponseNotFound("no ringtone")
 
     try:
-        us = UserSettings.objects.get(user=user)
-    except UserSettings.DoesNotExist:
-        us = None
-
-    # 1) Try FileField on settings, e.g., us.default_ringtone
-    fobj = getattr(us, "default_ringtone", None) if us else None
-    if hasattr(fobj, "open"):
-        try:
-            fobj.open("rb")
-            data = fobj.read()
-            fobj.close()
-        except Exception:
-            data = None
-
-    # 2) Try a stored path, e.g., us.default_ringtone_path
-    if data is None and us:
-        path = getattr(us, "default_ringtone_path", None)
-        if path:
-            try:
-                with open(path, "rb") as fh:
-                    data = fh.read()
-            except Exception:
-                data = None
-
-    # 3) Fallback to a NotificationSound record
-    if data is None:
-        try:
-            latest = (
-                NotificationSound.objects
-                .filter(user=user)
-                .order_by("-id")
-                .first()
-            )
-            if latest and hasattr(latest, "sound") and hasattr(latest.sound, "open"):
-                latest.sound.open("rb")
-                data = latest.sound.read()
-                latest.sound.close()
-        except Exception:
-            data = None
-
-    if not data:
-        return HttpResponse(b"", content_type=content_type)
-
-    # pygame handles mp3/wav fine even with generic content-type
-    return HttpResponse(data, content_type=content_type)
+        return ringtones.ringtone_response(request, ringtone)
+    except (FileNotFoundError, OSError):
+        return HttpResponseNotFound("no ringtone")
 
 
 
-def _api_user(request):
-    auth = request.headers.get("Authorization", "")
-    if auth.startswith("ApiKey "):
-        key = auth.split(None, 1)[1].strip()
-    else:
-        key = request.GET.get("key") or request.POST.get("key")
-    if not key:
-        return None
-    try:
-        us = UserSettings.objects.select_related("user").get(api_key=key)
-        return us.user
-    except UserSettings.DoesNotExist:
-        return None
-
 @csrf_exempt
 @require_POST
 def source_create_by_key(request):
@@ -620,7 +550,7 @@ def source_create_by_key(request):
       body: { "key": "...", "name": "Fiverr", "check_url": "https://example.com/inbox" }
     Returns: { ok: true, id: <source_id> }
     """
-    user = _api_user(request)
+    user = user_from_request(request)
     if not user:
         return HttpResponseForbidden("invalid key")
 
@@ -647,7 +577,7 @@ def source_import_cookies_by_key(request):
       body: { "key": "...", "source_id": 123, "cookies": {"sessionid": "...", "...": "..."} }
     Stores cookies into extra_config for that source.
     """
-    user = _api_user(request)
+    user = user_from_request(request)
     if not user:
         return HttpResponseForbidden("invalid key")
 
@@ -678,6 +608,172 @@ def source_import_cookies_by_key(request):
     return JsonResponse({"ok": True})
 
 
+BULK_SOURCES_MAX = int(getattr(settings, "BULK_SOURCES_MAX", 100))
+
+
+def _with_cookies(extra, cookies):
+    """extra_config with `cookies` stored the way source_import_cookies_by_key does."""
+    extra = dict(extra or {})
+    extra["cookies"] = {str(k): str(v) for k, v in cookies.items()}
+    headers = extra.get("headers") or {}
+    headers.setdefault("User-Agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64)")
+    extra["headers"] = headers
+    return extra
+
+
+@csrf_exempt
+@require_POST
+def source_bulk_by_key(request):
+    """
+    POST /api/source/bulk_key/
+      body: {"sources": [{"name": "...", "check_url": "...", "rendered": false,
+                          "cookies": {...}}, ...]}
+    Creates sources and imports their cookies in one call (link_source.py
+    --manifest). Sources are matched on check_url, so re-running a manifest
+    updates name/cookies/rendered instead of creating duplicates.
+    Returns {ok, sources: [{id, name, check_url, created}]} in input order.
+    """
+    user = user_from_request(request)
+    if not user:
+        return HttpResponseForbidden("invalid key")
+    try:
+        body = json.loads(request.body.decode("utf-8") or "{}")
+    except Exception:
+        return HttpResponseBadRequest("bad json")
+    items = body.get("sources")
+    if not isinstance(items, list) or not items:
+        return HttpResponseBadRequest("sources (list) required")
+    if len(items) > BULK_SOURCES_MAX:
+        return HttpResponseBadRequest(f"at most {BULK_SOURCES_MAX} sources per call")
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("name") or not item.get("check_url"):
+            return HttpResponseBadRequest(f"sources[{i}]: name and check_url required")
+        if not isinstance(item.get("cookies") or {}, dict):
+            return HttpResponseBadRequest(f"sources[{i}]: cookies must be an object")
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            src.check_url: src
+            for src in NotificationSource.objects.select_for_update()
+            .filter(user_id=user.pk, check_url__in={item["check_url"] for item in items})
+            .order_by("-pk")  # duplicates from older single links: update the oldest
+        }
+        to_create, to_update, out = [], {}, []
+        for item in items:
+            src = existing.get(item["check_url"])
+            created = src is None
+            if created:
+                src = NotificationSource(user_id=user.pk, check_url=item["check_url"], enabled=True, extra_config={})
+                existing[src.check_url] = src
+                to_create.append(src)
+            elif src.pk is not None:
+                to_update[src.pk] = src
+            src.name = str(item["name"])[:120]
+            src.updated_at = now
+            extra = src.extra_config or {}
+            if item.get("cookies"):
+                extra = _with_cookies(extra, item["cookies"])
+            if "rendered" in item:
+                extra = {**extra, "rendered": bool(item["rendered"])}
+            src.extra_config = extra
+            out.append((src, created))
+        NotificationSource.objects.bulk_create(to_create)
+        NotificationSource.objects.bulk_update(list(to_update.values()), ["name", "extra_config", "updated_at"])
+
+    return JsonResponse({"ok": True, "sources": [
+        {"id": src.pk, "name": src.name, "check_url": src.check_url, "created": created}
+        for src, created in out
+    ]})
+
+
+COOKIE_DELTA_MAX_BYTES = int(getattr(settings, "COOKIE_DELTA_MAX_BYTES", 1024 * 1024))
+
+
+def _root_domain(host):
+    """www.fiverr.com -> fiverr.com (same rule as link_source.root_domain)."""
+    parts = (host or "").lstrip(".").split(":", 1)[0].lower().split(".")
+    return ".".join(parts[1:]) if len(parts) > 2 else ".".join(parts)
+
+
+def _request_json(request, max_bytes):
+    """JSON body, inflated first if sent with Content-Encoding: gzip. Raises ValueError."""
+    raw = request.body
+    if request.headers.get("Content-Encoding", "").lower() == "gzip":
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        raw = inflater.decompress(raw, max_bytes)
+        if inflater.unconsumed_tail:
+            raise ValueError("body too large")
+    if len(raw) > max_bytes:
+        raise ValueError("body too large")
+    return json.loads(raw.decode("utf-8") or "{}")
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def source_cookies_delta_by_key(request):
+    """
+    Incremental cookie refresh (link_source.py --refresh).
+
+    GET  /api/source/cookies_delta_key/
+      -> {ok, domains: {"fiverr.com": "https://www.fiverr.com/inbox", ...}}
+         the root domains of the user's enabled sources (one URL each), so
+         the agent only ever reads and uploads cookies of those sites.
+    POST /api/source/cookies_delta_key/   (Content-Encoding: gzip accepted)
+      body: {"domains": {"fiverr.com": {"set": {"name": "value"}, "delete": ["name"]}}}
+      Merges each delta into extra_config["cookies"] of every source on that
+      domain; other cookies and other extra_config keys are left as they are.
+      -> {ok, updated: <sources changed>, domains: {...}}
+    """
+    user = user_from_request(request)
+    if not user:
+        return HttpResponseForbidden("invalid key")
+
+    by_domain, urls = {}, {}
+    for pk, url in (NotificationSource.objects.filter(user_id=user.pk, enabled=True)
+                    .order_by("pk").values_list("pk", "check_url")):
+        domain = _root_domain(urlparse(url).hostname)
+        if domain:
+            by_domain.setdefault(domain, []).append(pk)
+            urls.setdefault(domain, url)
+    if request.method == "GET":
+        return JsonResponse({"ok": True, "domains": urls})
+
+    try:
+        body = _request_json(request, COOKIE_DELTA_MAX_BYTES)
+    except zlib.error:
+        return HttpResponseBadRequest("bad gzip body")
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return HttpResponseBadRequest("bad json")
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    deltas = body.get("domains") if isinstance(body, dict) else None
+    if not isinstance(deltas, dict):
+        return HttpResponseBadRequest("domains (object) required")
+    for domain, delta in deltas.items():
+        if (not isinstance(delta, dict) or not isinstance(delta.get("set") or {}, dict)
+                or not isinstance(delta.get("delete") or [], list)):
+            return HttpResponseBadRequest(f"domains[{domain}]: set must be an object, delete a list")
+
+    wanted = {pk: deltas[d] for d in deltas if d in by_domain for pk in by_domain[d]}
+    changed = []
+    with transaction.atomic():
+        # locked re-read: merge into the cookies stored now, not a copy from earlier
+        for src in NotificationSource.objects.select_for_update().filter(pk__in=wanted).order_by("pk"):
+            delta = wanted[src.pk]
+            extra = src.extra_config or {}
+            cookies = dict(extra.get("cookies") or {})
+            cookies.update({str(k): str(v) for k, v in (delta.get("set") or {}).items()})
+            for name in delta.get("delete") or []:
+                cookies.pop(str(name), None)
+            if cookies != (extra.get("cookies") or {}):
+                src.extra_config = _with_cookies(extra, cookies)
+                changed.append(src)
+        NotificationSource.objects.bulk_update(changed, ["extra_config"])
+
+    return JsonResponse({"ok": True, "updated": len(changed), "domains": urls})
+
+
 
 
 @csrf_exempt
@@ -687,7 +783,7 @@ def settings_update_by_key(request):
     POST /api/settings/update_key/
       { "key":"...", "volume": 0..100, "play_loop": true|false }
     """
-    user = _api_user(request)
+    user = user_from_request(request)
     if not user:
         return HttpResponseForbidden("invalid key")
 
@@ -717,5 +813,322 @@ def settings_update_by_key(request):
 
     if changed:
         us.save(update_fields=changed + ["last_updated"])
+        inbox.settings_changed(user.pk)
+
+    return JsonResponse({"ok": True, "changed": changed})
+
+
+
+# ---------- sync: one round trip per client poll ----------
+
+SYNC_POLL_SECONDS = int(getattr(settings, "SYNC_POLL_SECONDS", 10))
+SYNC_BATCH_SIZE = 50
+
+
+def _parse_sync_cursor(raw):
+    """'<last notification id>.<user version>' -> (last_id, version); (0, None) if absent/garbled."""
+    try:
+        last_id, version = str(raw).split(".", 1)
+        return max(0, int(last_id)), int(version)
+    except (TypeError, ValueError):
+        return 0, None
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def client_sync(request):
+    """
+    GET|POST /api/sync/   (API key)
+    body: {"cursor": "...", "ack": {"upto_id": N} | {"ids": [1, 2], "played": true}}
+
+    Everything that changed since `cursor`, in one round trip:
+      notifications  unacknowledged, unplayed rows newer than the cursor (oldest first)
+      settings       settings incl. ringtone etag (null when nothing changed), plus counts
+      cursor         send it back next time; has_more; poll_after (seconds)
+    Acks ride along on the next sync instead of their own request. When the
+    user's version (versions.py) still matches the cursor the answer comes
+    from that one integer, without touching the notification tables.
+    """
+    user = user_from_request(request)
+    if not user:
+        return json_bad_request("invalid key", 401)
+
+    body = {}
+    if request.method == "POST" and request.body:
+        try:
+            body = json.loads(request.body.decode("utf-8"))
+        except Exception:
+            return json_bad_request("invalid JSON")
+    last_id, seen_version = _parse_sync_cursor(body.get("cursor") or request.GET.get("cursor"))
+    device = inbox.device_from_request(request)
+
+    ack = body.get("ack") if isinstance(body.get("ack"), dict) else {}
+    acked = 0
+    if ack.get("ids"):
+        acked = inbox.acknowledge(user, ack["ids"], played=bool(ack.get("played", True)), device=device)
+    elif ack.get("upto_id") is not None:
+        try:
+            upto_id = int(ack["upto_id"])
+        except (TypeError, ValueError):
+            return json_bad_request("ack.upto_id must be an integer")
+        acked = inbox.acknowledge_all(user, upto_id=upto_id, device=device)
+
+    version = versions.current(user)
+    data = {"ok": True, "acked": acked, "notifications": [], "settings": None, "has_more": False}
+    if version != seen_version:
+        rows = list(
+            inbox.pending(user, device)
+            .filter(pk__gt=last_id, played=False)
+            .order_by("pk")
+            .values(*NOTIFICATION_VALUES, **NOTIFICATION_VALUE_EXPRS)[:SYNC_BATCH_SIZE + 1]
+        )
+        data["has_more"] = len(rows) > SYNC_BATCH_SIZE
+        data["notifications"] = rows[:SYNC_BATCH_SIZE]
+        if data["notifications"]:
+            last_id = data["notifications"][-1]["id"]
+        data["settings"] = _settings_payload(request, user)
+        data["counts"] = inbox.counts(user.pk, by_source=True)
+        if data["has_more"]:
+            version = -1  # make the next call read the rest
+    data["cursor"] = f"{last_id}.{version}"
+    data["poll_after"] = 0 if data["has_more"] else SYNC_POLL_SECONDS
+    return JsonResponse(data)
 
-    return JsonResponse({"ok": True, "changed": changed})
\ No newline at end of file
+
+# ---------- edge checking (desktop client renders; see edge.py) ----------
+
+@csrf_exempt
+@require_GET
+def edge_assignments(request):
+    """
+    GET /api/edge/assignments/   (Authorization: ApiKey)
+    The rendered sources this client should check on its own browser
+    profile, with interval and render options. Leases them (edge.py).
+    """
+    user = user_from_request(request, allow_query=False)
+    if not user:
+        return json_bad_request("invalid key", 401)
+    return JsonResponse({"ok": True, **edge.assignments(user)})
+
+
+@csrf_exempt
+@require_POST
+def edge_results(request):
+    """
+    POST /api/edge/results/   (Authorization: ApiKey)
+    body: {"results": [{"source_id", "ok", "count", "detector", "text_hash",
+                        "keywords", "preview", "new_keys", "render_ms", ...}]}
+    One request per client round, whatever the number of sources.
+    """
+    user = user_from_request(request, allow_query=False)
+    if not user:
+        return json_bad_request("invalid key", 401)
+    try:
+        body = json.loads(request.body.decode("utf-8") or "{}")
+    except Exception:
+        return json_bad_request("invalid JSON")
+    results = body.get("results")
+    if not isinstance(results, list):
+        return json_bad_request("results must be a list")
+    return JsonResponse({"ok": True, "results": edge.ingest(user, results)})
+
+
+# ---------- metrics (Prometheus text format; see metrics.py) ----------
+
+@require_GET
+def metrics_export(request):
+    """
+    GET /metrics/   404 unless METRICS_ENABLED.
+    With METRICS_TOKEN set, needs "Authorization: Bearer <token>".
+    """
+    if not metrics.ENABLED:
+        return HttpResponse("not found", status=404, content_type="text/plain")
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden("metrics token required")
+    return HttpResponse(metrics.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ---------- push: Server-Sent Events (ASGI only) ----------
+
+SSE_HEARTBEAT_SECONDS = int(getattr(settings, "SSE_HEARTBEAT_SECONDS", 15))
+SSE_MAX_STREAM_SECONDS = int(getattr(settings, "SSE_MAX_STREAM_SECONDS", 300))
+
+
+def _stream_user(request):
+    """Session user, else API key (header or ?key=, since EventSource can't set headers)."""
+    if request.user.is_authenticated:
+        return request.user
+    return user_from_request(request)
+
+
+def _int_or_none(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backlog(user, last_id, device, limit=50):
+    rows = (
+        inbox.pending(user, device)
+        .filter(pk__gt=last_id, played=False)
+        .select_related("source")
+        .order_by("pk")[:limit]
+    )
+    return [push.notification_event(n) for n in rows]
+
+
+def _sse(data, event=None, event_id=None) -> str:
+    out = ""
+    if event_id is not None:
+        out += f"id: {event_id}\n"
+    if event:
+        out += f"event: {event}\n"
+    return out + f"data: {json.dumps(data)}\n\n"
+
+
+async def _sse_events(hub, queue, user, last_id, device):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SSE_MAX_STREAM_SECONDS
+    try:
+        yield "retry: 3000\n\n"
+        if last_id is not None:
+            for event in await sync_to_async(_backlog)(user, last_id, device):
+                last_id = max(last_id, event["id"])
+                yield _sse(event, "notification", event["id"])
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break  # recycle; the browser reconnects with Last-Event-ID
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=min(SSE_HEARTBEAT_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event.get("type") == "notification":
+                n = event.get("notification") or {}
+                if last_id is not None and n.get("id", 0) <= last_id:
+                    continue  # already sent from the backlog
+                yield _sse(n, "notification", n.get("id"))
+            else:
+                yield _sse({}, event.get("type") or "ack")
+    finally:
+        hub.detach(user.pk, queue)
+
+
+async def notification_stream(request):
+    """
+    GET /api/notifications/stream/   (text/event-stream)
+    Pushes new notifications the moment check_source commits them
+    (event "notification", id = notification id), "ack" events when the
+    inbox is acknowledged elsewhere and "settings" events when the settings
+    or default ringtone change. Comment heartbeats every
+    SSE_HEARTBEAT_SECONDS. Resumes from Last-Event-ID.
+    Answers 503 when push is unavailable (WSGI, Redis down) so clients
+    fall back to polling.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("push requires the ASGI server", status=503)
+
+    user = await sync_to_async(_stream_user)(request)
+    if not user:
+        return HttpResponseForbidden("login or API key required")
+
+    hub = push.hub()
+    queue = hub.attach(user.pk)
+    if not await hub.wait_connected(2.0):
+        hub.detach(user.pk, queue)
+        return HttpResponse("push unavailable", status=503)
+
+    last_id = _int_or_none(request.headers.get("Last-Event-ID") or request.GET.get("last_event_id"))
+    device = inbox.device_from_request(request)
+    response = StreamingHttpResponse(
+        _sse_events(hub, queue, user, last_id, device), content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"   # nginx: don't buffer the stream
+    return response
+
+
+
+# ---------- long-poll: ?wait= on the API-key active endpoints (ASGI only) ----------
+
+LONGPOLL_MAX_WAIT_SECONDS = int(getattr(settings, "LONGPOLL_MAX_WAIT_SECONDS", 30))
+
+
+@replica_reads
+def _active_poll(request, variant, user=None):
+    """
+    One active-notification read -> (user, json body, etag). Resolves the
+    API key on the first call; (None, None, None) if it is invalid.
+    """
+    if user is None:
+        # the desktop endpoint only takes the Authorization header
+        user = user_from_request(request, allow_query=(variant == "key"))
+        if not user:
+            return None, None, None
+    bind_user(request, user)
+    device = inbox.device_from_request(request)
+    tag = versions.etag(user, variant, device)
+    return user, active_cache.cached(user, variant, device), tag
+
+
+def _active_response(request, body, tag):
+    return versions.not_modified(request, tag) or versions.tagged(
+        HttpResponse(body, content_type="application/json"), tag,
+    )
+
+
+def _wait_seconds(request) -> float:
+    try:
+        wait = float(request.GET.get("wait") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, min(wait, LONGPOLL_MAX_WAIT_SECONDS))
+
+
+def _has(body) -> bool:
+    return bool(json.loads(body).get("has"))
+
+
+async def _long_poll(request, user, variant, body, tag):
+    """
+    Hold an answer that has nothing new for the client (still matching its
+    If-None-Match; without one: empty) open until the push hub sees an event
+    for this user or ?wait= runs out, then return the fresh (body, etag). The
+    hub listens on the same Redis signal inbox.record_created publishes
+    for the SSE stream. No wait, WSGI or an unavailable hub: answer now.
+    """
+    def idle(body, tag):
+        if request.headers.get("If-None-Match"):
+            return versions.not_modified(request, tag) is not None
+        return not _has(body)
+
+    wait = _wait_seconds(request)
+    if not wait or not isinstance(request, ASGIRequest) or not idle(body, tag):
+        return body, tag
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    hub = push.hub()
+    queue = hub.attach(user.pk)
+    try:
+        if not await hub.wait_connected(min(wait, 2.0)):
+            return body, tag
+        # re-read once subscribed so a change that raced the first read isn't missed
+        _, body, tag = await sync_to_async(_active_poll)(request, variant, user)
+        while idle(body, tag):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            _, body, tag = await sync_to_async(_active_poll)(request, variant, user)
+        return body, tag
+    finally:
+        hub.detach(user.pk, queue)
@@ -1,9 +1,15 @@
 # webnotify/views_api.py
 import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import HttpResponse
 from rest_framework import generics, permissions, pagination, status, throttling
+from rest_framework.exceptions import NotFound
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from django.utils import timezone
 from django.templatetags.static import static
@@ -12,10 +18,15 @@ from rest_framework.response import Response
 from rest_framework import permissions, status
 
 
+from . import active_cache, inbox, ringtones, versions
+from .db_router import ReplicaReadsMixin
 from .models import Notification, NotificationSource, UserSettings, CustomRingtone
 from .serializers import (
+    NOTIFICATION_VALUE_EXPRS,
+    NOTIFICATION_VALUES,
     NotificationSerializer,
     NotificationSourceSerializer,
+    notification_rows,
 )
 
 # ---------- throttling (protect endpoints) ----------
@@ -25,7 +36,7 @@ class UserSustained(throttling.UserRateThrottle):
     scope = "user_sustained"
 
 # ---------- notifications ----------
-class NotificationListAPI(generics.ListAPIView):
+class NotificationListAPI(ReplicaReadsMixin, generics.ListAPIView):
     """
     GET /api/notifications/?unplayed=true (optional) & page=1
     Lists recent notifications for the logged-in user.
@@ -36,33 +47,138 @@ class NotificationListAPI(generics.ListAPIView):
     throttle_classes = [UserBurst, UserSustained]
 
     def get_queryset(self):
-        qs = Notification.objects.filter(user=self.request.user).order_by("-detected_at")
+        qs = Notification.objects.filter(user=self.request.user).select_related("source").order_by("-detected_at")
         if self.request.query_params.get("unplayed") in ("1", "true", "True"):
-            qs = qs.filter(played=False)
+            qs = qs.filter(played=False, pk__gt=self._watermark())
         return qs
 
+    def _watermark(self):
+        if not hasattr(self, "_wm"):
+            self._wm = inbox.watermark(self.request.user.pk, inbox.device_from_request(self.request))
+        return self._wm
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), "watermark": self._watermark()}
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data["counts"] = inbox.counts(request.user.pk, by_source=True)
+        return response
+
 
-class NotificationActiveAPI(APIView):
+class NotificationCursorPagination(pagination.BasePagination):
+    """
+    Keyset pages of values() rows, newest first, on the (detected_at, id)
+    pair. DRF's CursorPagination seeks on detected_at alone and OFFSETs
+    through rows that share it. The cursor is the (detected_at, id) of the
+    row at the page edge, plus a direction: "n" seeks older rows, "p"
+    newer ones, for the previous link. Response: {next, previous, results}.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self._page_size(request)
+        position = self._decode(request.query_params.get(self.cursor_query_param))
+        if position is None:
+            backwards, rows = False, queryset.order_by("-detected_at", "-id")
+        else:
+            when, pk, backwards = position
+            if backwards:
+                rows = (queryset.filter(detected_at__gte=when)
+                        .filter(Q(detected_at__gt=when) | Q(id__gt=pk)).order_by("detected_at", "id"))
+            else:
+                # the plain range first, so the (user, -detected_at, -id) index bounds the scan
+                rows = (queryset.filter(detected_at__lte=when)
+                        .filter(Q(detected_at__lt=when) | Q(id__lt=pk)).order_by("-detected_at", "-id"))
+        rows = list(rows[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "previous": self.get_previous_link(), "results": data})
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], "n")
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._link(self.page[0], "p")
+
+    def _page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE or 20
+        return min(max(size, 1), self.max_page_size)
+
+    def _link(self, row, direction):
+        raw = f"{direction}|{row['detected_at'].isoformat()}|{row['id']}"
+        cursor = urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            direction, when, pk = raw.split("|")
+            if direction not in ("n", "p"):
+                raise ValueError(direction)
+            return datetime.fromisoformat(when), int(pk), direction == "p"
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+
+
+class NotificationCursorListAPI(NotificationListAPI):
+    """
+    GET /api/notifications/cursor/?cursor=...&unplayed=true (optional)
+    Same rows as NotificationListAPI, newest first, keyset-paginated on
+    (detected_at, id) (NotificationCursorPagination): no COUNT(*) and no
+    OFFSET, so page 500 costs what page 1 does.
+    Rows come straight from values() (source name joined in), not ModelSerializer.
+    """
+    pagination_class = NotificationCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        qs = self.get_queryset().values(*NOTIFICATION_VALUES, **NOTIFICATION_VALUE_EXPRS)
+        page = self.paginate_queryset(qs)
+        response = self.get_paginated_response(notification_rows(page, self._watermark()))
+        response.data["counts"] = inbox.counts(request.user.pk, by_source=True)
+        return response
+
+
+class NotificationActiveAPI(ReplicaReadsMixin, APIView):
     """
     GET /api/notifications/active/
     Returns latest UNPLAYED notification (does not mark it).
+    Served as pre-serialized JSON from active_cache; 304 on a matching If-None-Match.
     """
     permission_classes = [permissions.IsAuthenticated]
     throttle_classes = [UserBurst]
 
     def get(self, request):
-        notif = (
-            Notification.objects
-            .filter(user=request.user, played=False)
-            .order_by("-detected_at")
-            .first()
-        )
-        if not notif:
-            return Response({"has": False})
-        return Response({
-            "has": True,
-            **NotificationSerializer(notif).data
-        })
+        device = inbox.device_from_request(request)
+        tag = versions.etag(request.user, "api", device)
+        not_modified = versions.not_modified(request, tag)
+        if not_modified:
+            return not_modified
+        body = active_cache.cached(request.user, "api", device)
+        return versions.tagged(HttpResponse(body, content_type="application/json"), tag)
 
 
 class NotificationMarkReadAPI(APIView):
@@ -81,7 +197,7 @@ class NotificationMarkReadAPI(APIView):
             return Response({"ok": False, "error": "bad body"}, status=status.HTTP_400_BAD_REQUEST)
         if not ids:
             return Response({"ok": False, "error": "ids required"}, status=status.HTTP_400_BAD_REQUEST)
-        updated = Notification.objects.filter(user=request.user, pk__in=ids).update(seen=True, played=played)
+        updated = inbox.acknowledge(request.user, ids, played=played, device=inbox.device_from_request(request))
         return Response({"ok": True, "updated": updated})
 
 
@@ -89,19 +205,20 @@ class NotificationClearAllAPI(APIView):
     """
     POST /api/notifications/clear-all/
     Marks ALL as seen+played for this user (use carefully).
+    Moves the ack watermark, so it is a single-row write.
     """
     permission_classes = [permissions.IsAuthenticated]
     throttle_classes = [UserSustained]
 
     def post(self, request):
-        cnt = Notification.objects.filter(user=request.user).update(seen=True, played=True)
+        cnt = inbox.acknowledge(request.user)
         return Response({"ok": True, "updated": cnt})
 
 
 # ---------- sources ----------
-class SourceListCreateAPI(APIView):
+class SourceListCreateAPI(ReplicaReadsMixin, APIView):
     """
-    GET /api/sources/
+    GET /api/sources/   (replica reads)
     POST /api/sources/
     """
     permission_classes = [permissions.IsAuthenticated]
@@ -155,17 +272,19 @@ class UploadRingtoneAPI(APIView):
             return Response({"ok": False, "error": f"max {max_mb}MB"}, status=400)
 
         subpath = timezone.now().strftime("ringtones/%Y/%m/%d/")
-        saved_rel = default_storage.save(subpath + uploaded.name, ContentFile(uploaded.read()))
+        saved_rel, sha256 = ringtones.save_upload(uploaded, subpath + uploaded.name)
 
         # single default
         CustomRingtone.objects.filter(user=request.user, is_default=True).update(is_default=False)
         rt = CustomRingtone.objects.create(
-            user=request.user, name=uploaded.name, file=saved_rel, size_bytes=uploaded.size, is_default=True
+            user=request.user, name=uploaded.name, file=saved_rel, size_bytes=uploaded.size,
+            sha256=sha256, is_default=True,
         )
 
         us, _ = UserSettings.objects.get_or_create(user=request.user)
         us.default_ringtone = rt
         us.save(update_fields=["default_ringtone", "last_updated"])
+        inbox.settings_changed(request.user.pk)
 
         try:
             rel = rt.file.url
@@ -194,7 +313,7 @@ class NotificationDeleteAllAPI(APIView):
             cutoff = timezone.now() - timedelta(days=older_than_days)  # <-- fixed
             qs = qs.filter(detected_at__lt=cutoff)
 
-        deleted_count, _ = qs.delete()
+        deleted_count = inbox.delete(request.user, qs)
         return Response({"ok": True, "deleted": deleted_count}, status=status.HTTP_200_OK)
 
 
@@ -235,8 +354,14 @@ class UserSettingsAPI(APIView):
         volume = max(0, min(100, volume))
         play_loop = bool(sess.get("play_loop", True))
 
+        # the settings live in the session, so they are part of the tag
+        tag = versions.etag(request.user, "settings-api", volume, play_loop)
+        not_modified = versions.not_modified(request, tag)
+        if not_modified:
+            return not_modified
+
         url, name = self._get_default_ringtone_url_and_name(request)
-        return Response(
+        response = Response(
             {
                 "ok": True,
                 "settings": {
@@ -245,9 +370,11 @@ class UserSettingsAPI(APIView):
                     "default_ringtone_url": url,
                     "default_ringtone_name": name,
                 },
+                "counts": inbox.counts(request.user.pk),
             },
             status=status.HTTP_200_OK,
         )
+        return versions.tagged(response, tag)
 
     def post(self, request):
         data = request.data or {}
@@ -265,6 +392,7 @@ class UserSettingsAPI(APIView):
 
         request.session["notihub_settings"] = {"volume": volume, "play_loop": play_loop}
         request.session.modified = True
+        versions.bump(request.user.pk)
 
         url, name = self._get_default_ringtone_url_and_name(request)
         return Response(
@@ -276,6 +404,7 @@ class UserSettingsAPI(APIView):
                     "default_ringtone_url": url,
                     "default_ringtone_name": name,
                 },
+                "counts": inbox.counts(request.user.pk),
             },
             status=status.HTTP_200_OK,
         )
\ No newline at end of file
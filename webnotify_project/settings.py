@@ -39,15 +39,30 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'webnotify.db_router.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# X-DB-Queries / X-DB-Time on every response, for load tests (webnotify/querycount.py)
+QUERY_COUNT_HEADER = os.environ.get("QUERY_COUNT_HEADER", "False").lower() in ("1", "true", "yes")
+if QUERY_COUNT_HEADER:
+    MIDDLEWARE.insert(0, "webnotify.querycount.QueryCountMiddleware")
+
+# Prometheus metrics (webnotify/metrics.py) on GET /metrics/, summed across processes in Redis;
+# with METRICS_TOKEN set, scrapers must send "Authorization: Bearer <token>"
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "False").lower() in ("1", "true", "yes")
+METRICS_PUSH_SECONDS = float(os.environ.get("METRICS_PUSH_SECONDS", 10))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, "webnotify.metrics.MetricsMiddleware")
+
 
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
+        "webnotify.authentication.ApiKeyAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -95,6 +110,33 @@ DATABASES = {
     }
 }
 
+# Optional read replicas for the polling endpoints (webnotify/db_router.py).
+# DATABASE_REPLICA_URLS="postgres://ro1/db,postgres://ro2/db" -> aliases replica1, replica2
+DATABASE_REPLICAS = []
+for _i, _url in enumerate(u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()):
+    import dj_database_url
+    _alias = f"replica{_i + 1}"
+    DATABASES[_alias] = {**dj_database_url.parse(_url), "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ["webnotify.db_router.ReplicaRouter"]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+
+# Shared cache (primary pins, replica lag, ...). Use Redis in production so
+# every web worker sees the same values; local memory is fine for dev.
+WN_CACHE_URL = os.environ.get("WN_CACHE_URL", "")
+if WN_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": WN_CACHE_URL,
+            "KEY_PREFIX": "wn",
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -134,6 +176,10 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
+# /api/sound/ offload (webnotify/ringtones.py): "" (stream from Django), "nginx" (X-Accel-Redirect
+# to RINGTONE_SENDFILE_PREFIX, an internal location aliased to MEDIA_ROOT) or "apache" (X-Sendfile)
+RINGTONE_SENDFILE = os.environ.get("RINGTONE_SENDFILE", "")
+RINGTONE_SENDFILE_PREFIX = os.environ.get("RINGTONE_SENDFILE_PREFIX", "/protected-media/")
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -152,6 +198,23 @@ SIMPLE_JWT = {
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6380/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
 
+# Redis for push delivery (webnotify/push.py): pub/sub, not the cache
+WN_REDIS_URL = os.environ.get("WN_REDIS_URL", CELERY_BROKER_URL)
+SSE_HEARTBEAT_SECONDS = int(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+SSE_MAX_STREAM_SECONDS = int(os.environ.get("SSE_MAX_STREAM_SECONDS", 300))
+# ?wait=<seconds> on the API-key active endpoints is capped to this (keep below proxy timeouts)
+LONGPOLL_MAX_WAIT_SECONDS = int(os.environ.get("LONGPOLL_MAX_WAIT_SECONDS", 30))
+# poll_after suggested by /api/sync/ when there is nothing more to fetch
+SYNC_POLL_SECONDS = int(os.environ.get("SYNC_POLL_SECONDS", 10))
+# Edge checking (webnotify/edge.py): desktop clients render rendered sources themselves
+EDGE_CHECK_SECONDS = int(os.environ.get("EDGE_CHECK_SECONDS", 60))
+EDGE_LEASE_SECONDS = int(os.environ.get("EDGE_LEASE_SECONDS", 180))
+EDGE_MAX_RESULTS = int(os.environ.get("EDGE_MAX_RESULTS", 100))
+# sources per /api/source/bulk_key/ call (link_source.py --manifest)
+BULK_SOURCES_MAX = int(os.environ.get("BULK_SOURCES_MAX", 100))
+# inflated size cap for /api/source/cookies_delta_key/ bodies (link_source.py --refresh)
+COOKIE_DELTA_MAX_BYTES = int(os.environ.get("COOKIE_DELTA_MAX_BYTES", 1024 * 1024))
+
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
@@ -182,4 +245,46 @@ CELERY_BEAT_SCHEDULE = {
         "task": "webnotify.tasks.check_all_sources",
         "schedule": 60.0,  # seconds
     },
-}
\ No newline at end of file
+    "rollup-check-runs-every-10m": {
+        "task": "webnotify.tasks.rollup_check_runs",
+        "schedule": 600.0,
+    },
+    "measure-replica-lag-every-10s": {
+        "task": "webnotify.tasks.measure_replica_lag",
+        "schedule": 10.0,
+    },
+    "reconcile-counters-hourly": {
+        "task": "webnotify.tasks.reconcile_counters",
+        "schedule": crontab(minute=41),
+    },
+    "prune-check-runs-daily": {
+        "task": "webnotify.tasks.prune_check_runs",
+        "schedule": crontab(hour=3, minute=17),
+    },
+}
+
+# CheckRun time-series (webnotify/checkruns.py)
+CHECKRUN_BATCH_SIZE = int(os.environ.get("CHECKRUN_BATCH_SIZE", 50))
+CHECKRUN_FLUSH_SECONDS = float(os.environ.get("CHECKRUN_FLUSH_SECONDS", 30))
+CHECKRUN_RETENTION_DAYS = int(os.environ.get("CHECKRUN_RETENTION_DAYS", 7))
+CHECKRUN_HOURLY_RETENTION_DAYS = int(os.environ.get("CHECKRUN_HOURLY_RETENTION_DAYS", 90))
+
+# Slow / failed / surprising check snapshots (webnotify/captures.py), shown in the admin
+CAPTURE_ENABLED = os.environ.get("CAPTURE_ENABLED", "True").lower() in ("1", "true", "yes")
+CAPTURE_SLOW_MS = int(os.environ.get("CAPTURE_SLOW_MS", 15000))
+CAPTURE_COUNT_JUMP = int(os.environ.get("CAPTURE_COUNT_JUMP", 25))
+CAPTURE_COOLDOWN_SECONDS = int(os.environ.get("CAPTURE_COOLDOWN_SECONDS", 3600))
+CAPTURE_PER_SOURCE = int(os.environ.get("CAPTURE_PER_SOURCE", 5))
+CAPTURE_MAX_BYTES = int(os.environ.get("CAPTURE_MAX_BYTES", 64 * 1024 * 1024))
+CAPTURE_MAX_BODY_BYTES = int(os.environ.get("CAPTURE_MAX_BODY_BYTES", 5 * 1024 * 1024))
+
+# Cached active-notification payloads (webnotify/active_cache.py), seconds
+ACTIVE_CACHE_TTL = int(os.environ.get("ACTIVE_CACHE_TTL", 30))
+
+# API-key -> user resolution (webnotify/authentication.py): per-process LRU + shared cache, seconds
+APIKEY_LRU_SIZE = int(os.environ.get("APIKEY_LRU_SIZE", 1024))
+APIKEY_LOCAL_TTL = int(os.environ.get("APIKEY_LOCAL_TTL", 30))
+APIKEY_CACHE_TTL = int(os.environ.get("APIKEY_CACHE_TTL", 300))
+
+# Maintained unseen/unplayed counters (webnotify/inbox.py); totals are always kept
+NOTIFICATION_COUNTERS_PER_SOURCE = os.environ.get("NOTIFICATION_COUNTERS_PER_SOURCE", "True").lower() in ("1", "true", "yes")
\ No newline at end of file